@@ -30,6 +30,14 @@ def create_s3_client():
     )
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Tests write to S3 behind the service's back, so start each from cold.
+    dataCol.registered_users.clear()
+    dataCol.listing_index.clear()
+    dataCol.sports_news_cache.clear()
+
+
 @pytest.fixture
 def client():
     app.testing = True
@@ -213,14 +221,7 @@ def test_check_stock_unexpected_s3_error(client, monkeypatch):
         def head_object(self, *a, **k):
             raise ClientError({"Error": {"Code": "AccessDenied"}}, "HeadObject")
 
-    real_boto3_client = boto3.client
-
-    def mock_client(service, *a, **k):
-        if service == "s3":
-            return MockS3()
-        return real_boto3_client(service, *a, **k)
-
-    monkeypatch.setattr(dataCol.boto3, "client", mock_client)
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: MockS3())
 
     res = client.get(f"/check_stock?company=apple&name={REGISTERED_USER}")
     assert res.status_code == 500
@@ -0,0 +1,18 @@
+import os
+import pytest
+import sys
+
+# dataCol.py imports its sibling modules by name (it is run as a script in the
+# container), so src/ needs to be importable for the tests as well.
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+
+@pytest.fixture(autouse=True)
+def clear_upload_hashes():
+    # Hashes remembered from one test's fake bucket must not make another
+    # test's uploads look unchanged.
+    from src.dataCol import change_detector
+
+    change_detector.clear()
+    yield
+    change_detector.clear()
@@ -0,0 +1,62 @@
+"""Tracks how long a fresh process takes to import the data collection
+service, which is what a new container pays before it can serve traffic.
+
+Run directly for a report:  python dataCollection/Testing/importBenchmark.py
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+
+# Modules that must stay out of the import path (see lazyImport.py).
+HEAVY_MODULES = ("yfinance", "pandas", "nltk", "gnews")
+
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import dataCol
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "heavy_loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(runs=5):
+    """Imports dataCol in `runs` fresh interpreters and returns a dict with the
+    median and max import time and any heavy modules that got loaded."""
+    samples = []
+    heavy_loaded = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        heavy_loaded.update(result["heavy_loaded"])
+
+    return {
+        "median_seconds": statistics.median(samples),
+        "max_seconds": max(samples),
+        "heavy_loaded": sorted(heavy_loaded),
+    }
+
+
+if __name__ == "__main__":
+    report = measure_import()
+    print(
+        f"import dataCol: median {report['median_seconds'] * 1000:.0f} ms, "
+        f"max {report['max_seconds'] * 1000:.0f} ms"
+    )
+    if report["heavy_loaded"]:
+        print(f"heavy modules loaded eagerly: {', '.join(report['heavy_loaded'])}")
+        sys.exit(1)
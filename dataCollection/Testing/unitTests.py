@@ -1,3 +1,4 @@
+import json
 import pytest
 import pandas as pd
 import os
@@ -42,42 +43,42 @@ def test_search_ticker_cases():
 
 
 def test_write_to_client_s3_cases():
-    # Case 1: Valid file and bucket
-    with open("upload_test.csv", "w") as f:
-        f.write("header,value\nA,1")
-    assert write_to_client_s3("upload_test.csv", CLIENT_BUCKET_NAME1) is True
-    os.remove("upload_test.csv")
+    # Case 1: Valid body and bucket
+    assert (
+        write_to_client_s3("upload_test.csv", "header,value\nA,1", CLIENT_BUCKET_NAME1)
+        is True
+    )
 
-    # Case 2: Non-existent file
-    assert write_to_client_s3("missing.csv", CLIENT_BUCKET_NAME1) is False
+    # Case 2: Bytes body with a content type
+    assert (
+        write_to_client_s3(
+            "upload_test.csv", b"header,value\nA,1", CLIENT_BUCKET_NAME1, "text/csv"
+        )
+        is True
+    )
 
-    # Case 3: Empty file
-    with open("empty_upload.csv", "w") as f:
-        f.write("")
-    assert write_to_client_s3("empty_upload.csv", CLIENT_BUCKET_NAME1) is True
-    os.remove("empty_upload.csv")
+    # Case 3: Empty body
+    assert write_to_client_s3("empty_upload.csv", b"", CLIENT_BUCKET_NAME1) is True
 
     # Case 4: Invalid bucket
-    with open("bad_bucket.csv", "w") as f:
-        f.write("col1,col2\nval1,val2")
-    assert write_to_client_s3("bad_bucket.csv", "nonexistent-bucket-12345") is False
-    os.remove("bad_bucket.csv")
+    assert (
+        write_to_client_s3(
+            "bad_bucket.csv", "col1,col2\nval1,val2", "nonexistent-bucket-12345"
+        )
+        is False
+    )
 
-    # Case 5: Large file
-    with open("large_file.csv", "w") as f:
-        f.write("col\n")
-        for i in range(10000):
-            f.write(f"{i}\n")
-    assert write_to_client_s3("large_file.csv", CLIENT_BUCKET_NAME1) is True
-    os.remove("large_file.csv")
+    # Case 5: Large body
+    body = "col\n" + "".join(f"{i}\n" for i in range(10000))
+    assert write_to_client_s3("large_file.csv", body, CLIENT_BUCKET_NAME1) is True
 
 
 def test_get_stock_data_cases():
     # Valid ticker
     path, data = get_stock_data("AAPL", "apple", "user")
-    assert path and os.path.exists(path)
+    assert path and path.startswith("user#apple_stock_data")
     assert isinstance(data, list)
-    os.remove(path)
+    assert not os.path.exists(path)
 
     # Invalid ticker
     path, data = get_stock_data("INVALIDTICKER", "badco", "user")
@@ -435,3 +436,1285 @@ def test_upload_csv_to_s3_real():
     # Clean up after test
     s3.delete_object(Bucket=CLIENT_BUCKET_NAME2, Key=key)
     print("Cleaned up test file.")
+
+
+# -------------------- ASSUMED ROLE SESSION --------------------
+
+
+class FakeSTS:
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        self.calls += 1
+        return {
+            "Credentials": {
+                "AccessKeyId": f"key{self.calls}",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": datetime.now(timezone.utc)
+                + timedelta(seconds=self.lifetime),
+            }
+        }
+
+
+def test_assumed_role_session_caches_credentials_and_clients():
+    from roleSession import AssumedRoleSession
+
+    sts = FakeSTS(lifetime=3600)
+    built = []
+
+    def factory(service, **kwargs):
+        built.append(kwargs["aws_access_key_id"])
+        return object()
+
+    session = AssumedRoleSession(
+        CLIENT_ROLE_ARN, sts_client=sts, client_factory=factory, refresh_margin=600
+    )
+    first = session.client("s3")
+    for _ in range(10):
+        assert session.client("s3") is first
+
+    assert sts.calls == 1
+    assert built == ["key1"]
+
+
+def test_assumed_role_session_refreshes_near_expiry():
+    from roleSession import AssumedRoleSession
+
+    # Credentials that expire inside the refresh margin are never reused.
+    sts = FakeSTS(lifetime=60)
+    session = AssumedRoleSession(
+        CLIENT_ROLE_ARN,
+        sts_client=sts,
+        client_factory=lambda service, **kwargs: kwargs["aws_access_key_id"],
+        refresh_margin=600,
+    )
+    assert session.client("s3") == "key1"
+    assert session.client("s3") == "key2"
+    assert sts.calls == 2
+
+
+def test_assumed_role_session_background_refresh_survives_sts_outage():
+    from roleSession import AssumedRoleSession
+
+    class DownSTS:
+        def assume_role(self, RoleArn, RoleSessionName):
+            raise RuntimeError("Rate exceeded")
+
+    session = AssumedRoleSession(
+        CLIENT_ROLE_ARN,
+        sts_client=DownSTS(),
+        client_factory=lambda service, **kwargs: kwargs["aws_access_key_id"],
+    )
+    try:
+        # An outage at boot is logged, not raised, and the refresher keeps going.
+        session.start_background_refresh()
+        assert session._refresher.is_alive()
+        with pytest.raises(RuntimeError):
+            session.client("s3")
+
+        # Once STS is back, the next request recovers on its own.
+        session._sts_client = FakeSTS(lifetime=3600)
+        assert session.client("s3") == "key1"
+    finally:
+        session.stop_background_refresh()
+
+
+# -------------------- REGISTERED USER CACHE --------------------
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    from caches import TTLCache
+
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=1)
+    assert cache.get("a") == 1
+
+    now[0] = 5
+    assert cache.get("b") is None  # expired
+    cache.set("b", 2)
+    cache.set("c", 3)  # evicts "a", the least recently used
+    assert "a" not in cache
+    assert cache.get("b") == 2 and cache.get("c") == 3
+
+
+def test_is_registered_user_caches_hits_and_misses(monkeypatch):
+    import src.dataCol as dataCol
+    from botocore.exceptions import ClientError
+
+    class CountingS3:
+        def __init__(self):
+            self.heads = 0
+
+        def head_object(self, Bucket, Key):
+            self.heads += 1
+            if Key != "cached/profile.txt":
+                raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+            return {}
+
+    s3 = CountingS3()
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    dataCol.registered_users.clear()
+
+    for _ in range(3):
+        assert dataCol.is_registered_user("Cached") is True
+        assert dataCol.is_registered_user("missing") is False
+    assert s3.heads == 2
+
+    dataCol.registered_users.clear()
+
+
+# -------------------- TICKER RESOLUTION CACHE --------------------
+
+
+class FakeSearchSession:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.queries = []
+
+    def get(self, url, params, timeout):
+        self.queries.append(params["q"])
+        symbol = self.symbols.get(params["q"].strip().lower())
+        quotes = [{"isYahooFinance": True, "symbol": symbol}] if symbol else []
+
+        class Response:
+            status_code = 200
+
+            def json(self):
+                return {"quotes": quotes}
+
+        return Response()
+
+
+def test_ticker_resolver_persists_mappings(tmp_path):
+    from tickerCache import TickerResolver
+
+    db_path = str(tmp_path / "tickers.sqlite3")
+    session = FakeSearchSession({"apple": "AAPL", "cemex": "CEMEXCPO.MX"})
+    resolver = TickerResolver(db_path=db_path, session=session)
+
+    assert resolver.resolve("Apple") == "AAPL"
+    assert resolver.resolve(" apple ") == "AAPL"
+    assert resolver.resolve("cemex") == "CEMEXCPO"
+    assert resolver.resolve("nothing") is None
+    assert resolver.resolve("nothing") is None
+    assert session.queries == ["Apple", "cemex", "nothing"]
+
+    # A fresh resolver (e.g. after a restart) reads from the SQLite store.
+    restarted = FakeSearchSession({})
+    assert TickerResolver(db_path=db_path, session=restarted).resolve("apple") == "AAPL"
+    assert restarted.queries == []
+
+
+def test_ticker_resolver_resolve_many_deduplicates():
+    from tickerCache import TickerResolver
+
+    session = FakeSearchSession({"apple": "AAPL", "honda": "HMC"})
+    resolver = TickerResolver(session=session)
+
+    result = resolver.resolve_many(["Apple", "apple", "honda", "nothing"])
+    assert result == {"Apple": "AAPL", "apple": "AAPL", "honda": "HMC", "nothing": None}
+    assert sorted(q.lower() for q in session.queries) == ["apple", "honda", "nothing"]
+
+
+# -------------------- INCREMENTAL PRICE HISTORY --------------------
+
+
+def make_history(dates, close):
+    index = pd.DatetimeIndex(pd.to_datetime(dates), name="Date").tz_localize(
+        "America/New_York"
+    )
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close,
+            "Low": close,
+            "Close": close,
+            "Volume": [100] * len(dates),
+            "Dividends": [0.0] * len(dates),
+            "Stock Splits": [0.0] * len(dates),
+        },
+        index=index,
+    )
+
+
+class FakeHistoryTicker:
+    def __init__(self, full, delta):
+        self.full = full
+        self.delta = delta
+        self.calls = []
+
+    def history(self, period=None, start=None):
+        self.calls.append({"period": period, "start": start})
+        return self.delta if start else self.full
+
+
+def test_get_stock_data_only_fetches_and_uploads_new_days(tmp_path, monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (3, 2, 1)]
+    ticker = FakeHistoryTicker(
+        full=make_history(days[:2], [1.5, 2.25]),
+        delta=make_history(days[1:], [2.5, 3.125]),
+    )
+    s3 = InMemoryS3()
+    uploads = s3.puts
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "per_user")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol.yf, "Ticker", lambda _: ticker)
+
+    # First collection downloads the whole period.
+    path, data = dataCol.get_stock_data("FAKE", "fakeco", "user")
+    assert ticker.calls[-1] == {"period": "1mo", "start": None}
+    assert [row["Close"] for row in data] == [1.5, 2.25]
+    assert uploads == [path]
+
+    # The next one only asks for days from the last stored date onwards and
+    # refreshes that (possibly partial) last day.
+    path, data = dataCol.get_stock_data("FAKE", "fakeco", "user")
+    assert ticker.calls[-1] == {"period": None, "start": days[1]}
+    assert [row["Date"] for row in data] == days
+    assert [row["Close"] for row in data] == [1.5, 2.5, 3.125]
+    assert len(uploads) == 2
+
+    # Nothing new upstream means nothing new to upload.
+    dataCol.get_stock_data("FAKE", "fakeco", "user")
+    assert len(uploads) == 2
+
+    # Everything went straight to S3; nothing was left on local disk.
+    assert list(tmp_path.iterdir()) == []
+    stored = s3.objects[(CLIENT_BUCKET_NAME1, path)][0].decode("utf-8")
+    assert stored.splitlines()[0].startswith("Date,")
+
+
+# -------------------- SHARED PRICE STORE --------------------
+
+
+class InMemoryS3:
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+        self.heads = []
+        self.copies = []
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None):
+        body = Body.encode("utf-8") if isinstance(Body, str) else Body
+        self.objects[(Bucket, Key)] = (body, Metadata or {})
+        self.puts.append(Key)
+
+    def get_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, metadata = self.objects[(Bucket, Key)]
+
+        class Body:
+            def read(self):
+                return body
+
+        return {"Body": Body(), "Metadata": metadata}
+
+    def copy_object(
+        self, Bucket, Key, CopySource, Metadata, MetadataDirective, ContentType=None
+    ):
+        assert MetadataDirective == "REPLACE"
+        body, _ = self.objects[(CopySource["Bucket"], CopySource["Key"])]
+        self.objects[(Bucket, Key)] = (body, Metadata)
+        self.copies.append(Key)
+
+    def head_object(self, Bucket, Key):
+        import hashlib
+
+        self.heads.append(Key)
+        body = self.get_object(Bucket, Key)["Body"].read()
+        metadata = self.objects[(Bucket, Key)][1]
+        return {"ETag": f'"{hashlib.md5(body).hexdigest()}"', "Metadata": metadata}
+
+    def get_paginator(self, name):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix=""):
+                keys = sorted(k for b, k in objects if b == Bucket)
+                yield {"Contents": [{"Key": k} for k in keys if k.startswith(Prefix)]}
+
+        return Paginator()
+
+
+def test_shared_price_store_deduplicates_across_users(monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    ticker = FakeHistoryTicker(full=make_history(days, [1.0, 2.0]), delta=None)
+    s3 = InMemoryS3()
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "shared")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol.yf, "Ticker", lambda _: ticker)
+
+    for user in ("alice", "bob", "carol"):
+        path, data = dataCol.get_stock_data("HMC", "Honda", user)
+        assert path == f"{user}#honda_stock_data.json"
+        assert [row["Close"] for row in data] == [1.0, 2.0]
+
+    # One upstream download and one canonical object, however many users.
+    assert len(ticker.calls) == 1
+    assert s3.puts.count("prices/HMC.csv") == 1
+    manifest = json.loads(s3.objects[(CLIENT_BUCKET_NAME1, path)][0])
+    assert manifest["key"] == "prices/HMC.csv"
+
+    # A manifest deleted behind the service's back is put back next time.
+    del s3.objects[(CLIENT_BUCKET_NAME1, path)]
+    dataCol.get_stock_data("HMC", "Honda", "carol")
+    assert (CLIENT_BUCKET_NAME1, path) in s3.objects
+
+    # Legacy per-user CSVs are still recognised alongside manifests.
+    s3.put_object(CLIENT_BUCKET_NAME1, "alice#apple_stock_data.csv", "x")
+    dataCol.listing_index.clear()
+    assert get_stocks_for_news("alice") == ["apple", "honda"]
+
+
+def test_market_hours_freshness():
+    from marketHours import MarketHours
+
+    market = MarketHours()
+
+    def utc(text):
+        return datetime.fromisoformat(text).replace(tzinfo=timezone.utc)
+
+    # Tue 2025-04-01, New York is UTC-4: open 13:30, settled 20:30 UTC.
+    assert market.last_settle(utc("2025-04-01T20:29")) == utc("2025-03-31T20:30")
+    assert market.last_settle(utc("2025-04-01T20:30")) == utc("2025-04-01T20:30")
+    assert market.last_settle(utc("2025-04-07T12:00")) == utc("2025-04-04T20:30")
+    assert market.next_settle(utc("2025-04-04T21:00")) == utc("2025-04-07T20:30")
+    assert market.in_session(utc("2025-04-01T14:00"))
+    assert not market.in_session(utc("2025-04-01T21:00"))
+    assert not market.in_session(utc("2025-04-05T14:00"))
+
+    intraday = utc("2025-04-01T14:00")
+    assert market.is_fresh(intraday, utc("2025-04-01T14:10"), intraday_ttl=900)
+    assert not market.is_fresh(intraday, utc("2025-04-01T14:20"), intraday_ttl=900)
+    # A partial bar is never served past the settle time.
+    assert not market.is_fresh(utc("2025-04-01T20:20"), utc("2025-04-01T20:31"))
+    # A post-close fetch lasts overnight, until the next session opens.
+    after_close = utc("2025-04-01T20:35")
+    assert market.is_fresh(after_close, utc("2025-04-02T03:00"))
+    assert market.is_fresh(after_close, utc("2025-04-02T13:29"))
+    assert not market.is_fresh(after_close, utc("2025-04-02T13:45"))
+    assert not market.is_fresh(None, utc("2025-04-02T03:00"))
+
+
+def test_shared_price_store_refetches_partial_bars():
+    from priceStore import SharedPriceStore
+
+    days = ["2025-03-31", "2025-04-01"]
+    ticker = FakeHistoryTicker(
+        full=make_history(days, [1.0, 2.0]), delta=make_history(days[1:], [2.5])
+    )
+    s3 = InMemoryS3()
+    now = [datetime(2025, 4, 1, 14, 0, tzinfo=timezone.utc)]
+    store = SharedPriceStore(
+        CLIENT_BUCKET_NAME1,
+        get_client=lambda: s3,
+        ticker_factory=lambda _: ticker,
+        intraday_ttl=900,
+        clock=lambda: now[0],
+    )
+
+    # During the session a stored copy is reused only briefly.
+    store.get_history("HMC")
+    now[0] += timedelta(minutes=5)
+    store.get_history("HMC")
+    assert len(ticker.calls) == 1
+    now[0] += timedelta(minutes=15)
+    store.get_history("HMC")
+    assert len(ticker.calls) == 2
+
+    # Nothing fetched before the settle time is served after it.
+    now[0] = datetime(2025, 4, 1, 20, 45, tzinfo=timezone.utc)
+    store.get_history("HMC")
+    assert len(ticker.calls) == 3
+    _, fetched_at = store.load("HMC")
+    assert fetched_at == now[0]
+
+    # Objects from before fetch times were recorded count as stale.
+    body, _ = s3.objects[(CLIENT_BUCKET_NAME1, "prices/HMC.csv")]
+    s3.put_object(CLIENT_BUCKET_NAME1, "prices/HMC.csv", body, Metadata={})
+    store.get_history("HMC")
+    assert len(ticker.calls) == 4
+
+
+# -------------------- BATCH STOCK INFO --------------------
+
+
+def test_stock_info_batch_partial_failure(monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    frame = pd.concat(
+        {
+            "AAPL": make_history(days, [1.0, 2.0]),
+            "HMC": make_history(days, [3.0, float("nan")]),
+        },
+        axis=1,
+    )
+    downloads = []
+
+    def fake_download(tickers, **kwargs):
+        downloads.append(sorted(tickers))
+        return frame
+
+    s3 = InMemoryS3()
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "shared")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol, "is_registered_user", lambda name: True)
+    monkeypatch.setattr(
+        dataCol,
+        "resolve_tickers",
+        lambda names: {n: {"apple": "AAPL", "honda": "HMC"}.get(n) for n in names},
+    )
+    monkeypatch.setattr(dataCol.yf, "download", fake_download)
+
+    client = dataCol.app.test_client()
+    res = client.post(
+        "/stockInfo/batch?name=user",
+        json={"companies": ["Apple", "honda", "apple", "nowhere"]},
+    )
+    assert res.status_code == 200
+    body = res.get_json()
+    assert downloads == [["AAPL", "HMC"]]
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+
+    results = {r["company"]: r for r in body["results"]}
+    assert results["apple"]["file"] == "user#apple_stock_data.json"
+    assert [row["Close"] for row in results["honda"]["data"]] == [3.0]
+    assert results["nowhere"]["status"] == "error"
+
+    # A second batch the same day is served from the shared store.
+    client.post("/stockInfo/batch?name=user", json={"companies": ["apple"]})
+    assert len(downloads) == 1
+
+
+def test_stock_info_batch_requires_company_list():
+    import src.dataCol as dataCol
+
+    client = dataCol.app.test_client()
+    res = client.post("/stockInfo/batch?name=user", json={"companies": "apple"})
+    assert res.status_code == 400
+
+
+# -------------------- CONCURRENT NEWS --------------------
+
+
+@pytest.fixture
+def news_pipeline(monkeypatch):
+    import threading
+    import src.dataCol as dataCol
+
+    release = threading.Event()
+    uploads = []
+
+    def fake_fetch(company):
+        if company == "slow":
+            release.wait(5)
+        return pd.DataFrame([{"company_name": company}])
+
+    monkeypatch.setattr(dataCol, "is_registered_user", lambda name: True)
+    monkeypatch.setattr(
+        dataCol, "get_stocks_for_news", lambda name: ["apple", "slow", "tesla", "bad"]
+    )
+
+    def fake_latest(company, name):
+        if company == "bad":
+            raise Exception("boom")
+        if company == "tesla":
+            return datetime.now(timezone.utc)
+        return None
+
+    monkeypatch.setattr(dataCol, "get_latest_news_date_from_s3", fake_latest)
+    monkeypatch.setattr(dataCol, "fetch_company_news_df", fake_fetch)
+
+    def fake_upload(name, company, df):
+        uploads.append(company)
+        return True
+
+    monkeypatch.setattr(dataCol, "upload_csv_to_s3", fake_upload)
+    yield dataCol, release, uploads
+    release.set()
+
+
+def test_news_reports_each_company_and_times_out_slow_ones(news_pipeline, monkeypatch):
+    dataCol, release, uploads = news_pipeline
+    monkeypatch.setattr(dataCol, "NEWS_COMPANY_TIMEOUT", 0.5)
+
+    res = dataCol.app.test_client().get("/news?name=user")
+    assert res.status_code == 200
+    body = res.get_json()
+    statuses = {r["company"]: r["status"] for r in body["results"]}
+    assert statuses == {
+        "apple": "added",
+        "slow": "timeout",
+        "tesla": "up_to_date",
+        "bad": "error",
+    }
+    assert body["files_added"] == 1
+    assert uploads == ["apple"]
+
+
+def test_news_streams_results_as_ndjson(news_pipeline):
+    dataCol, release, uploads = news_pipeline
+    release.set()
+
+    res = dataCol.app.test_client().get("/news?name=user&stream=true")
+    assert res.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert sorted(line["company"] for line in lines[:-1]) == [
+        "apple",
+        "bad",
+        "slow",
+        "tesla",
+    ]
+    assert lines[-1] == {"status": "complete", "files_added": 2}
+
+
+# -------------------- LISTING INDEX --------------------
+
+
+def test_listing_index_uses_one_prefixed_listing_per_user(monkeypatch):
+    import src.dataCol as dataCol
+
+    s3 = InMemoryS3()
+    listings = []
+    paginator = s3.get_paginator
+
+    def counting_paginator(name):
+        inner = paginator(name)
+
+        class Counting:
+            def paginate(self, Bucket, Prefix=""):
+                listings.append((Bucket, Prefix))
+                return inner.paginate(Bucket=Bucket, Prefix=Prefix)
+
+        return Counting()
+
+    s3.get_paginator = counting_paginator
+    for key in (
+        "user#apple_stock_data.json",
+        "user#banana_stock_data.csv",
+        "username#cherry_stock_data.csv",
+        "other#apple_stock_data.csv",
+    ):
+        s3.put_object(CLIENT_BUCKET_NAME1, key, "x")
+    for key in (
+        "user_apple_2025-01-01_news.csv",
+        "user_apple_2025-03-01_news.csv",
+        "user_banana_2025-02-01_news.csv",
+        "user_banana_2025-13-45_news.csv",
+        # belongs to user "user_x", whose company "apple" would otherwise
+        # read as this user's company "x_apple"
+        "user_x_apple_2025-05-01_news.csv",
+    ):
+        s3.put_object(CLIENT_BUCKET_NAME2, key, "x")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    dataCol.listing_index.clear()
+
+    assert get_stocks_for_news("user") == ["apple", "banana"]
+    latest = {
+        company: dataCol.get_latest_news_date_from_s3(company, "user")
+        for company in ("apple", "banana", "cherry", "x_apple")
+    }
+    assert latest == {
+        "apple": datetime(2025, 3, 1, tzinfo=timezone.utc),
+        "banana": datetime(2025, 2, 1, tzinfo=timezone.utc),
+        "cherry": None,
+        "x_apple": None,
+    }
+    assert listings == [(CLIENT_BUCKET_NAME1, "user#"), (CLIENT_BUCKET_NAME2, "user_")]
+
+    # Uploads by this process are written through to the cached index.
+    dataCol.upload_csv_to_s3("user", "cherry", pd.DataFrame([{"a": 1}]), "2025-04-01")
+    assert dataCol.get_latest_news_date_from_s3("cherry", "user") == datetime(
+        2025, 4, 1, tzinfo=timezone.utc
+    )
+    assert len(listings) == 2
+    dataCol.listing_index.clear()
+
+
+def test_listing_index_updates_never_change_a_cached_dict():
+    from listingIndex import UserListingIndex
+
+    index = UserListingIndex("stocks", "news", get_client=InMemoryS3)
+    index._companies.set("user", {"apple": True})
+    index._news_dates.set("user", {"apple": "2025-03-01"})
+    companies = index._companies.get("user")
+    dates = index._news_dates.get("user")
+
+    # Another thread may be iterating the dicts handed out earlier.
+    index.record_stock_key("user#banana_stock_data.json")
+    index.record_news("user", "apple", "2025-04-01")
+    assert companies == {"apple": True}
+    assert dates == {"apple": "2025-03-01"}
+    assert index.companies("user") == ["apple", "banana"]
+    assert index.latest_news_dates("user") == {"apple": "2025-04-01"}
+
+
+# -------------------- SENTIMENT SCORING --------------------
+
+
+def test_sentiment_scorer_deduplicates_and_persists(tmp_path, monkeypatch):
+    from sentiment import SentimentScorer
+
+    db_path = str(tmp_path / "sentiment.sqlite3")
+    scorer = SentimentScorer(db_path=db_path)
+    scored = []
+    real_score = scorer.analyzer.polarity_scores
+
+    def counting_score(text):
+        scored.append(text)
+        return real_score(text)
+
+    monkeypatch.setattr(scorer.analyzer, "polarity_scores", counting_score)
+
+    texts = ["Great earnings beat!", "Terrible losses.", "Great earnings beat!"]
+    scores = scorer.score_many(texts)
+    assert scores[0] == scores[2] > 0 > scores[1]
+    assert scored == ["Great earnings beat!", "Terrible losses."]
+
+    assert scorer.score("Terrible losses.") == scores[1]
+    assert len(scored) == 2
+
+    # Scores survive a restart through the SQLite cache.
+    restarted = SentimentScorer(db_path=db_path)
+    assert restarted.score_many(texts) == scores
+    assert restarted._analyzer is None
+
+
+def test_sentiment_scorer_process_pool_matches_in_process():
+    from sentiment import SentimentScorer
+
+    texts = [f"Stock {i} is {'up' if i % 2 else 'down'} badly" for i in range(20)]
+    in_process = SentimentScorer().score_many(texts)
+    pooled = SentimentScorer(process_threshold=5, max_processes=2).score_many(texts)
+    assert pooled == in_process
+
+
+# -------------------- STARTUP COST --------------------
+
+
+def test_import_does_not_load_heavy_modules():
+    from importBenchmark import measure_import
+
+    report = measure_import(runs=1)
+    print(f"import dataCol took {report['median_seconds'] * 1000:.0f} ms")
+    assert report["heavy_loaded"] == []
+
+
+def test_lazy_module_forwards_attribute_writes():
+    from lazyImport import lazy_import
+
+    lazy_json = lazy_import("json")
+    original = json.dumps
+    try:
+        lazy_json.dumps = "patched"
+        assert json.dumps == "patched"
+    finally:
+        json.dumps = original
+    assert lazy_json.dumps is original
+
+
+# -------------------- SPORTS NEWS CACHE --------------------
+
+
+def test_refreshing_cache_coalesces_and_serves_stale():
+    import threading
+    import time
+    from caches import RefreshingCache
+
+    now = [0.0]
+    cache = RefreshingCache(ttl=10, stale_ttl=100, clock=lambda: now[0])
+    loads = []
+    gate = threading.Event()
+
+    def slow_loader(key):
+        loads.append(key)
+        gate.wait(5)
+        return f"{key}-{len(loads)}"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("nba", slow_loader)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == ["nba-1"] * 5
+    assert loads == ["nba"]
+
+    # Stale values are served immediately while one reload runs behind them.
+    now[0] = 50
+    assert cache.get("nba", slow_loader) == "nba-1"
+    for _ in range(50):
+        if cache.get("nba", slow_loader) == "nba-2":
+            break
+        time.sleep(0.01)
+    assert cache.get("nba", slow_loader) == "nba-2"
+    assert loads == ["nba", "nba"]
+
+    # Past the stale window the caller waits for a fresh value.
+    now[0] = 500
+    assert cache.get("nba", slow_loader) == "nba-3"
+
+    # Per-key locks only live while a load needs them.
+    assert cache._locks == {}
+
+
+def test_sports_news_route_caches_per_topic(monkeypatch):
+    import src.dataCol as dataCol
+
+    fetched = []
+
+    class FakeGNews:
+        def get_news(self, topic):
+            fetched.append(topic)
+            return [
+                {
+                    "title": f"{topic} story",
+                    "url": "http://example.com",
+                    "published date": datetime.now(timezone.utc),
+                }
+            ]
+
+    monkeypatch.setattr(dataCol, "get_gnews", lambda: FakeGNews())
+    dataCol.sports_news_cache.clear()
+    client = dataCol.app.test_client()
+
+    for _ in range(3):
+        assert client.get("/sportsNews").get_json()["article_count"] == 1
+    res = client.get("/sportsNews?topic=AFL")
+    assert res.get_json()["articles"][0]["title"] == "afl story"
+    assert fetched == ["nba", "afl"]
+
+    # Free-text topics would each cost a scrape, so they are refused.
+    res = client.get("/sportsNews?topic=anything+at+all")
+    assert res.status_code == 400
+    assert fetched == ["nba", "afl"]
+    dataCol.sports_news_cache.clear()
+
+
+# -------------------- END-OF-DAY PRICE PREFETCH --------------------
+
+
+def test_end_of_day_scheduler_next_run():
+    import pytz
+    from marketHours import MarketHours
+    from priceScheduler import EndOfDayScheduler
+
+    scheduler = EndOfDayScheduler(lambda: None, MarketHours(settled_after="16:30"))
+    new_york = pytz.timezone("America/New_York")
+
+    def at(*args):
+        return new_york.localize(datetime(*args))
+
+    # Before the close on a weekday: later the same day (EDT, UTC-4).
+    assert scheduler.next_run(at(2025, 3, 12, 9, 0)) == at(2025, 3, 12, 16, 30)
+    # After Friday's run: skips the weekend.
+    assert scheduler.next_run(at(2025, 3, 14, 16, 30)) == at(2025, 3, 17, 16, 30)
+    # Across the March daylight-saving change the local time is kept.
+    friday_est = scheduler.next_run(at(2025, 3, 7, 12, 0))
+    monday_edt = scheduler.next_run(at(2025, 3, 7, 17, 0))
+    assert (friday_est.hour, monday_edt.hour) == (21, 20)
+
+
+def test_tracked_from_keys():
+    from priceScheduler import tracked_from_keys
+
+    keys = [
+        "alice#apple_stock_data.csv",
+        "bob#apple_stock_data.json",
+        "bob#honda_stock_data.csv",
+        "prices/AAPL.csv",
+        "alice/profile.txt",
+        "#apple_stock_data.csv",
+        "carol#_stock_data.csv",
+    ]
+    assert tracked_from_keys(keys) == {"apple": {"alice", "bob"}, "honda": {"bob"}}
+
+
+def test_prefetch_tracked_prices_refreshes_each_ticker_once(monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    s3 = InMemoryS3()
+    for key in (
+        "alice#apple_stock_data.json",
+        "bob#apple_stock_data.json",
+        "bob#honda_stock_data.json",
+        "carol#nothing_stock_data.csv",
+        "prices/AAPL.csv",
+    ):
+        s3.put_object(CLIENT_BUCKET_NAME1, key, "")
+    s3.puts.clear()
+    tickers = {}
+
+    def fake_ticker(stock_ticker):
+        tickers[stock_ticker] = FakeHistoryTicker(
+            full=make_history(days, [1.0, 2.0]), delta=make_history(days[1:], [2.5])
+        )
+        return tickers[stock_ticker]
+
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "shared")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol.yf, "Ticker", fake_ticker)
+    monkeypatch.setattr(
+        dataCol,
+        "resolve_tickers",
+        lambda names: {n: {"apple": "AAPL", "honda": "HMC"}.get(n) for n in names},
+    )
+
+    summary = dataCol.prefetch_tracked_prices(max_workers=2)
+    assert summary == {"companies": 3, "tickers": 2, "failed": ["nothing"]}
+    assert sorted(s3.puts) == ["prices/AAPL.csv", "prices/HMC.csv"]
+    assert all(len(t.calls) == 1 for t in tickers.values())
+
+    # A later run refreshes again even though today's data is already stored.
+    dataCol.prefetch_tracked_prices()
+    assert s3.puts.count("prices/AAPL.csv") == 2
+
+
+def test_prefetched_prices_stay_fresh_past_utc_midnight(monkeypatch):
+    import src.dataCol as dataCol
+
+    days = ["2025-03-31", "2025-04-01"]
+    ticker = FakeHistoryTicker(
+        full=make_history(days, [1.0, 2.0]), delta=make_history(days[1:], [2.5])
+    )
+    s3 = InMemoryS3()
+    s3.put_object(CLIENT_BUCKET_NAME1, "alice#apple_stock_data.json", "{}")
+    # Tue 2025-04-01 16:30 in New York, when the scheduler runs.
+    now = [dataCol.price_scheduler.next_run(datetime(2025, 4, 1, tzinfo=timezone.utc))]
+    assert now[0] == datetime(2025, 4, 1, 20, 30, tzinfo=timezone.utc)
+
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "shared")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol.yf, "Ticker", lambda _: ticker)
+    monkeypatch.setattr(dataCol.price_store, "_clock", lambda: now[0])
+    monkeypatch.setattr(dataCol, "resolve_tickers", lambda names: {"apple": "AAPL"})
+
+    dataCol.prefetch_tracked_prices()
+    assert len(ticker.calls) == 1
+
+    # Past UTC midnight, the same evening in New York, users get the
+    # prefetched copy without going back to Yahoo.
+    for hour in (1, 5, 13):
+        now[0] = datetime(2025, 4, 2, hour, 0, tzinfo=timezone.utc)
+        path, data = dataCol.get_stock_data("AAPL", "apple", "bob")
+        assert data is not None
+    assert len(ticker.calls) == 1
+
+    # Once the next session is under way it is refreshed.
+    now[0] = datetime(2025, 4, 2, 14, 0, tzinfo=timezone.utc)
+    dataCol.get_stock_data("AAPL", "apple", "bob")
+    assert len(ticker.calls) == 2
+
+
+def test_prefetch_tracked_prices_per_user_layout(tmp_path, monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    s3 = InMemoryS3()
+    for key in ("alice#apple_stock_data.csv", "bob#apple_stock_data.csv"):
+        s3.put_object(CLIENT_BUCKET_NAME1, key, "")
+    collected = []
+
+    def fake_get_stock_data(stock_ticker, company, name):
+        collected.append((stock_ticker, company, name))
+        return f"{name}#{company}_stock_data.csv", [{"Date": days[-1]}]
+
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "per_user")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol, "get_stock_data", fake_get_stock_data)
+    monkeypatch.setattr(
+        dataCol, "resolve_tickers", lambda names: {n: "AAPL" for n in names}
+    )
+
+    summary = dataCol.prefetch_tracked_prices()
+    assert summary["failed"] == []
+    assert collected == [("AAPL", "apple", "alice"), ("AAPL", "apple", "bob")]
+
+
+# -------------------- PARQUET STORAGE --------------------
+
+
+def test_shared_price_store_parquet_round_trip():
+    pytest.importorskip("pyarrow")
+    from priceStore import SharedPriceStore, company_from_key
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    ticker = FakeHistoryTicker(
+        full=make_history(days, [29.950000762939453, 2.0]), delta=None
+    )
+    s3 = InMemoryS3()
+    store = SharedPriceStore(
+        CLIENT_BUCKET_NAME1,
+        get_client=lambda: s3,
+        ticker_factory=lambda _: ticker,
+        storage_format="parquet",
+    )
+
+    hist = store.get_history("HMC")
+    manifest_path = store.link("alice", "honda", "HMC")
+    body, metadata = s3.objects[(CLIENT_BUCKET_NAME1, "prices/HMC.parquet")]
+    assert body.startswith(b"PAR1")
+    manifest = json.loads(s3.objects[(CLIENT_BUCKET_NAME1, manifest_path)][0])
+    assert manifest["key"] == "prices/HMC.parquet"
+
+    # Typed columns come back exactly, and are not downloaded again today.
+    stored, fetched_on = store.load("HMC")
+    assert stored["Close"].tolist() == hist["Close"].tolist()
+    assert stored["Date"].tolist() == days
+    assert store.get_history("HMC")["Close"].tolist() == hist["Close"].tolist()
+    assert len(ticker.calls) == 1
+
+    # Parquet stock objects are recognised wherever stock keys are listed.
+    assert company_from_key("bob", "bob#apple_stock_data.parquet") == "apple"
+
+
+def test_upload_news_as_parquet(monkeypatch):
+    pytest.importorskip("pyarrow")
+    import io
+    import src.dataCol as dataCol
+
+    s3 = InMemoryS3()
+    monkeypatch.setattr(dataCol, "STORAGE_FORMAT", "parquet")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    df = pd.DataFrame(
+        {
+            "company_name": ["apple"],
+            "article_title": ["Apple news"],
+            "url": ["http://example.com"],
+            "published_at": ["2025-03-01T00:00:00+00:00"],
+            "sentiment_score": [0.5],
+        }
+    )
+
+    dataCol.upload_csv_to_s3("user", "apple", df, date_str="2025-03-01")
+    body, _ = s3.objects[(CLIENT_BUCKET_NAME2, "user_apple_2025-03-01_news.parquet")]
+    stored = pd.read_parquet(io.BytesIO(body), columns=["url", "sentiment_score"])
+    assert stored.to_dict(orient="records") == [
+        {"url": "http://example.com", "sentiment_score": 0.5}
+    ]
+
+    s3.put_object(CLIENT_BUCKET_NAME1, "user#apple_stock_data.json", "{}")
+    dataCol.listing_index.clear()
+    assert dataCol.get_latest_news_date_from_s3("apple", "user").day == 1
+
+
+# -------------------- SKIP UNCHANGED UPLOADS --------------------
+
+
+def test_change_detector_skips_identical_uploads():
+    import hashlib
+    from changeDetection import ChangeDetector
+
+    s3 = InMemoryS3()
+    detector = ChangeDetector(get_client=lambda: s3)
+
+    assert detector.put_if_changed("bucket", "a.csv", "x,y\n1,2\n") is True
+    assert detector.put_if_changed("bucket", "a.csv", b"x,y\n1,2\n") is False
+    assert detector.put_if_changed("bucket", "a.csv", "x,y\n1,3\n") is True
+    # Only the first upload had to look at the (missing) stored object.
+    assert s3.puts == ["a.csv", "a.csv"] and s3.heads == ["a.csv"]
+
+    # A fresh process checks the stored hash once, then remembers it.
+    restarted = ChangeDetector(get_client=lambda: s3)
+    assert restarted.put_if_changed("bucket", "a.csv", "x,y\n1,3\n") is False
+    assert restarted.put_if_changed("bucket", "a.csv", "x,y\n1,3\n") is False
+    assert s3.heads == ["a.csv", "a.csv"]
+
+    # Objects uploaded without the hash metadata are compared by ETag.
+    s3.objects[("bucket", "b.csv")] = (b"plain", {})
+    assert restarted.put_if_changed("bucket", "b.csv", "plain") is False
+
+    # A caller that knows what is stored saves the lookup.
+    assert detector.put_if_changed("bucket", "d.csv", "new", stored_hash=None)
+    md5 = hashlib.md5(b"new").hexdigest()
+    assert not detector.put_if_changed("bucket", "e.csv", "new", stored_hash=md5)
+    assert s3.heads == ["a.csv", "a.csv", "b.csv"]
+
+    # Only the body is compared; new metadata on an unchanged body is
+    # applied with a server-side copy instead of another upload.
+    assert detector.put_if_changed("bucket", "c.csv", "p", metadata={"d": "1"})
+    assert not detector.put_if_changed("bucket", "c.csv", "p", metadata={"d": "2"})
+    assert s3.puts.count("c.csv") == 1 and s3.copies == ["c.csv"]
+    assert s3.objects[("bucket", "c.csv")] == (
+        b"p",
+        {"d": "2", "content-md5": hashlib.md5(b"p").hexdigest()},
+    )
+
+
+def test_shared_price_store_skips_identical_saves():
+    from changeDetection import ChangeDetector
+    from priceStore import SharedPriceStore, format_history
+
+    s3 = InMemoryS3()
+    now = [datetime(2025, 4, 1, 21, 0, tzinfo=timezone.utc)]
+    store = SharedPriceStore(
+        CLIENT_BUCKET_NAME1,
+        get_client=lambda: s3,
+        ticker_factory=None,
+        put=ChangeDetector(get_client=lambda: s3).put_if_changed,
+        clock=lambda: now[0],
+    )
+    hist = format_history(make_history(["2025-03-31", "2025-04-01"], [1.0, 2.0]))
+
+    assert store.save("HMC", hist) is True
+    now[0] += timedelta(hours=1)
+    assert store.save("HMC", hist) is False
+    now[0] += timedelta(hours=1)
+    assert store.save("HMC", hist) is False
+
+    # The data went up once; later saves only moved the fetch time forward.
+    assert s3.puts == ["prices/HMC.csv"] and s3.heads == ["prices/HMC.csv"]
+    assert s3.copies == ["prices/HMC.csv"] * 2
+    assert store.load("HMC")[1] == now[0]
+
+
+def test_stock_info_reports_unchanged(monkeypatch):
+    import src.dataCol as dataCol
+
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    days = [(today - pd.Timedelta(days=n)).strftime("%Y-%m-%d") for n in (2, 1)]
+    ticker = FakeHistoryTicker(
+        full=make_history(days, [1.0, 2.0]), delta=make_history(days[1:], [2.0])
+    )
+    s3 = InMemoryS3()
+    monkeypatch.setattr(dataCol, "PRICE_STORE_LAYOUT", "per_user")
+    monkeypatch.setattr(dataCol, "get_client_s3", lambda: s3)
+    monkeypatch.setattr(dataCol, "is_registered_user", lambda name: True)
+    monkeypatch.setattr(dataCol, "search_ticker", lambda company: "FAKE")
+    monkeypatch.setattr(dataCol.yf, "Ticker", lambda _: ticker)
+    client = dataCol.app.test_client()
+
+    first = client.get("/stockInfo?company=fakeco&name=user").get_json()
+    second = client.get("/stockInfo?company=fakeco&name=user").get_json()
+    assert (first["unchanged"], second["unchanged"]) == (False, True)
+    assert first["data"] == second["data"]
+    assert s3.puts == ["user#fakeco_stock_data.csv"]
+    # The stored file had just been read, so it was never HEAD-checked.
+    assert s3.heads == []
+
+    # News keys are new every day, so they are uploaded without a check.
+    df = pd.DataFrame([{"company_name": "fakeco", "url": "http://example.com"}])
+    assert dataCol.upload_csv_to_s3("user", "fakeco", df, "2025-03-01") is True
+    assert s3.heads == []
+
+
+# -------------------- COLLECTION JOBS --------------------
+
+
+def test_job_queue_coalesces_and_survives_restart(tmp_path):
+    from jobQueue import JobFailed, JobQueue
+
+    runs = []
+
+    def collect(payload):
+        runs.append(payload["company"])
+        if payload["company"] == "bad":
+            raise JobFailed("no such company")
+        return {"company": payload["company"]}
+
+    db_path = str(tmp_path / "jobs.sqlite3")
+    now = [1000.0]
+    queue = JobQueue(db_path, {"stock_info": collect}, clock=lambda: now[0])
+
+    first, coalesced = queue.submit("stock_info", "user", "apple", {"company": "apple"})
+    again, coalesced_again = queue.submit(
+        "stock_info", "user", "apple", {"company": "apple"}
+    )
+    other, _ = queue.submit("stock_info", "other", "apple", {"company": "apple"})
+    bad, _ = queue.submit("stock_info", "user", "bad", {"company": "bad"})
+    assert (coalesced, coalesced_again, again) == (False, True, first)
+    assert other != first
+    assert queue.get(first)["status"] == "queued"
+
+    assert queue.run_next() == first
+    job = queue.get(first)
+    assert job["status"] == "succeeded" and job["result"] == {"company": "apple"}
+    assert job["finished_at"].startswith("1970-01-01T00:16:40")
+
+    # Once finished, the same request queues new work.
+    fresh, coalesced = queue.submit("stock_info", "user", "apple", {"company": "apple"})
+    assert fresh != first and coalesced is False
+
+    # Another process sharing the file leaves a job this one is running alone.
+    claimed_id, _, _, stale_token = queue._claim()
+    assert claimed_id == other
+    second = JobQueue(
+        db_path, {"stock_info": collect}, max_workers=0, clock=lambda: now[0]
+    )
+    second.start()
+    assert second.get(other)["status"] == "running"
+
+    # Once the owner's lease lapses (it died), the job is picked up again,
+    # and the old owner can no longer record a result for it.
+    now[0] += queue.lease + 1
+    while second.run_next():
+        pass
+    queue._finish(other, stale_token, "succeeded", result={"stale": True})
+    assert second.get(other)["result"] == {"company": "apple"}
+    failed = second.get(bad)
+    assert (failed["status"], failed["error"]) == ("failed", "no such company")
+    assert sorted(runs) == ["apple", "apple", "apple", "bad"]
+
+    # Finished jobs expire after the retention period.
+    now[0] += queue.retention + 1
+    queue.submit("stock_info", "user", "honda", {"company": "honda"})
+    assert queue.get(first) is None
+    assert queue.get("missing") is None
+
+
+def test_job_queue_lease_frees_hung_jobs(tmp_path):
+    from jobQueue import JobQueue
+
+    now = [0.0]
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(
+        db_path,
+        {"news": lambda payload: None},
+        lease=10,
+        timeout=30,
+        max_attempts=2,
+        clock=lambda: now[0],
+    )
+    job_id, _ = queue.submit("news", "user")
+    assert queue._claim()[0] == job_id
+
+    # While the owner renews its lease, the job stays in flight.
+    for renewed_at in (8, 28, 35):
+        now[0] = renewed_at
+        queue.renew_leases()
+    assert queue.submit("news", "user") == (job_id, True)
+    assert queue.get(job_id)["status"] == "running"
+
+    # Past `timeout` the lease is not renewed, so a hung job is retried...
+    now[0] = 40
+    assert queue.submit("news", "user") == (job_id, True)
+    assert queue.get(job_id)["status"] == "queued"
+
+    # ...and once out of attempts it fails, letting new submissions through.
+    other = JobQueue(db_path, {"news": lambda payload: None}, clock=lambda: now[0])
+    assert other._claim()[0] == job_id
+    now[0] += other.lease + 1
+    new_id, coalesced = queue.submit("news", "user")
+    assert (new_id != job_id, coalesced) == (True, False)
+    timed_out = queue.get(job_id)
+    assert (timed_out["status"], timed_out["error"]) == ("failed", "Job timed out")
+
+
+def test_job_queue_retry_in_the_same_process_owns_the_job(tmp_path):
+    from jobQueue import JobQueue
+
+    now = [0.0]
+    queue = JobQueue(
+        str(tmp_path / "jobs.sqlite3"),
+        {"news": lambda payload: None},
+        lease=10,
+        max_attempts=3,
+        clock=lambda: now[0],
+    )
+    job_id, _ = queue.submit("news", "user")
+    first = queue._claim()[3]
+
+    # Attempt 1 hangs past its lease and this same process starts attempt 2.
+    now[0] = 11
+    claimed_id, _, _, second = queue._claim()
+    assert claimed_id == job_id and second != first
+
+    # Attempt 1 finishing late neither records its result nor stops
+    # attempt 2's lease from being renewed.
+    queue._finish(job_id, first, "succeeded", result={"run": 0})
+    assert queue.get(job_id)["status"] == "running"
+    now[0] = 18
+    queue.renew_leases()
+    now[0] = 25
+    assert queue.submit("news", "user") == (job_id, True)
+
+    queue._finish(job_id, second, "succeeded", result={"run": 1})
+    assert queue.get(job_id)["result"] == {"run": 1}
+
+
+def test_stock_info_async_job(tmp_path, monkeypatch):
+    import threading
+    import time
+    import src.dataCol as dataCol
+    from jobQueue import JobQueue
+
+    release = threading.Event()
+    lookups = []
+
+    def fake_lookup(company_name, name):
+        lookups.append(company_name)
+        release.wait(5)
+        if company_name == "nothing":
+            return {"error": "Could not find a stock ticker for 'nothing'."}, 404
+        return {"message": "Stock data retrieved successfully", "ticker": "AAPL"}, 200
+
+    queue = JobQueue(
+        str(tmp_path / "jobs.sqlite3"),
+        {"stock_info": dataCol.run_stock_info_job, "news": dataCol.run_news_job},
+        max_workers=2,
+    )
+    monkeypatch.setattr(dataCol, "job_queue", queue)
+    monkeypatch.setattr(dataCol, "lookup_stock_info", fake_lookup)
+    monkeypatch.setattr(dataCol, "is_registered_user", lambda name: True)
+    client = dataCol.app.test_client()
+
+    try:
+        res = client.get("/stockInfo?company=Apple&name=User&async=true")
+        assert res.status_code == 202
+        job = res.get_json()
+        assert res.headers["Location"] == job["status_url"] == f"/jobs/{job['job_id']}"
+
+        # A retry while the first is still in flight joins it.
+        retry = client.get("/stockInfo?company=apple&name=user&async=1").get_json()
+        assert (retry["job_id"], retry["coalesced"]) == (job["job_id"], True)
+        missing = client.get("/stockInfo?company=nothing&name=user&async=1")
+        release.set()
+
+        def wait_for(job_id):
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                body = client.get(f"/jobs/{job_id}").get_json()
+                if body["status"] not in ("queued", "running"):
+                    return body
+                time.sleep(0.01)
+            raise AssertionError(f"job {job_id} did not finish")
+
+        done = wait_for(job["job_id"])
+        assert done["status"] == "succeeded"
+        assert (done["name"], done["company"]) == ("user", "apple")
+        assert done["result"]["ticker"] == "AAPL"
+        failed = wait_for(missing.get_json()["job_id"])
+        assert failed["status"] == "failed" and "nothing" in failed["error"]
+        assert sorted(lookups) == ["apple", "nothing"]
+
+        assert client.get("/jobs/unknown").status_code == 404
+    finally:
+        release.set()
+        queue.stop()
@@ -0,0 +1,195 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a time-to-live.
+
+    `ttl` is the default lifetime of an entry in seconds (None means entries
+    only leave through LRU eviction); individual entries may override it.
+    Once `maxsize` entries are held the least recently used one is evicted."""
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SqliteStore:
+    """A small persistent key/value table in a SQLite file, used to keep
+    caches warm across restarts. The file is opened on first use and shared
+    between threads behind a lock."""
+
+    def __init__(self, db_path, table):
+        self.db_path = db_path
+        self.table = table
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            db = self._connect()
+            # Stay well under SQLite's limit on bound parameters.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    db.execute(
+                        f"SELECT key, value FROM {self.table} "
+                        f"WHERE key IN ({placeholders})",
+                        chunk,
+                    ).fetchall()
+                )
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?)",
+                list(items.items()),
+            )
+            db.commit()
+
+
+class RefreshingCache:
+    """Caches the result of an expensive loader per key.
+
+    Within `ttl` seconds of loading, the cached value is served as is. For
+    a further `stale_ttl` seconds the stale value is still served while one
+    background thread reloads it (stale-while-revalidate). After that, or
+    on a miss, callers load synchronously - and concurrent callers for the
+    same key wait for a single load instead of each calling the loader."""
+
+    def __init__(self, ttl, stale_ttl=0, maxsize=128, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries = TTLCache(maxsize=maxsize)
+        # {key: (lock, number of callers holding or waiting for it)}; a lock
+        # is dropped once nobody needs it, never while a load holds it.
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._refreshing = set()
+
+    @contextmanager
+    def _locked(self, key):
+        with self._locks_lock:
+            lock, users = self._locks.get(key, (None, 0))
+            self._locks[key] = (lock or threading.Lock(), users + 1)
+            lock = self._locks[key][0]
+        try:
+            with lock:
+                yield
+        finally:
+            with self._locks_lock:
+                users = self._locks[key][1] - 1
+                if users:
+                    self._locks[key] = (lock, users)
+                else:
+                    del self._locks[key]
+
+    def _age(self, entry):
+        return self._clock() - entry[1]
+
+    def _load(self, key, loader):
+        with self._locked(key):
+            # Someone else may have loaded it while we waited for the lock.
+            entry = self._entries.get(key)
+            if entry is not None and self._age(entry) < self.ttl:
+                return entry[0]
+            value = loader(key)
+            self._entries.set(key, (value, self._clock()))
+            return value
+
+    def _refresh(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            print(f"Error refreshing cached {key!r}: {e}")
+        finally:
+            with self._locks_lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self._age(entry)
+            if age < self.ttl:
+                return entry[0]
+            if age < self.ttl + self.stale_ttl:
+                with self._locks_lock:
+                    start = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start:
+                    threading.Thread(
+                        target=self._refresh, args=(key, loader), daemon=True
+                    ).start()
+                return entry[0]
+        return self._load(key, loader)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,101 @@
+import hashlib
+
+from botocore.exceptions import ClientError
+
+from caches import TTLCache
+
+
+# Object metadata holding the MD5 of the body as uploaded. The ETag is the
+# same value for plain single-part PUTs, but not for multipart or KMS
+# encrypted objects, so the metadata is checked first.
+HASH_METADATA_KEY = "content-md5"
+KNOWN_HASH_TTL = 60 * 60
+# Default `stored_hash` for put_if_changed: the caller doesn't know what is
+# stored, so it has to be looked up.
+UNKNOWN_HASH = object()
+
+
+def content_md5(body):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.md5(body).hexdigest()
+
+
+class ChangeDetector:
+    """Skips S3 PUTs whose body is byte-identical to the object already stored.
+
+    The hash of every object this process writes or checks is remembered for
+    `ttl` seconds, so a repeated upload of the same content costs neither a
+    PUT nor a HEAD. Otherwise the stored object's hash is read with one HEAD
+    (from its metadata, or its ETag for plain uploads). The TTL bounds how
+    long a write made by another instance can go unnoticed."""
+
+    def __init__(self, get_client, ttl=KNOWN_HASH_TTL, maxsize=10000):
+        self._get_client = get_client
+        self._known = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def stored_hash(self, bucket, key):
+        """The MD5 of the stored object's body, or None if there is no object
+        or its hash cannot be told from its metadata or ETag."""
+        try:
+            head = self._get_client().head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        md5 = head.get("Metadata", {}).get(HASH_METADATA_KEY)
+        if md5:
+            return md5
+        etag = head.get("ETag", "").strip('"')
+        # multipart ETags look like "<hash>-<parts>" and are not body MD5s
+        return etag if etag and "-" not in etag else None
+
+    def put_if_changed(
+        self,
+        bucket,
+        key,
+        body,
+        content_type=None,
+        metadata=None,
+        stored_hash=UNKNOWN_HASH,
+    ):
+        """Uploads `body` (with `metadata`) unless the stored object already has
+        exactly this body. Returns True if it was written, False if it was
+        unchanged. Only the body is compared: if it is unchanged but
+        `metadata` is given (e.g. a fetch timestamp), the stored object's
+        metadata is replaced with a server-side copy instead of uploading the
+        data again. A caller that already knows what is stored passes its hash
+        as `stored_hash` (None if there is no object, e.g. for keys that are
+        new every day), which saves looking it up."""
+        md5 = content_md5(body)
+        known = stored_hash
+        if known is UNKNOWN_HASH:
+            known = self._known.get((bucket, key))
+            if known is None:
+                known = self.stored_hash(bucket, key)
+
+        extra = {"ContentType": content_type} if content_type else {}
+        metadata = {**(metadata or {}), HASH_METADATA_KEY: md5}
+        client = self._get_client()
+        if known == md5:
+            if len(metadata) > 1:
+                client.copy_object(
+                    Bucket=bucket,
+                    Key=key,
+                    CopySource={"Bucket": bucket, "Key": key},
+                    Metadata=metadata,
+                    MetadataDirective="REPLACE",
+                    **extra,
+                )
+            self._known.set((bucket, key), md5)
+            return False
+
+        client.put_object(Bucket=bucket, Key=key, Body=body, Metadata=metadata, **extra)
+        self._known.set((bucket, key), md5)
+        return True
+
+    def forget(self, bucket, key):
+        self._known.pop((bucket, key))
+
+    def clear(self):
+        self._known.clear()
@@ -1,18 +1,46 @@
-from flask import Flask, jsonify, request
-import yfinance as yf
-import pandas as pd
-import requests
-import boto3
+from flask import Flask, Response, jsonify, request, stream_with_context
 from botocore.exceptions import ClientError
-import re
 from datetime import datetime, timedelta, timezone
-import io
 from dateutil import parser
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from flask_cors import CORS
-from gnews import GNews
 import pytz
-
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import threading
+import time
+
+from caches import RefreshingCache, TTLCache
+from changeDetection import KNOWN_HASH_TTL, UNKNOWN_HASH, ChangeDetector, content_md5
+from lazyImport import ensure_loaded, lazy_import
+from jobQueue import JOB_RETENTION, JOB_TIMEOUT, JobFailed, JobQueue
+from listingIndex import LISTING_CACHE_TTL, UserListingIndex
+from marketHours import INTRADAY_TTL, MARKET_TIMEZONE, SETTLED_AFTER, MarketHours
+from priceStore import (
+    SharedPriceStore,
+    fetch_history,
+    legacy_key,
+    manifest_key,
+    parse_history,
+    split_download,
+)
+from priceScheduler import EndOfDayScheduler, tracked_from_keys
+from roleSession import AssumedRoleSession
+from sentiment import SentimentScorer
+from storageFormat import (
+    check_format,
+    content_type,
+    encode_frame,
+    extension,
+    format_of_key,
+)
+from tickerCache import TickerResolver
+
+# yfinance, pandas, nltk and gnews take most of a second to import, so they
+# are loaded on first use (or by warm_up) rather than at import time.
+yf = lazy_import("yfinance")
+pd = lazy_import("pandas")
 
 SYDNEY_TZ = pytz.timezone("Australia/Sydney")
 
@@ -25,7 +53,38 @@ CLIENT_BUCKET_NAME2 = "seng3011-omega-news-data"
 CLIENT_BUCKET_NAME3 = "seng3011-collection-usernames"
 ONE_MONTH_AGO = datetime.now(timezone.utc) - timedelta(days=30)
 TODAY_STR = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-sia = SentimentIntensityAnalyzer()
+sentiment_scorer = SentimentScorer(
+    db_path=os.environ.get(
+        "SENTIMENT_CACHE_PATH",
+        os.path.join(tempfile.gettempdir(), "omega_sentiment_cache.sqlite3"),
+    )
+)
+
+# One assumed-role session for the whole process; the credentials are cached
+# and refreshed ahead of expiry instead of calling STS on every request.
+client_role_session = AssumedRoleSession(CLIENT_ROLE_ARN, region_name="ap-southeast-2")
+
+
+def get_client_s3():
+    return client_role_session.client("s3")
+
+
+# Prefix-scoped listings of each user's stock and news objects, so /news no
+# longer scans whole buckets.
+listing_index = UserListingIndex(
+    CLIENT_BUCKET_NAME1,
+    CLIENT_BUCKET_NAME2,
+    get_client=lambda: get_client_s3(),
+    ttl=float(os.environ.get("LISTING_CACHE_TTL", LISTING_CACHE_TTL)),
+)
+
+
+# Membership cache for is_registered_user. Unknown usernames are cached too,
+# but only briefly so a user registered through another instance shows up soon.
+REGISTERED_USER_TTL = 15 * 60
+UNREGISTERED_USER_TTL = 60
+registered_users = TTLCache(maxsize=10000, ttl=REGISTERED_USER_TTL)
+
 
 # removed the current user stuff
 
@@ -43,17 +102,7 @@ def register_user():
     username = username.strip().lower()
     profile_key = f"{username}/profile.txt"
 
-    sts_client = boto3.client("sts")
-    assumed_role_object = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    credentials = assumed_role_object["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=credentials["AccessKeyId"],
-        aws_secret_access_key=credentials["SecretAccessKey"],
-        aws_session_token=credentials["SessionToken"],
-    )
+    s3 = get_client_s3()
 
     try:
         s3.head_object(Bucket=CLIENT_BUCKET_NAME3, Key=profile_key)
@@ -66,12 +115,14 @@ def register_user():
                 Body=f"User: {username}\nCreated at: {datetime.now(timezone.utc).isoformat()}",
                 ContentType="text/plain",
             )
+            registered_users.set(username, True)
             return jsonify(
                 {"message": f"User '{username}' registered successfully in S3."}
             ), 201
         else:
             return jsonify({"error": f"S3 access error: {str(e)}"}), 500
     except UserAlreadyExists as ue:
+        registered_users.set(username, True)
         return jsonify({"error": str(ue)}), 409
 
 
@@ -79,24 +130,20 @@ def is_registered_user(username):
     username = username.strip().lower()
     profile_key = f"{username}/profile.txt"
 
-    sts_client = boto3.client("sts")
-    assumed_role_object = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    credentials = assumed_role_object["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=credentials["AccessKeyId"],
-        aws_secret_access_key=credentials["SecretAccessKey"],
-        aws_session_token=credentials["SessionToken"],
-    )
+    cached = registered_users.get(username)
+    if cached is not None:
+        return cached
+
+    s3 = get_client_s3()
 
     try:
         s3.head_object(Bucket=CLIENT_BUCKET_NAME3, Key=profile_key)
+        registered_users.set(username, True)
         return True
     except ClientError as e:
         code = e.response["Error"]["Code"]
         if code == "404":
+            registered_users.set(username, False, ttl=UNREGISTERED_USER_TTL)
             return False
         elif code == "AccessDenied":
             # Optional: log or handle this separately
@@ -104,61 +151,171 @@ def is_registered_user(username):
         raise e
 
 
-def write_to_client_s3(filename, bucketname):
-    sts_client = boto3.client("sts")
-    assumed_role_object = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    credentials = assumed_role_object["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=credentials["AccessKeyId"],
-        aws_secret_access_key=credentials["SecretAccessKey"],
-        aws_session_token=credentials["SessionToken"],
+def warm_registered_users():
+    """Fills the membership cache from a single listing of every
+    `<user>/profile.txt` object, returning how many users were found."""
+    s3 = get_client_s3()
+    paginator = s3.get_paginator("list_objects_v2")
+
+    count = 0
+    for page in paginator.paginate(Bucket=CLIENT_BUCKET_NAME3):
+        for obj in page.get("Contents", []):
+            username, _, rest = obj["Key"].partition("/")
+            if username and rest == "profile.txt":
+                registered_users.set(username, True)
+                count += 1
+    return count
+
+
+# Remembers the hash of everything uploaded so that re-uploading identical
+# content (repeated requests, weekends, holidays) is skipped.
+change_detector = ChangeDetector(
+    get_client=lambda: get_client_s3(),
+    ttl=float(os.environ.get("UPLOAD_HASH_TTL", KNOWN_HASH_TTL)),
+)
+
+
+def put_client_object(
+    bucketname, key, body, content_type=None, stored_hash=UNKNOWN_HASH
+):
+    """Uploads `body` (bytes or str) straight from memory; nothing is written
+    to local disk on the way. Returns False, without uploading, if the stored
+    object already has exactly this content. See ChangeDetector.put_if_changed
+    for `stored_hash`."""
+    written = change_detector.put_if_changed(
+        bucketname, key, body, content_type, stored_hash=stored_hash
     )
+    if bucketname == CLIENT_BUCKET_NAME1:
+        listing_index.record_stock_key(key)
+    return written
+
+
+def write_to_client_s3(key, body, bucketname, content_type=None):
     try:
-        s3.upload_file(filename, bucketname, filename)
+        put_client_object(bucketname, key, body, content_type)
         return True
     except Exception as e:
         print(f"Error writing to S3: {e}")
         return False
 
 
+ticker_resolver = TickerResolver(
+    db_path=os.environ.get(
+        "TICKER_CACHE_PATH",
+        os.path.join(tempfile.gettempdir(), "omega_ticker_cache.sqlite3"),
+    )
+)
+
+
+# "shared" keeps one canonical price file per ticker plus a manifest per user;
+# "per_user" writes a full private CSV for every (user, company) pair.
+PRICE_STORE_LAYOUT = os.environ.get("PRICE_STORE_LAYOUT", "shared")
+# "csv" or "parquet" (needs pyarrow) for the price and news objects written
+# from now on; objects already stored in the other format stay readable.
+STORAGE_FORMAT = check_format(os.environ.get("STORAGE_FORMAT", "csv"))
+# The end-of-day prefetch runs when the day's bars settle, which is also when
+# stored prices stop counting as fresh, so both go by the same calendar.
+market_hours = MarketHours(
+    market_timezone=os.environ.get("PREFETCH_MARKET_TZ", MARKET_TIMEZONE),
+    settled_after=os.environ.get("PREFETCH_AFTER", SETTLED_AFTER),
+)
+price_store = SharedPriceStore(
+    CLIENT_BUCKET_NAME1,
+    get_client=lambda: get_client_s3(),
+    ticker_factory=lambda stock_ticker: yf.Ticker(stock_ticker),
+    storage_format=STORAGE_FORMAT,
+    put=change_detector.put_if_changed,
+    market_hours=market_hours,
+    intraday_ttl=int(os.environ.get("PRICE_INTRADAY_TTL", INTRADAY_TTL)),
+)
+
+
 def search_ticker(company_name):
     try:
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={company_name}"
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            for quote in data.get("quotes", []):
-                if quote.get("isYahooFinance") and "symbol" in quote:
-                    symbol = quote["symbol"]
-                    # Strip .MX only, keep all other suffixes (e.g. .KS, .NS, etc.)
-                    return symbol.split(".")[0] if symbol.endswith(".MX") else symbol
-        return None
+        return ticker_resolver.resolve(company_name)
     except Exception:
         return None
 
 
-def get_stock_data(stock_ticker, company, name, period="1mo"):
+def resolve_tickers(company_names):
+    return ticker_resolver.resolve_many(company_names)
+
+
+def read_stored_stock_data(file_path):
+    """Returns the raw bytes previously collected for `file_path` on S3, or
+    None if it has never been stored."""
+    try:
+        s3 = get_client_s3()
+        obj = s3.get_object(Bucket=CLIENT_BUCKET_NAME1, Key=file_path)
+        return obj["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+
+
+def write_user_stock_csv(file_path, hist, stored=None, stored_read=False):
+    """Uploads the user's price file, returning False if it was unchanged.
+    With `stored_read` set, `stored` is what read_stored_stock_data returned
+    for the file, so the stored object is not looked up again."""
+    storage_format = format_of_key(file_path)
+    data = encode_frame(hist, storage_format)
+    if data == stored:
+        return False
+    stored_hash = UNKNOWN_HASH
+    if stored_read:
+        stored_hash = None if stored is None else content_md5(stored)
+    try:
+        return put_client_object(
+            CLIENT_BUCKET_NAME1,
+            file_path,
+            data,
+            content_type(storage_format),
+            stored_hash=stored_hash,
+        )
+    except Exception as e:
+        # as with write_to_client_s3 the data is still served; it just could
+        # not be stored this time
+        print(f"Error writing to S3: {e}")
+        return True
+
+
+def collect_stock_data(stock_ticker, company, name, period="1mo", incremental=True):
+    """Like get_stock_data, returning (file_path, data, unchanged) where
+    `unchanged` means the stored price data was already exactly current and
+    nothing was uploaded."""
     try:
+        company = company.strip().lower()
+        name = name.strip().lower()
+
+        if PRICE_STORE_LAYOUT == "shared":
+            hist, written = price_store.collect(stock_ticker, period)
+            if hist is None or hist.empty:
+                return None, None, False
+            file_path = price_store.link(name, company, stock_ticker)
+            listing_index.record_stock_key(file_path)
+            return file_path, hist.to_dict(orient="records"), not written
+
+        file_path = legacy_key(name, company, STORAGE_FORMAT)
         stock = yf.Ticker(stock_ticker)
-        hist = stock.history(period=period)
-        if hist.empty:
-            return None, None
-        hist = hist[
-            ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
-        ]
-        hist.reset_index(inplace=True)
-        hist["Date"] = hist["Date"].dt.strftime("%Y-%m-%d")
-        file_path = f"{name.strip().lower()}#{company.strip().lower()}_stock_data.csv"
-        hist.to_csv(file_path, index=False)
-        write_to_client_s3(file_path, CLIENT_BUCKET_NAME1)
-        return file_path, hist.to_dict(orient="records")
+
+        stored = read_stored_stock_data(file_path) if incremental else None
+        hist = fetch_history(stock, period, parse_history(stored, STORAGE_FORMAT))
+        if hist is None or hist.empty:
+            return None, None, False
+
+        written = write_user_stock_csv(file_path, hist, stored, incremental)
+        return file_path, hist.to_dict(orient="records"), not written
     except Exception as e:
         print(f"ERROR in get_stock_data: {e}")
-        return None, None
+        return None, None, False
+
+
+def get_stock_data(stock_ticker, company, name, period="1mo", incremental=True):
+    file_path, data, _ = collect_stock_data(
+        stock_ticker, company, name, period, incremental
+    )
+    return file_path, data
 
 
 @app.route("/")
@@ -166,6 +323,56 @@ def home():
     return "Welcome to the Stock Data API! Use /stockInfo?company=COMPANY_NAME to fetch stock details."
 
 
+_warm_lock = threading.Lock()
+_warmed_up = False
+
+
+def warm_up():
+    """Loads everything the request path would otherwise initialise lazily:
+    the heavy imports, the VADER lexicon, the GNews client and the assumed
+    role's credentials. Safe to call repeatedly; only the first call does
+    any work."""
+    global _warmed_up
+    with _warm_lock:
+        if _warmed_up:
+            return
+        ensure_loaded(yf, pd)
+        sentiment_scorer.warm_up()
+        get_gnews()
+        client_role_session.refresh()
+        _warmed_up = True
+
+
+@app.route("/ready")
+def ready():
+    # Readiness probe: don't take traffic until the lazy state is loaded.
+    try:
+        warm_up()
+        return jsonify({"status": "ready"}), 200
+    except Exception as e:
+        return jsonify({"status": "not ready", "error": str(e)}), 503
+
+
+def lookup_stock_info(company_name, name):
+    """Resolves the company's ticker and collects its stock data for the
+    user, returning the /stockInfo response body and status code."""
+    stock_ticker = search_ticker(company_name)
+    if not stock_ticker:
+        return {"error": f"Could not find a stock ticker for '{company_name}'."}, 404
+    file_path, stock_data, unchanged = collect_stock_data(
+        stock_ticker, company_name, name
+    )
+    if stock_data is None:
+        return {"error": f"Stock data for '{company_name}' not found or invalid."}, 404
+    return {
+        "message": "Stock data retrieved successfully",
+        "ticker": stock_ticker,
+        "file": file_path,
+        "unchanged": unchanged,
+        "data": stock_data,
+    }, 200
+
+
 @app.route("/stockInfo")
 def stock_info():
     try:
@@ -181,28 +388,200 @@ def stock_info():
             return jsonify({"error": f"User '{name}' is not registered."}), 403
         name = name.strip().lower()
 
-        stock_ticker = search_ticker(company_name)
-        if not stock_ticker:
+        if wants_async():
+            return submit_job("stock_info", name, company_name)
+        body, status = lookup_stock_info(company_name, name)
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+
+
+BATCH_MAX_COMPANIES = 100
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+
+
+def store_batch_history(stock_ticker, company, name, hist):
+    """Stores a batch-fetched history, returning (file_path, unchanged)."""
+    if PRICE_STORE_LAYOUT == "shared":
+        written = price_store.save(stock_ticker, hist)
+        file_path = price_store.link(name, company, stock_ticker)
+        listing_index.record_stock_key(file_path)
+        return file_path, not written
+    file_path = legacy_key(name, company, STORAGE_FORMAT)
+    return file_path, not write_user_stock_csv(file_path, hist)
+
+
+def get_batch_stock_data(stock_tickers, period="1mo"):
+    """Returns {ticker: history or None} for many tickers. Tickers with a
+    fresh copy in the shared store are served from it; everything else
+    is fetched with a single multi-ticker yf.download call."""
+    histories = {}
+    stale = list(stock_tickers)
+
+    if PRICE_STORE_LAYOUT == "shared":
+        with ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) as pool:
+            loaded = dict(zip(stale, pool.map(price_store.load, stale)))
+        for stock_ticker, (stored, fetched_at) in loaded.items():
+            if stored is not None and price_store.is_fresh(fetched_at):
+                histories[stock_ticker] = stored
+        stale = [t for t in stale if t not in histories]
+
+    if stale:
+        frame = yf.download(
+            stale,
+            period=period,
+            group_by="ticker",
+            actions=True,
+            auto_adjust=True,
+            threads=True,
+            progress=False,
+        )
+        histories.update(split_download(frame, stale))
+    return histories
+
+
+@app.route("/stockInfo/batch", methods=["POST"])
+def stock_info_batch():
+    try:
+        body = request.get_json(silent=True) or {}
+        name = request.args.get("name") or body.get("name")
+        if not name:
+            return jsonify({"error": "Please provide your username as `name`."}), 400
+        companies = body.get("companies")
+        if (
+            not isinstance(companies, list)
+            or not companies
+            or not all(isinstance(c, str) and c.strip() for c in companies)
+        ):
             return jsonify(
-                {"error": f"Could not find a stock ticker for '{company_name}'."}
-            ), 404
-        file_path, stock_data = get_stock_data(stock_ticker, company_name, name)
-        if stock_data is None:
+                {"error": "Please provide a JSON body with a list of `companies`."}
+            ), 400
+        if len(companies) > BATCH_MAX_COMPANIES:
             return jsonify(
-                {"error": f"Stock data for '{company_name}' not found or invalid."}
-            ), 404
-        return jsonify(
-            {
-                "message": "Stock data retrieved successfully",
+                {"error": f"At most {BATCH_MAX_COMPANIES} companies per batch."}
+            ), 400
+
+        if not is_registered_user(name):
+            return jsonify({"error": f"User '{name}' is not registered."}), 403
+        name = name.strip().lower()
+
+        companies = list(dict.fromkeys(c.strip().lower() for c in companies))
+        tickers = resolve_tickers(companies)
+        histories = get_batch_stock_data({t for t in tickers.values() if t})
+
+        def collect(company):
+            stock_ticker = tickers[company]
+            if not stock_ticker:
+                return {
+                    "company": company,
+                    "status": "error",
+                    "error": f"Could not find a stock ticker for '{company}'.",
+                }
+            hist = histories.get(stock_ticker)
+            if hist is None or hist.empty:
+                return {
+                    "company": company,
+                    "ticker": stock_ticker,
+                    "status": "error",
+                    "error": f"Stock data for '{company}' not found or invalid.",
+                }
+            try:
+                file_path, unchanged = store_batch_history(
+                    stock_ticker, company, name, hist
+                )
+            except Exception as e:
+                return {
+                    "company": company,
+                    "ticker": stock_ticker,
+                    "status": "error",
+                    "error": f"Could not store stock data: {str(e)}",
+                }
+            return {
+                "company": company,
                 "ticker": stock_ticker,
+                "status": "ok",
                 "file": file_path,
-                "data": stock_data,
+                "unchanged": unchanged,
+                "data": hist.to_dict(orient="records"),
+            }
+
+        with ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) as pool:
+            results = list(pool.map(collect, companies))
+
+        succeeded = sum(1 for r in results if r["status"] == "ok")
+        return jsonify(
+            {
+                "message": "Batch stock data retrieval complete",
+                "succeeded": succeeded,
+                "failed": len(results) - succeeded,
+                "results": results,
             }
         )
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 
+PREFETCH_MAX_WORKERS = int(os.environ.get("PREFETCH_MAX_WORKERS", "4"))
+
+
+def list_stock_keys():
+    paginator = get_client_s3().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=CLIENT_BUCKET_NAME1):
+        for obj in page.get("Contents", []):
+            yield obj["Key"]
+
+
+def prefetch_tracked_prices(max_workers=None):
+    """Refreshes the stored prices of every company some user has collected,
+    so /stockInfo after the close is served from data that is already
+    current. Work is split by ticker across a bounded pool: in the shared
+    layout the ticker's canonical object is refreshed once (every manifest
+    already points at it); in the per-user layout each tracking user's CSV
+    is brought up to date through get_stock_data. Returns a summary."""
+    tracked = tracked_from_keys(list_stock_keys())
+    tickers = resolve_tickers(sorted(tracked))
+
+    by_ticker = {}
+    failed = [company for company, t in tickers.items() if not t]
+    for company, stock_ticker in tickers.items():
+        if stock_ticker:
+            by_ticker.setdefault(stock_ticker, []).append(company)
+
+    def refresh(stock_ticker):
+        companies = by_ticker[stock_ticker]
+        try:
+            if PRICE_STORE_LAYOUT == "shared":
+                # Forced: the run exists to store the closing bar, whatever
+                # is already there.
+                hist = price_store.get_history(stock_ticker, refresh=True)
+                return [] if hist is not None and not hist.empty else companies
+            missed = []
+            for company in companies:
+                for name in sorted(tracked[company]):
+                    _, data = get_stock_data(stock_ticker, company, name)
+                    if data is None and company not in missed:
+                        missed.append(company)
+            return missed
+        except Exception as e:
+            print(f"Error prefetching {stock_ticker}: {e}")
+            return companies
+
+    with ThreadPoolExecutor(max_workers=max_workers or PREFETCH_MAX_WORKERS) as pool:
+        for missed in pool.map(refresh, sorted(by_ticker)):
+            failed.extend(missed)
+
+    summary = {
+        "companies": len(tracked),
+        "tickers": len(by_ticker),
+        "failed": sorted(failed),
+    }
+    print(f"Prefetched tracked prices: {summary}")
+    return summary
+
+
+price_scheduler = EndOfDayScheduler(prefetch_tracked_prices, market_hours)
+
+
 @app.route("/check_stock")
 def check_stock():
     try:
@@ -221,30 +600,31 @@ def check_stock():
 
         company_name = company_name.strip().lower()
         name = name.strip().lower()
-        file_path = f"{name}#{company_name}_stock_data.csv"
-
-        sts_client = boto3.client("sts")
-        assumed_role_object = sts_client.assume_role(
-            RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-        )
-        credentials = assumed_role_object["Credentials"]
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=credentials["AccessKeyId"],
-            aws_secret_access_key=credentials["SecretAccessKey"],
-            aws_session_token=credentials["SessionToken"],
-        )
+        s3 = get_client_s3()
+
+        # Collected stock is either a manifest into the shared price store or
+        # a private CSV (or Parquet file) written in the per-user layout.
+        for file_path in dict.fromkeys(
+            (
+                manifest_key(name, company_name),
+                legacy_key(name, company_name, STORAGE_FORMAT),
+                legacy_key(name, company_name),
+            )
+        ):
+            try:
+                s3.head_object(Bucket=CLIENT_BUCKET_NAME1, Key=file_path)
+                return jsonify(
+                    {"exists": True, "message": "Stock data exists.", "file": file_path}
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "404":
+                    raise
 
-        s3.head_object(Bucket=CLIENT_BUCKET_NAME1, Key=file_path)
         return jsonify(
-            {"exists": True, "message": "Stock data exists.", "file": file_path}
+            {"exists": False, "message": "No stock data found.", "file": file_path}
         )
 
     except ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            return jsonify(
-                {"exists": False, "message": "No stock data found.", "file": file_path}
-            )
         return jsonify({"error": f"Error checking S3: {str(e)}"}), 500
 
     except Exception as e:
@@ -252,71 +632,11 @@ def check_stock():
 
 
 def get_stocks_for_news(username):
-    name = username
-    sts_client = boto3.client("sts")
-    assumed_role = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    creds = assumed_role["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=creds["AccessKeyId"],
-        aws_secret_access_key=creds["SecretAccessKey"],
-        aws_session_token=creds["SessionToken"],
-    )
-
-    paginator = s3.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=CLIENT_BUCKET_NAME1)
-
-    companies = []
-    for page in pages:
-        for obj in page.get("Contents", []):
-            key = obj["Key"]
-            filename = key.split("/")[-1]
-            if filename.startswith(f"{name}#") and filename.endswith("_stock_data.csv"):
-                company = filename.split("#")[1].replace("_stock_data.csv", "")
-                companies.append(company)
-    return companies
+    return listing_index.companies(username)
 
 
 def get_latest_news_date_from_s3(company_name, username):
-    prefix = f"{username}_{company_name}_"
-    sts_client = boto3.client("sts")
-    assumed_role = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    creds = assumed_role["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=creds["AccessKeyId"],
-        aws_secret_access_key=creds["SecretAccessKey"],
-        aws_session_token=creds["SessionToken"],
-        region_name="ap-southeast-2",
-    )
-
-    paginator = s3.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=CLIENT_BUCKET_NAME2, Prefix=prefix)
-
-    latest_date = None
-    pattern = re.compile(
-        f"{username}_{company_name}_(\\d{{4}}-\\d{{2}}-\\d{{2}})_news\\.csv"
-    )
-
-    for page in pages:
-        for obj in page.get("Contents", []):
-            key = obj["Key"].split("/")[-1]
-            match = pattern.match(key)
-            if match:
-                date_str = match.group(1)
-                try:
-                    file_date = datetime.strptime(date_str, "%Y-%m-%d").replace(
-                        tzinfo=timezone.utc
-                    )
-                    if latest_date is None or file_date > latest_date:
-                        latest_date = file_date
-                except ValueError:
-                    continue
-    return latest_date
+    return listing_index.latest_news_date(username, company_name)
 
 
 def fetch_company_news_df(company_name):
@@ -326,6 +646,7 @@ def fetch_company_news_df(company_name):
 
     ticker_obj = yf.Ticker(ticker)
     records = []
+    texts = []
     try:
         raw_news = ticker_obj.news
         for item in raw_news:
@@ -339,8 +660,7 @@ def fetch_company_news_df(company_name):
                     continue
                 title = content.get("title", "")
                 summary = content.get("summary", "")
-                combined_text = f"{title}. {summary}"
-                sentiment = sia.polarity_scores(combined_text)["compound"]
+                texts.append(f"{title}. {summary}")
 
                 records.append(
                     {
@@ -348,42 +668,99 @@ def fetch_company_news_df(company_name):
                         "article_title": title,
                         "url": content.get("canonicalUrl", {}).get("url", ""),
                         "published_at": pub_time.isoformat(),
-                        "sentiment_score": sentiment,
                     }
                 )
             except Exception:
                 continue
     except Exception:
         pass
+
+    # Score the whole batch at once so repeated articles hit the cache.
+    for record, sentiment in zip(records, sentiment_scorer.score_many(texts)):
+        record["sentiment_score"] = sentiment
     return pd.DataFrame(records)
 
 
 def upload_csv_to_s3(username, company_name, df, date_str=None):
+    """Stores a company's news for the day. Returns whether it was written."""
     if date_str is None:
         date_str = datetime.now().strftime("%Y-%m-%d")
 
-    key = f"{username}_{company_name}_{date_str}_news.csv"
-    buffer = io.StringIO()
-    df.to_csv(buffer, index=False)
-
-    sts_client = boto3.client("sts")
-    assumed = sts_client.assume_role(
-        RoleArn=CLIENT_ROLE_ARN, RoleSessionName="AssumeRoleSession1"
-    )
-    creds = assumed["Credentials"]
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=creds["AccessKeyId"],
-        aws_secret_access_key=creds["SecretAccessKey"],
-        aws_session_token=creds["SessionToken"],
+    key = f"{username}_{company_name}_{date_str}_news{extension(STORAGE_FORMAT)}"
+    # News keys carry the date, and a day's news is only collected once, so
+    # there is never a stored copy worth checking.
+    written = put_client_object(
+        CLIENT_BUCKET_NAME2,
+        key,
+        encode_frame(df, STORAGE_FORMAT),
+        content_type(STORAGE_FORMAT),
+        stored_hash=None,
     )
+    listing_index.record_news(username, company_name, date_str)
+    return written
 
-    s3.put_object(
-        Bucket=CLIENT_BUCKET_NAME2,
-        Key=key,
-        Body=buffer.getvalue(),
-        ContentType="text/csv",
-    )
+
+NEWS_MAX_WORKERS = int(os.environ.get("NEWS_MAX_WORKERS", "8"))
+NEWS_COMPANY_TIMEOUT = float(os.environ.get("NEWS_COMPANY_TIMEOUT", "20"))
+
+
+def collect_company_news(name, company):
+    """Refreshes one company's news for a user, returning a result dict whose
+    status is "added", "up_to_date", "no_news" or "error"."""
+    company = company.strip().lower()
+    try:
+        latest = get_latest_news_date_from_s3(company, name)
+        if latest and latest >= ONE_MONTH_AGO:
+            return {"company": company, "status": "up_to_date"}
+        df = fetch_company_news_df(company)
+        if df.empty:
+            return {"company": company, "status": "no_news"}
+        upload_csv_to_s3(name, company, df)
+        return {"company": company, "status": "added"}
+    except Exception as e:
+        print(f"Error with {company}: {e}")
+        return {"company": company, "status": "error", "error": str(e)}
+
+
+def iter_company_news(name, companies, max_workers, timeout):
+    """Runs collect_company_news for every company on a bounded thread pool
+    and yields each result as soon as it is ready. A company still running
+    `timeout` seconds after it started is reported with status "timeout";
+    its worker is left to finish in the background."""
+    if not companies:
+        return
+
+    started = {}
+
+    def run(company):
+        started[company] = time.monotonic()
+        return collect_company_news(name, company)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {pool.submit(run, company): company for company in companies}
+    pending = dict(futures)
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                yield future.result()
+
+            now = time.monotonic()
+            for future, company in list(pending.items()):
+                if company in started and now - started[company] > timeout:
+                    pending.pop(future)
+                    yield {
+                        "company": company.strip().lower(),
+                        "status": "timeout",
+                        "error": f"Gave up after {timeout:g} seconds",
+                    }
+    finally:
+        # Don't start companies nobody is waiting for any more (e.g. the
+        # client disconnected from a streamed response).
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
 
 
 @app.route("/news")
@@ -392,65 +769,190 @@ def getallCompanyNews():
     if not name:
         return jsonify({"error": "Please provide your username as `name`."}), 400
 
+    try:
+        max_workers = int(request.args.get("concurrency", NEWS_MAX_WORKERS))
+    except ValueError:
+        return jsonify({"error": "`concurrency` must be an integer."}), 400
+    max_workers = max(1, min(max_workers, NEWS_MAX_WORKERS))
+
     if not is_registered_user(name):
         return jsonify({"error": f"User '{name}' is not registered."}), 403
     name = name.strip().lower()
 
+    if wants_async():
+        return submit_job("news", name, payload={"concurrency": max_workers})
+
     companies = get_stocks_for_news(name)
-    files_added = 0
+    results = iter_company_news(name, companies, max_workers, NEWS_COMPANY_TIMEOUT)
+
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        # One JSON object per line as each company finishes, then a summary.
+        def generate():
+            files_added = 0
+            for result in results:
+                files_added += result["status"] == "added"
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"status": "complete", "files_added": files_added}) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
 
-    for company in companies:
-        try:
-            latest = get_latest_news_date_from_s3(company.strip().lower(), name)
-            if not latest or latest < ONE_MONTH_AGO:
-                df = fetch_company_news_df(company.strip().lower())
-                if not df.empty:
-                    upload_csv_to_s3(name, company.strip().lower(), df)
-                    files_added += 1
-        except Exception as e:
-            print(f"Error with {company.strip().lower()}: {e}")
+    results = list(results)
+    files_added = sum(1 for r in results if r["status"] == "added")
+    return jsonify(
+        {"status": "complete", "files_added": files_added, "results": results}
+    ), 200
 
-    return jsonify({"status": "complete", "files_added": files_added}), 200
 
+# -------------------- COLLECTION JOBS --------------------
+# With `async=true`, /stockInfo and /news queue the work and answer 202 with
+# a job id straight away; GET /jobs/<id> reports progress and the result.
 
-gn = GNews(language="en", max_results=100)
 
+def run_stock_info_job(payload):
+    body, status = lookup_stock_info(payload["company"], payload["name"])
+    if status != 200:
+        raise JobFailed(body["error"])
+    return body
 
-@app.route("/sportsNews", methods=["GET"])
-def get_sports_news():
-    try:
-        news_items = gn.get_news("nba")
-        stories = []
-        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=48)
 
-        for item in news_items:
-            try:
-                pub_time = item["published date"]
-                if isinstance(pub_time, datetime):
-                    pub_time = pub_time.astimezone(timezone.utc)
-                else:
-                    pub_time = datetime.strptime(
-                        pub_time, "%a, %d %b %Y %H:%M:%S %Z"
-                    ).replace(tzinfo=timezone.utc)
-
-                if pub_time >= cutoff_time:
-                    stories.append(
-                        {
-                            "title": item["title"],
-                            "link": item["url"],
-                            "published": pub_time,  # still in UTC here
-                        }
-                    )
-            except Exception:
-                continue
+def run_news_job(payload):
+    name = payload["name"]
+    results = list(
+        iter_company_news(
+            name,
+            get_stocks_for_news(name),
+            payload.get("concurrency", NEWS_MAX_WORKERS),
+            NEWS_COMPANY_TIMEOUT,
+        )
+    )
+    files_added = sum(1 for r in results if r["status"] == "added")
+    return {"status": "complete", "files_added": files_added, "results": results}
+
+
+job_queue = JobQueue(
+    db_path=os.environ.get(
+        "JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "omega_jobs.sqlite3")
+    ),
+    handlers={"stock_info": run_stock_info_job, "news": run_news_job},
+    max_workers=int(os.environ.get("JOB_MAX_WORKERS", "4")),
+    retention=float(os.environ.get("JOB_RETENTION", JOB_RETENTION)),
+    timeout=float(os.environ.get("JOB_TIMEOUT", JOB_TIMEOUT)),
+)
+
+
+def wants_async():
+    return request.args.get("async", "").lower() in ("1", "true", "yes")
+
+
+def submit_job(kind, name, company="", payload=None):
+    """Queues a collection job (or joins the identical one already in flight)
+    and returns the 202 response pointing at it."""
+    job_queue.start()
+    payload = {**(payload or {}), "name": name, "company": company}
+    job_id, coalesced = job_queue.submit(kind, name, company, payload)
+    status_url = f"/jobs/{job_id}"
+    response = jsonify(
+        {
+            "job_id": job_id,
+            "status": job_queue.get(job_id)["status"],
+            "coalesced": coalesced,
+            "status_url": status_url,
+        }
+    )
+    response.headers["Location"] = status_url
+    return response, 202
+
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No job '{job_id}'."}), 404
+    return jsonify(job), 200
+
+
+_gnews_client = None
 
-        # Sort stories by time
-        stories.sort(key=lambda x: x["published"], reverse=True)
 
-        # Convert to NSW time for display
-        for s in stories:
-            s["published"] = s["published"].astimezone(SYDNEY_TZ).isoformat()
+def get_gnews():
+    global _gnews_client
+    if _gnews_client is None:
+        from gnews import GNews
 
+        _gnews_client = GNews(language="en", max_results=100)
+    return _gnews_client
+
+
+SPORTS_NEWS_TTL = float(os.environ.get("SPORTS_NEWS_TTL", "300"))
+SPORTS_NEWS_STALE_TTL = float(os.environ.get("SPORTS_NEWS_STALE_TTL", "1800"))
+# Each topic costs a Google News scrape, so only these can be asked for.
+SPORTS_NEWS_TOPICS = tuple(
+    topic.strip().lower()
+    for topic in os.environ.get(
+        "SPORTS_NEWS_TOPICS", "nba,nfl,mlb,nhl,afl,nrl,cricket,soccer,tennis"
+    ).split(",")
+    if topic.strip()
+)
+sports_news_cache = RefreshingCache(
+    ttl=SPORTS_NEWS_TTL,
+    stale_ttl=SPORTS_NEWS_STALE_TTL,
+    maxsize=max(len(SPORTS_NEWS_TOPICS), 1),
+)
+
+
+def load_sports_news(topic):
+    news_items = get_gnews().get_news(topic)
+    stories = []
+    cutoff_time = datetime.now(timezone.utc) - timedelta(hours=48)
+
+    for item in news_items:
+        try:
+            pub_time = item["published date"]
+            if isinstance(pub_time, datetime):
+                pub_time = pub_time.astimezone(timezone.utc)
+            else:
+                pub_time = datetime.strptime(
+                    pub_time, "%a, %d %b %Y %H:%M:%S %Z"
+                ).replace(tzinfo=timezone.utc)
+
+            if pub_time >= cutoff_time:
+                stories.append(
+                    {
+                        "title": item["title"],
+                        "link": item["url"],
+                        "published": pub_time,  # still in UTC here
+                    }
+                )
+        except Exception:
+            continue
+
+    # Sort stories by time
+    stories.sort(key=lambda x: x["published"], reverse=True)
+
+    # Convert to NSW time for display
+    for s in stories:
+        s["published"] = s["published"].astimezone(SYDNEY_TZ).isoformat()
+
+    return stories
+
+
+@app.route("/sportsNews", methods=["GET"])
+def get_sports_news():
+    topic = request.args.get("topic", "nba").strip().lower()
+    if topic not in SPORTS_NEWS_TOPICS:
+        return jsonify(
+            {
+                "status": "error",
+                "message": f"`topic` must be one of {', '.join(SPORTS_NEWS_TOPICS)}.",
+            }
+        ), 400
+
+    try:
+        # Scraping Google News takes seconds, so every caller shares one
+        # recent result per topic.
+        stories = sports_news_cache.get(topic, load_sports_news)
         return jsonify(
             {"status": "success", "article_count": len(stories), "articles": stories}
         )
@@ -460,4 +962,13 @@ def get_sports_news():
 
 
 if __name__ == "__main__":
+    client_role_session.start_background_refresh()
+    if os.environ.get("WARM_UP_ON_START", "").lower() in ("1", "true", "yes"):
+        warm_up()
+    if os.environ.get("WARM_USER_CACHE", "").lower() in ("1", "true", "yes"):
+        print(f"Warmed user cache with {warm_registered_users()} users")
+    if os.environ.get("PREFETCH_PRICES", "").lower() in ("1", "true", "yes"):
+        price_scheduler.start()
+    # picks up jobs queued before a restart
+    job_queue.start()
     app.run(host="0.0.0.0", port=5001)
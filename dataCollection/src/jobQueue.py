@@ -0,0 +1,338 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+JOB_RETENTION = 24 * 60 * 60
+# How often idle workers look for jobs queued by another process.
+POLL_INTERVAL = 1.0
+# A claimed job belongs to its worker for this long; the owning process
+# renews it every third of that while the job runs.
+JOB_LEASE = 60
+# Past this a running job's lease is no longer renewed, so a hung job gives
+# up its slot instead of holding it forever.
+JOB_TIMEOUT = 15 * 60
+# Times a job is started before an expired lease fails it instead.
+MAX_ATTEMPTS = 2
+
+IN_FLIGHT = ("queued", "running")
+
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail the job with a message for the client."""
+
+
+def _timestamp(seconds):
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class JobQueue:
+    """Durable queue of collection jobs in a SQLite file, worked through by a
+    pool of daemon threads. Several processes may share the file.
+
+    A job is a kind (a key into `handlers`), the user and company it is for,
+    and a JSON payload. Submitting a job while an identical one (same kind,
+    user and company) is still queued or running returns the existing job
+    instead of adding another, so retried requests don't repeat the work.
+
+    A worker that claims a job holds a lease on it, renewed while the job
+    runs for up to `timeout` seconds. Only jobs whose lease has expired -
+    their process died, or the job hung - are queued again, and after
+    `max_attempts` starts such a job is failed instead. Finished jobs are
+    kept for `retention` seconds so their results can be polled."""
+
+    def __init__(
+        self,
+        db_path,
+        handlers,
+        max_workers=4,
+        retention=JOB_RETENTION,
+        lease=JOB_LEASE,
+        timeout=JOB_TIMEOUT,
+        max_attempts=MAX_ATTEMPTS,
+        clock=time.time,
+    ):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.retention = retention
+        self.lease = lease
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._clock = clock
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # {claim token: (job_id, claimed at)} for the claims this process is
+        # running; a job retried in the same process gets a second token
+        self._running = {}
+        self._workers = []
+        self._stop = threading.Event()
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    company TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS jobs_in_flight
+                    ON jobs (kind, username, company)
+                    WHERE status IN ('queued', 'running');
+                CREATE INDEX IF NOT EXISTS jobs_by_status
+                    ON jobs (status, submitted_at);
+                """
+            )
+            self._db.commit()
+        return self._db
+
+    def _expire(self, db, now):
+        """Fails, or queues again, running jobs whose lease has lapsed. Call
+        with the lock held; the caller commits."""
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+            "owner = NULL, lease_expires = NULL "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            ("Job timed out", now, now, self.max_attempts),
+        )
+        db.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, "
+            "lease_expires = NULL WHERE status = 'running' AND lease_expires < ?",
+            (now,),
+        )
+
+    def _in_flight(self, db, kind, username, company):
+        row = db.execute(
+            "SELECT id FROM jobs WHERE kind = ? AND username = ? AND company = ? "
+            "AND status IN (?, ?)",
+            (kind, username, company, *IN_FLIGHT),
+        ).fetchone()
+        return row[0] if row else None
+
+    def submit(self, kind, username, company="", payload=None):
+        """Queues a job, returning (job_id, coalesced) where `coalesced` is
+        True if an identical job was already in flight and its id is
+        returned instead."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind!r}")
+
+        with self._lock:
+            db = self._connect()
+            now = self._clock()
+            self._expire(db, now)
+            db.commit()
+            existing = self._in_flight(db, kind, username, company)
+            if existing is not None:
+                return existing, True
+
+            job_id = uuid.uuid4().hex
+            try:
+                db.execute(
+                    "INSERT INTO jobs (id, kind, username, company, payload, status, "
+                    "submitted_at) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                    (job_id, kind, username, company, json.dumps(payload or {}), now),
+                )
+            except sqlite3.IntegrityError:
+                # another process sharing the file queued it first
+                db.rollback()
+                existing = self._in_flight(db, kind, username, company)
+                if existing is not None:
+                    return existing, True
+                raise
+            db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') "
+                "AND finished_at < ?",
+                (now - self.retention,),
+            )
+            db.commit()
+            self._wakeup.notify()
+        return job_id, False
+
+    def get(self, job_id):
+        """The job's status and, once finished, its result or error, as a
+        JSON-ready dict; None for unknown (or expired) jobs."""
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT id, kind, username, company, status, result, error, "
+                    "submitted_at, started_at, finished_at FROM jobs WHERE id = ?",
+                    (job_id,),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+
+        job_id, kind, username, company, status, result, error = row[:7]
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "name": username,
+            "company": company or None,
+            "status": status,
+            "submitted_at": _timestamp(row[7]),
+            "started_at": _timestamp(row[8]),
+            "finished_at": _timestamp(row[9]),
+        }
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def _claim(self):
+        """Takes a lease on the oldest queued job and returns (id, kind,
+        payload, token), or None if nothing is queued. The token identifies
+        this claim as the job's owner; only it can renew the lease or record
+        the result. Call with the lock held."""
+        db = self._connect()
+        now = self._clock()
+        self._expire(db, now)
+        db.commit()
+        for job_id, kind, payload in db.execute(
+            "SELECT id, kind, payload FROM jobs WHERE status = 'queued' "
+            "ORDER BY submitted_at LIMIT ?",
+            (max(self.max_workers, 1),),
+        ).fetchall():
+            token = f"{self.owner}/{uuid.uuid4().hex[:8]}"
+            claimed = db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, "
+                "lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'queued'",
+                (now, token, now + self.lease, job_id),
+            ).rowcount
+            db.commit()
+            if claimed:
+                self._running[token] = (job_id, now)
+                return job_id, kind, json.loads(payload), token
+        return None
+
+    def _finish(self, job_id, token, status, result=None, error=None):
+        with self._lock:
+            self._running.pop(token, None)
+            db = self._connect()
+            finished = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+                "owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (
+                    status,
+                    None if result is None else json.dumps(result),
+                    error,
+                    self._clock(),
+                    job_id,
+                    token,
+                ),
+            ).rowcount
+            db.commit()
+        if not finished:
+            print(f"Dropped the result of job {job_id}: its lease had expired")
+
+    def renew_leases(self):
+        """Extends the leases of the claims this process is running, except
+        those that have been running for longer than `timeout`."""
+        with self._lock:
+            now = self._clock()
+            live = [
+                (job_id, token)
+                for token, (job_id, claimed_at) in self._running.items()
+                if now - claimed_at < self.timeout
+            ]
+            if not live:
+                return
+            db = self._connect()
+            db.executemany(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                [(now + self.lease, job_id, token) for job_id, token in live],
+            )
+            db.commit()
+
+    def run_next(self, timeout=0):
+        """Runs one queued job on the calling thread, waiting up to `timeout`
+        seconds for one to be submitted. Returns the job id, or None if there
+        was nothing to run. The lease is only renewed once start() has been
+        called."""
+        with self._lock:
+            job = self._claim()
+            if job is None and timeout:
+                self._wakeup.wait(timeout)
+                job = self._claim()
+        if job is None:
+            return None
+
+        job_id, kind, payload, token = job
+        try:
+            result = self.handlers[kind](payload)
+        except JobFailed as e:
+            self._finish(job_id, token, "failed", error=str(e))
+        except Exception as e:
+            print(f"Error running {kind} job {job_id}: {e}")
+            self._finish(job_id, token, "failed", error=f"Unexpected error: {e}")
+        else:
+            self._finish(job_id, token, "succeeded", result=result)
+        return job_id
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                self.run_next(timeout=POLL_INTERVAL)
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                self._stop.wait(POLL_INTERVAL)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                self.renew_leases()
+            except Exception as e:
+                print(f"Error renewing job leases: {e}")
+
+    def start(self):
+        """Starts the worker threads and the lease heartbeat. Safe to call
+        more than once."""
+        with self._lock:
+            if any(worker.is_alive() for worker in self._workers):
+                return
+            self._stop.clear()
+            self._workers = [
+                threading.Thread(
+                    target=self._work, name=f"collection-job-{i}", daemon=True
+                )
+                for i in range(self.max_workers)
+            ]
+            self._workers.append(
+                threading.Thread(
+                    target=self._heartbeat, name="collection-job-leases", daemon=True
+                )
+            )
+            for worker in self._workers:
+                worker.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._wakeup.notify_all()
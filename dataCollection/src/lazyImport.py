@@ -0,0 +1,47 @@
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module that is only imported the first time one of
+    its attributes is used. Attribute writes (e.g. monkeypatching in tests)
+    go straight through to the real module."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        object.__setattr__(self, "_lazy_module", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _load(self):
+        module = object.__getattribute__(self, "_lazy_module")
+        if module is None:
+            with object.__getattribute__(self, "_lazy_lock"):
+                module = object.__getattribute__(self, "_lazy_module")
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    object.__setattr__(self, "_lazy_module", module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def ensure_loaded(*modules):
+    """Forces the real import behind any lazy modules given."""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
@@ -0,0 +1,136 @@
+import re
+import threading
+from datetime import datetime, timezone
+
+from caches import TTLCache
+from priceStore import company_from_key
+
+
+LISTING_CACHE_TTL = 30
+
+
+class UserListingIndex:
+    """Per-user view of what has been collected, built from one
+    prefix-scoped listing per bucket instead of scanning whole buckets.
+
+    Stock objects are named `<user>#<company>...` and news objects
+    `<user>_<company>_<YYYY-MM-DD>_news.csv` (or `.parquet`), so listing
+    with the user's prefix touches only that user's files (plus, for news,
+    those of users named `<user>_...`, which are told apart by only keeping
+    the companies the user has collected stock for). Results are
+    cached for a short TTL and kept up to date by the record_* methods
+    whenever this process writes a new object."""
+
+    def __init__(self, stock_bucket, news_bucket, get_client, ttl=LISTING_CACHE_TTL):
+        self.stock_bucket = stock_bucket
+        self.news_bucket = news_bucket
+        self._get_client = get_client
+        self._companies = TTLCache(maxsize=10000, ttl=ttl)
+        self._news_dates = TTLCache(maxsize=10000, ttl=ttl)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _list_keys(self, bucket, prefix):
+        paginator = self._get_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    def _lock_for(self, cache, username):
+        with self._locks_lock:
+            return self._locks.setdefault((id(cache), username), threading.Lock())
+
+    def _cached(self, cache, username, load):
+        value = cache.get(username)
+        if value is not None:
+            return value
+
+        # Concurrent callers for the same user wait for one listing.
+        with self._lock_for(cache, username):
+            value = cache.get(username)
+            if value is None:
+                value = load(username)
+                cache.set(username, value)
+            return value
+
+    def _load_companies(self, username):
+        companies = {}
+        for key in self._list_keys(self.stock_bucket, f"{username}#"):
+            company = company_from_key(username, key)
+            if company is not None:
+                companies[company] = True
+        return companies
+
+    def _load_news_dates(self, username):
+        pattern = re.compile(
+            rf"^{re.escape(username)}_(.+)_(\d{{4}}-\d{{2}}-\d{{2}})_news\.(?:csv|parquet)$"
+        )
+        # "bob_smith_apple_..." matches user "bob" with company "smith_apple"
+        # too, so only companies bob actually tracks are kept.
+        tracked = set(self.companies(username))
+        latest = {}
+        for key in self._list_keys(self.news_bucket, f"{username}_"):
+            match = pattern.match(key.split("/")[-1])
+            if not match:
+                continue
+            company, date_str = match.groups()
+            if company not in tracked:
+                continue
+            try:
+                datetime.strptime(date_str, "%Y-%m-%d")
+            except ValueError:
+                continue
+            if date_str > latest.get(company, ""):
+                latest[company] = date_str
+        return latest
+
+    def companies(self, username):
+        """Every company the user has collected stock data for, in the order
+        S3 lists them."""
+        return list(self._cached(self._companies, username, self._load_companies))
+
+    def latest_news_dates(self, username):
+        """{company: latest news date string} for the user."""
+        return dict(self._cached(self._news_dates, username, self._load_news_dates))
+
+    def latest_news_date(self, username, company):
+        """The newest news file date for a user's company as a UTC datetime,
+        or None if no news has been stored for it."""
+        date_str = self.latest_news_dates(username).get(company)
+        if date_str is None:
+            return None
+        return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+    def _update(self, cache, username, update):
+        """Applies `update` to a copy of the user's cached dict, if there is
+        one, and caches the copy. Cached dicts are never changed in place,
+        so other threads can iterate them freely."""
+        with self._lock_for(cache, username):
+            value = cache.get(username)
+            if value is not None:
+                value = dict(value)
+                update(value)
+                cache.set(username, value)
+
+    def record_stock_key(self, key):
+        username = key.split("/")[-1].split("#", 1)[0]
+        company = company_from_key(username, key)
+        if company is not None:
+            self._update(
+                self._companies, username, lambda c: c.setdefault(company, True)
+            )
+
+    def record_news(self, username, company, date_str):
+        def update(dates):
+            if date_str > dates.get(company, ""):
+                dates[company] = date_str
+
+        self._update(self._news_dates, username, update)
+
+    def invalidate(self, username):
+        self._companies.pop(username)
+        self._news_dates.pop(username)
+
+    def clear(self):
+        self._companies.clear()
+        self._news_dates.clear()
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+
+MARKET_TIMEZONE = "America/New_York"
+MARKET_OPEN = "09:30"
+# Yahoo's daily bars settle a little after the 16:00 close.
+SETTLED_AFTER = "16:30"
+# While the session is running, stored prices are only reused for this long.
+INTRADAY_TTL = 15 * 60
+
+
+def _hour_minute(hhmm):
+    hour, minute = (int(part) for part in hhmm.split(":"))
+    return hour, minute
+
+
+class MarketHours:
+    """Weekday trading session of one exchange (holidays are not modelled).
+
+    Times are local "HH:MM" wall-clock times in `market_timezone`, so they
+    follow the exchange across daylight-saving changes. A session runs from
+    `opens_at` until `settled_after`, when the day's closing bar is final."""
+
+    def __init__(
+        self,
+        market_timezone=MARKET_TIMEZONE,
+        opens_at=MARKET_OPEN,
+        settled_after=SETTLED_AFTER,
+    ):
+        self.market_timezone = pytz.timezone(market_timezone)
+        self.opens_at = _hour_minute(opens_at)
+        self.settled_after = _hour_minute(settled_after)
+
+    def _local(self, now):
+        return (now or datetime.now(pytz.utc)).astimezone(self.market_timezone)
+
+    def _at(self, day, hour_minute):
+        naive = datetime(day.year, day.month, day.day, *hour_minute)
+        return self.market_timezone.localize(naive)
+
+    def last_settle(self, now=None):
+        """The most recent weekday settle time at or before `now` (an aware
+        datetime, defaulting to the current time), in UTC."""
+        now = self._local(now)
+        day = now.date()
+        while True:
+            if day.weekday() < 5:
+                settle = self._at(day, self.settled_after)
+                if settle <= now:
+                    return settle.astimezone(pytz.utc)
+            day -= timedelta(days=1)
+
+    def next_settle(self, now=None):
+        """The first weekday settle time strictly after `now`, in UTC."""
+        now = self._local(now)
+        day = now.date()
+        while True:
+            if day.weekday() < 5:
+                settle = self._at(day, self.settled_after)
+                if settle > now:
+                    return settle.astimezone(pytz.utc)
+            day += timedelta(days=1)
+
+    def in_session(self, now=None):
+        """Whether prices are still moving at `now`: a weekday between the
+        open and the settle time."""
+        now = self._local(now)
+        if now.weekday() >= 5:
+            return False
+        opens = self._at(now.date(), self.opens_at)
+        return opens <= now < self._at(now.date(), self.settled_after)
+
+    def is_fresh(self, fetched_at, now=None, intraday_ttl=INTRADAY_TTL):
+        """Whether prices fetched at `fetched_at` are still current at `now`.
+        A fetch made after the last settle stays valid until the next session
+        opens; during a session it is only reused for `intraday_ttl` seconds."""
+        if fetched_at is None:
+            return False
+        now = now or datetime.now(pytz.utc)
+        if fetched_at < self.last_settle(now):
+            return False
+        if self.in_session(now):
+            return (now - fetched_at).total_seconds() < intraday_ttl
+        return True
@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime
+
+import pytz
+
+from marketHours import MarketHours
+from priceStore import STOCK_DATA_SUFFIXES
+
+
+def tracked_from_keys(keys):
+    """Returns {company: set of usernames} for every `<user>#<company>` stock
+    object (per-user CSV or Parquet file, or shared-layout manifest) among
+    `keys`."""
+    tracked = {}
+    for key in keys:
+        filename = key.split("/")[-1]
+        username, sep, rest = filename.partition("#")
+        if not sep or not username:
+            continue
+        for suffix in STOCK_DATA_SUFFIXES:
+            if rest.endswith(suffix) and len(rest) > len(suffix):
+                company = rest[: -len(suffix)]
+                tracked.setdefault(company, set()).add(username)
+                break
+    return tracked
+
+
+class EndOfDayScheduler:
+    """Runs `job` once after every weekday market close from a daemon thread.
+
+    The run is at `market_hours`' settle time (local wall-clock time in the
+    exchange's timezone, so it follows daylight-saving changes), which is
+    also when the shared price store starts treating earlier fetches as
+    stale. Exceptions raised by the job are logged and the next close is
+    waited for as usual."""
+
+    def __init__(self, job, market_hours=None, clock=None):
+        self.job = job
+        self.market_hours = market_hours or MarketHours()
+        self._clock = clock or (lambda: datetime.now(pytz.utc))
+        self._thread = None
+        self._stop = threading.Event()
+
+    def next_run(self, now=None):
+        """Returns the first weekday run time strictly after `now` (an aware
+        datetime, defaulting to the clock) as an aware datetime in UTC."""
+        return self.market_hours.next_settle(now or self._clock())
+
+    def _loop(self):
+        run_at = self.next_run()
+        while not self._stop.wait(max((run_at - self._clock()).total_seconds(), 0)):
+            if self._clock() < run_at:
+                # Woke a little early: a fetch before the settle time would
+                # already count as stale.
+                continue
+            try:
+                self.job()
+            except Exception as e:
+                print(f"Error in scheduled price prefetch: {e}")
+            # Measure from the slot just served so an early wake-up cannot
+            # run the same close twice.
+            run_at = self.next_run(max(run_at, self._clock()))
+
+    def start(self):
+        """Starts the scheduler thread. Safe to call more than once."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="price-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,286 @@
+import io
+import json
+import re
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from lazyImport import lazy_import
+from marketHours import INTRADAY_TTL, MarketHours
+from storageFormat import content_type, decode_frame, encode_frame, extension
+
+pd = lazy_import("pandas")
+
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+
+_PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_PERIOD_UNITS = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+
+
+def format_history(hist):
+    """Turns a yfinance history frame into the stored CSV layout: a `Date`
+    column (YYYY-MM-DD) followed by PRICE_COLUMNS."""
+    hist = hist[PRICE_COLUMNS].reset_index()
+    hist["Date"] = hist["Date"].dt.strftime("%Y-%m-%d")
+    return hist
+
+
+def period_start(period, now=None):
+    """Returns the first date (YYYY-MM-DD) covered by a yfinance period string
+    such as "5d", "1mo" or "2y", or None for open-ended periods ("max", "ytd")."""
+    match = _PERIOD_PATTERN.match(period)
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), _PERIOD_UNITS[match.group(2)]
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    return (now - pd.DateOffset(**{unit: amount})).strftime("%Y-%m-%d")
+
+
+def parse_history_csv(csv_text):
+    if not csv_text:
+        return None
+    try:
+        stored = pd.read_csv(
+            io.StringIO(csv_text), dtype={"Date": str}, float_precision="round_trip"
+        )
+    except Exception:
+        return None
+    if stored.empty or "Date" not in stored.columns:
+        return None
+    return stored
+
+
+def parse_history(data, storage_format="csv"):
+    """Like parse_history_csv, for a stored object's raw bytes in either
+    storage format."""
+    if not data:
+        return None
+    if storage_format != "parquet":
+        return parse_history_csv(
+            data.decode("utf-8") if isinstance(data, bytes) else data
+        )
+    try:
+        stored = decode_frame(data, storage_format)
+    except ImportError:
+        raise
+    except Exception:
+        return None
+    if stored.empty or "Date" not in stored.columns:
+        return None
+    return stored
+
+
+def merge_history(stored, delta, period):
+    """Replaces every stored row on or after the first date in `delta` with
+    the delta (so the last, possibly partial, trading day is refreshed) and
+    drops rows that have fallen out of `period`."""
+    if delta.empty:
+        merged = stored
+    else:
+        first_new = delta["Date"].min()
+        merged = pd.concat(
+            [stored[stored["Date"] < first_new], delta], ignore_index=True
+        )
+
+    start = period_start(period)
+    if start is not None:
+        merged = merged[merged["Date"] >= start]
+    return merged.reset_index(drop=True)
+
+
+def fetch_history(stock, period, stored=None):
+    """Downloads price history for a yfinance Ticker. When a previously stored
+    frame is given and still overlaps `period`, only the days from its last
+    stored date onwards are requested and merged in. Returns None if yfinance
+    has nothing for the ticker."""
+    if stored is not None:
+        last_date = stored["Date"].max()
+        start = period_start(period)
+        if start is None or last_date >= start:
+            delta = stock.history(start=last_date)
+            delta = stored.iloc[0:0] if delta.empty else format_history(delta)
+            return merge_history(stored, delta, period)
+
+    hist = stock.history(period=period)
+    if hist.empty:
+        return None
+    return format_history(hist)
+
+
+def split_download(frame, stock_tickers):
+    """Splits the frame returned by a multi-ticker `yf.download(...,
+    group_by="ticker")` into {ticker: formatted history}. Tickers yfinance
+    returned nothing for map to None."""
+    histories = {}
+    for stock_ticker in stock_tickers:
+        if isinstance(frame.columns, pd.MultiIndex):
+            if stock_ticker not in frame.columns.get_level_values(0):
+                histories[stock_ticker] = None
+                continue
+            hist = frame[stock_ticker]
+        else:
+            hist = frame
+
+        hist = hist.dropna(subset=["Close"])
+        if hist.empty:
+            histories[stock_ticker] = None
+            continue
+        for column in ("Dividends", "Stock Splits"):
+            if column not in hist.columns:
+                hist = hist.assign(**{column: 0.0})
+        histories[stock_ticker] = format_history(hist)
+    return histories
+
+
+CANONICAL_PREFIX = "prices/"
+MANIFEST_SUFFIX = "_stock_data.json"
+LEGACY_SUFFIX = "_stock_data.csv"
+PARQUET_SUFFIX = "_stock_data.parquet"
+STOCK_DATA_SUFFIXES = (MANIFEST_SUFFIX, LEGACY_SUFFIX, PARQUET_SUFFIX)
+
+
+def canonical_key(stock_ticker, storage_format="csv"):
+    ticker = stock_ticker.strip().upper()
+    return f"{CANONICAL_PREFIX}{ticker}{extension(storage_format)}"
+
+
+def manifest_key(username, company):
+    return f"{username}#{company}{MANIFEST_SUFFIX}"
+
+
+def legacy_key(username, company, storage_format="csv"):
+    return f"{username}#{company}_stock_data{extension(storage_format)}"
+
+
+def company_from_key(username, key):
+    """Returns the company a `<user>#<company>` stock object belongs to, in
+    either the shared (manifest) or the legacy per-user layout, or None if
+    the key is not one of the user's stock objects."""
+    filename = key.split("/")[-1]
+    if not filename.startswith(f"{username}#"):
+        return None
+    for suffix in STOCK_DATA_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[len(username) + 1 : -len(suffix)]
+    return None
+
+
+class SharedPriceStore:
+    """One canonical price file per ticker (`prices/<TICKER>.csv`, or
+    `.parquet` with that storage format), shared by every user who collects
+    it. The object records when it was fetched; a copy fetched after the
+    last market close is served until the next session opens, and during a
+    session it is refreshed every `intraday_ttl` seconds at most. Each user
+    gets a small JSON manifest (`<user>#<company>_stock_data.json`) pointing
+    at the canonical object instead of a private copy of the data."""
+
+    def __init__(
+        self,
+        bucket,
+        get_client,
+        ticker_factory,
+        storage_format="csv",
+        put=None,
+        market_hours=None,
+        intraday_ttl=INTRADAY_TTL,
+        clock=None,
+    ):
+        self.bucket = bucket
+        self.storage_format = storage_format
+        self.market_hours = market_hours or MarketHours()
+        self.intraday_ttl = intraday_ttl
+        self._clock = clock or (lambda: datetime.now(timezone.utc))
+        self._get_client = get_client
+        # put(bucket, key, body, content_type, metadata) -> whether it wrote;
+        # e.g. ChangeDetector.put_if_changed to skip identical uploads.
+        self._put = put or self._put_object
+        self._ticker_factory = ticker_factory
+
+    def is_fresh(self, fetched_at):
+        """Whether a copy fetched at `fetched_at` (as returned by load) can
+        still be served without going back to yfinance."""
+        return self.market_hours.is_fresh(fetched_at, self._clock(), self.intraday_ttl)
+
+    def _key(self, stock_ticker):
+        return canonical_key(stock_ticker, self.storage_format)
+
+    def load(self, stock_ticker):
+        """Returns (history, fetched_at) for a ticker's canonical object, or
+        (None, None) if it has not been collected yet. `fetched_at` is an
+        aware datetime, or None for objects written before it was recorded."""
+        try:
+            obj = self._get_client().get_object(
+                Bucket=self.bucket, Key=self._key(stock_ticker)
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        stored = parse_history(obj["Body"].read(), self.storage_format)
+        fetched_at = obj["Metadata"].get("fetched-at")
+        try:
+            fetched_at = datetime.fromisoformat(fetched_at) if fetched_at else None
+        except ValueError:
+            fetched_at = None
+        return stored, fetched_at
+
+    def _put_object(self, bucket, key, body, content_type, metadata):
+        self._get_client().put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=body,
+            ContentType=content_type,
+            Metadata=metadata,
+        )
+        return True
+
+    def save(self, stock_ticker, hist):
+        """Stores the ticker's history as fetched now. Returns whether the
+        data was written; with a change-detecting `put`, identical data only
+        has its fetch time updated and False is returned."""
+        return self._put(
+            self.bucket,
+            self._key(stock_ticker),
+            encode_frame(hist, self.storage_format),
+            content_type(self.storage_format),
+            {"fetched-at": self._clock().isoformat()},
+        )
+
+    def collect(self, stock_ticker, period="1mo", refresh=False):
+        """Returns (history, written): the ticker's price history, only going
+        to yfinance if the canonical copy is no longer fresh (or `refresh` is
+        set), and whether the canonical object was rewritten."""
+        stored, fetched_at = self.load(stock_ticker)
+        if stored is not None and not refresh and self.is_fresh(fetched_at):
+            return stored, False
+
+        hist = fetch_history(self._ticker_factory(stock_ticker), period, stored)
+        if hist is None or hist.empty:
+            return None, False
+        return hist, self.save(stock_ticker, hist)
+
+    def get_history(self, stock_ticker, period="1mo", refresh=False):
+        return self.collect(stock_ticker, period, refresh)[0]
+
+    def link(self, username, company, stock_ticker):
+        """Points the user's manifest for `company` at the ticker's canonical
+        object and returns the manifest's key. The manifest is written every
+        time (it is tiny), so one deleted behind the service's back is put
+        back by the next collection."""
+        key = manifest_key(username, company)
+
+        manifest = {
+            "company": company,
+            "ticker": stock_ticker,
+            "bucket": self.bucket,
+            "key": self._key(stock_ticker),
+            "linked_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._get_client().put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=json.dumps(manifest),
+            ContentType="application/json",
+        )
+        return key
@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import boto3
+from botocore.config import Config
+
+
+# Refresh this long before the temporary credentials actually expire so that
+# no request ever signs with credentials that are about to lapse.
+REFRESH_MARGIN_SECONDS = 10 * 60
+# Never let the background refresher spin faster than this.
+MIN_REFRESH_INTERVAL_SECONDS = 30
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    tcp_keepalive=True,
+)
+
+
+class AssumedRoleSession:
+    """Process-wide holder for an assumed IAM role.
+
+    The role is assumed once and the temporary credentials are cached until
+    shortly before they expire. Clients built from those credentials are
+    cached per service and handed out to every caller - boto3 clients are
+    thread-safe, so a single pooled client can serve all request threads.
+    A daemon thread re-assumes the role ahead of expiry so that STS is kept
+    off the request path."""
+
+    def __init__(
+        self,
+        role_arn,
+        session_name="AssumeRoleSession1",
+        region_name=None,
+        refresh_margin=REFRESH_MARGIN_SECONDS,
+        sts_client=None,
+        client_factory=None,
+        clock=time.time,
+    ):
+        self.role_arn = role_arn
+        self.session_name = session_name
+        self.region_name = region_name
+        self.refresh_margin = refresh_margin
+        self._sts_client = sts_client
+        self._client_factory = client_factory or boto3.client
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._expires_at = 0.0
+        self._clients = {}
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _assume_role(self):
+        if self._sts_client is None:
+            self._sts_client = boto3.client("sts")
+        response = self._sts_client.assume_role(
+            RoleArn=self.role_arn, RoleSessionName=self.session_name
+        )
+        credentials = response["Credentials"]
+        expiration = credentials["Expiration"]
+        if isinstance(expiration, datetime):
+            if expiration.tzinfo is None:
+                expiration = expiration.replace(tzinfo=timezone.utc)
+            expiration = expiration.timestamp()
+        return credentials, float(expiration)
+
+    def _needs_refresh(self):
+        return (
+            self._credentials is None
+            or self._clock() >= self._expires_at - self.refresh_margin
+        )
+
+    def refresh(self, force=False):
+        """Assumes the role again if the cached credentials are missing or
+        close to expiry (or unconditionally when `force` is set). Any cached
+        clients are dropped so they are rebuilt with the new credentials."""
+        with self._lock:
+            if not force and not self._needs_refresh():
+                return
+            self._credentials, self._expires_at = self._assume_role()
+            self._clients = {}
+
+    def client(self, service_name="s3"):
+        """Returns the shared client for `service_name`, signed with the
+        assumed role's credentials."""
+        if self._needs_refresh():
+            self.refresh()
+
+        with self._lock:
+            client = self._clients.get(service_name)
+            if client is None:
+                credentials = self._credentials
+                client = self._client_factory(
+                    service_name,
+                    aws_access_key_id=credentials["AccessKeyId"],
+                    aws_secret_access_key=credentials["SecretAccessKey"],
+                    aws_session_token=credentials["SessionToken"],
+                    region_name=self.region_name,
+                    config=CLIENT_CONFIG,
+                )
+                self._clients[service_name] = client
+            return client
+
+    def _seconds_until_refresh(self):
+        remaining = self._expires_at - self.refresh_margin - self._clock()
+        return max(remaining, MIN_REFRESH_INTERVAL_SECONDS)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self.refresh()
+            except Exception as e:
+                # The next client() call will retry synchronously if the
+                # credentials really do run out.
+                print(f"Error refreshing assumed role credentials: {e}")
+
+    def start_background_refresh(self):
+        """Assumes the role now and keeps the credentials fresh from a daemon
+        thread. Safe to call more than once. If STS can't be reached the error
+        is logged rather than raised: the thread keeps retrying, and client()
+        still refreshes on demand."""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error assuming role {self.role_arn}: {e}")
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="assume-role-refresh", daemon=True
+            )
+            self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
@@ -0,0 +1,120 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from caches import SqliteStore, TTLCache
+
+
+# Below this many uncached texts a batch is scored in-process; the cost of
+# starting worker processes only pays off for large backfills.
+PROCESS_POOL_THRESHOLD = 2000
+PROCESS_CHUNK_SIZE = 250
+
+_worker_analyzer = None
+
+
+def make_analyzer():
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+    return SentimentIntensityAnalyzer()
+
+
+def _init_worker():
+    global _worker_analyzer
+    _worker_analyzer = make_analyzer()
+
+
+def _score_chunk(texts):
+    return [_worker_analyzer.polarity_scores(text)["compound"] for text in texts]
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SentimentScorer:
+    """Scores texts with VADER's `compound` polarity.
+
+    The same article turns up for many users and companies, so scores are
+    cached by a hash of the text, in memory and optionally in a SQLite file
+    (`db_path`). Batches are deduplicated before scoring, and big enough
+    batches of uncached texts are fanned out over a process pool."""
+
+    def __init__(
+        self,
+        db_path=None,
+        maxsize=50000,
+        process_threshold=PROCESS_POOL_THRESHOLD,
+        max_processes=None,
+    ):
+        self.process_threshold = process_threshold
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self._memory = TTLCache(maxsize=maxsize)
+        self._store = SqliteStore(db_path, "sentiment") if db_path else None
+        self._analyzer = None
+
+    def warm_up(self):
+        """Loads the VADER lexicon (if it isn't already) and returns the
+        analyzer; call it ahead of time to keep the load off the first
+        request."""
+        if self._analyzer is None:
+            self._analyzer = make_analyzer()
+        return self._analyzer
+
+    @property
+    def analyzer(self):
+        return self.warm_up()
+
+    def _score_uncached(self, texts):
+        if len(texts) < self.process_threshold or self.max_processes < 2:
+            return [self.analyzer.polarity_scores(t)["compound"] for t in texts]
+
+        chunks = [
+            texts[i : i + PROCESS_CHUNK_SIZE]
+            for i in range(0, len(texts), PROCESS_CHUNK_SIZE)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=self.max_processes, initializer=_init_worker
+        ) as pool:
+            return [
+                score for chunk in pool.map(_score_chunk, chunks) for score in chunk
+            ]
+
+    def score_many(self, texts):
+        """Returns the compound score of every text, in order."""
+        hashes = [text_hash(text) for text in texts]
+
+        scores = {}
+        for h in set(hashes):
+            score = self._memory.get(h)
+            if score is not None:
+                scores[h] = score
+
+        missing = [h for h in set(hashes) if h not in scores]
+        if missing and self._store:
+            stored = self._store.get_many(missing)
+            for h, score in stored.items():
+                scores[h] = float(score)
+                self._memory.set(h, float(score))
+
+        uncached = {}
+        for h, text in zip(hashes, texts):
+            if h not in scores:
+                uncached.setdefault(h, text)
+
+        if uncached:
+            new_scores = dict(
+                zip(uncached.keys(), self._score_uncached(list(uncached.values())))
+            )
+            for h, score in new_scores.items():
+                scores[h] = score
+                self._memory.set(h, score)
+            if self._store:
+                self._store.set_many(
+                    {h: repr(score) for h, score in new_scores.items()}
+                )
+
+        return [scores[h] for h in hashes]
+
+    def score(self, text):
+        return self.score_many([text])[0]
@@ -0,0 +1,59 @@
+import io
+
+from lazyImport import lazy_import
+
+pd = lazy_import("pandas")
+
+
+# How collected datasets are written to S3. CSV is readable by anything;
+# Parquet (which needs pyarrow) stores typed, compressed columns that the
+# retrieval service can read selectively.
+STORAGE_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+PARQUET_COMPRESSION = "zstd"
+
+
+def check_format(storage_format):
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(
+            f"Unknown storage format {storage_format!r}; "
+            f"expected one of {sorted(STORAGE_FORMATS)}"
+        )
+    return storage_format
+
+
+def extension(storage_format):
+    return STORAGE_FORMATS[storage_format][0]
+
+
+def content_type(storage_format):
+    return STORAGE_FORMATS[storage_format][1]
+
+
+def format_of_key(key):
+    """The storage format an object was written in, going by its extension."""
+    for storage_format, (ext, _) in STORAGE_FORMATS.items():
+        if key.endswith(ext):
+            return storage_format
+    return "csv"
+
+
+def encode_frame(df, storage_format):
+    """Serialises a DataFrame (without its index) to the bytes stored on S3."""
+    if storage_format == "parquet":
+        buffer = io.BytesIO()
+        df.to_parquet(
+            buffer, engine="pyarrow", index=False, compression=PARQUET_COMPRESSION
+        )
+        return buffer.getvalue()
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def decode_frame(data, storage_format, columns=None):
+    """Reads bytes written by encode_frame back into a DataFrame. Only
+    `columns` are decoded when given."""
+    if storage_format == "parquet":
+        return pd.read_parquet(io.BytesIO(data), engine="pyarrow", columns=columns)
+    return pd.read_csv(io.BytesIO(data), usecols=columns, float_precision="round_trip")
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from caches import SqliteStore, TTLCache
+
+
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+REQUEST_TIMEOUT_SECONDS = (3.05, 10)
+# Names Yahoo has no ticker for are remembered in memory only, and not for long.
+NOT_FOUND_TTL = 10 * 60
+
+
+class TickerResolver:
+    """Resolves company names to Yahoo Finance tickers.
+
+    Mappings are kept in an in-memory LRU and, when `db_path` is given, in a
+    small SQLite file so they survive restarts. Lookups that miss both go to
+    the Yahoo search endpoint over a pooled keep-alive session."""
+
+    def __init__(self, db_path=None, maxsize=4096, max_workers=8, session=None):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self._memory = TTLCache(maxsize=maxsize)
+        self._store = SqliteStore(db_path, "ticker_map") if db_path else None
+
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": "Mozilla/5.0"})
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+        self.session = session
+
+    @staticmethod
+    def normalise(company_name):
+        return str(company_name).strip().lower()
+
+    def _search(self, company_name):
+        response = self.session.get(
+            YAHOO_SEARCH_URL,
+            params={"q": company_name},
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        if response.status_code != 200:
+            # Rate limiting and outages are transient, so this is not cached.
+            raise requests.HTTPError(f"Yahoo search returned {response.status_code}")
+
+        for quote in response.json().get("quotes", []):
+            if quote.get("isYahooFinance") and "symbol" in quote:
+                symbol = quote["symbol"]
+                # Strip .MX only, keep all other suffixes (e.g. .KS, .NS, etc.)
+                return symbol.split(".")[0] if symbol.endswith(".MX") else symbol
+        return None
+
+    def resolve(self, company_name):
+        """Returns the ticker for `company_name`, or None when Yahoo does not
+        know it. Network errors are raised to the caller."""
+        key = self.normalise(company_name)
+
+        ticker = self._memory.get(key, "")
+        if ticker != "":
+            return ticker
+
+        ticker = self._store.get(key) if self._store else None
+        if ticker is None:
+            ticker = self._search(company_name)
+            if ticker is None:
+                self._memory.set(key, None, ttl=NOT_FOUND_TTL)
+                return None
+            if self._store:
+                self._store.set(key, ticker)
+
+        self._memory.set(key, ticker)
+        return ticker
+
+    def resolve_many(self, company_names):
+        """Resolves many names at once, returning a dict from each given name
+        to its ticker (None if it could not be resolved). Names that normalise
+        to the same key are only looked up once and uncached ones are searched
+        concurrently."""
+        unique = {}
+        for name in company_names:
+            unique.setdefault(self.normalise(name), name)
+
+        def resolve_quietly(name):
+            try:
+                return self.resolve(name)
+            except Exception as e:
+                print(f"Error resolving ticker for {name}: {e}")
+                return None
+
+        workers = max(1, min(self.max_workers, len(unique)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            resolved = dict(
+                zip(unique.keys(), pool.map(resolve_quietly, unique.values()))
+            )
+
+        return {name: resolved[self.normalise(name)] for name in company_names}
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+from jsonCodec import dumpsBytes
+
+
+def approximateSize(value) -> int:
+    """Rough number of bytes a deserialised dataset takes up, counting the
+    characters of every string in it plus a small overhead per container."""
+    if isinstance(value, str):
+        return len(value) + 1
+    if isinstance(value, dict):
+        return 16 + sum(
+            approximateSize(k) + approximateSize(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return 16 + sum(approximateSize(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class CachedDataset:
+    """A retrieved dataset's events together with their serialised JSON, so
+    responses for the whole dataset do not encode the events again."""
+
+    def __init__(self, events: list):
+        self.events = events
+        self.eventsJson = dumpsBytes(events)
+        self.size = approximateSize(events) + len(self.eventsJson)
+
+
+class DatasetCache:
+    """Thread-safe LRU cache of retrieved datasets, keyed by (username,
+    filename) and bounded by the approximate size of what it holds rather
+    than the number of entries. Entries also expire after `ttl` seconds so a
+    delete served by another instance is picked up eventually."""
+
+    def __init__(self, maxBytes: int, ttl=None, clock=time.monotonic):
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expiresAt = entry
+            if expiresAt is not None and self._clock() >= expiresAt:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=None):
+        size = approximateSize(value) if size is None else size
+        if size > self.maxBytes:
+            return
+        expiresAt = None if self.ttl is None else self._clock() + self.ttl
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, expiresAt)
+            self._bytes += size
+            while self._bytes > self.maxBytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def currentBytes(self) -> int:
+        with self._lock:
+            return self._bytes
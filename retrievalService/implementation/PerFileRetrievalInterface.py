@@ -0,0 +1,186 @@
+from boto3.dynamodb.types import TypeDeserializer
+
+import sys
+
+from botocore.exceptions import ClientError
+
+from exceptions.UserNotFound import UserNotFound
+from exceptions.UserAlreadyExists import UserAlreadyExists
+from exceptions.UserHasFile import UserHasFile
+
+from RetrievalInterface import RetrievalInterface, isConditionFailure
+
+
+# Sort key of the item that records a user has registered. Retrieved files are
+# named <data_type>_<stock> or <stock>, so they can never collide with it.
+USER_RECORD = "#user"
+
+
+class PerFileRetrievalInterface(RetrievalInterface):
+    """RetrievalInterface over the normalised table layout: one item per
+    (username, filename), with username as the partition key and filename as
+    the sort key. Each user also has a USER_RECORD item written when they
+    register. Lookups and deletes touch a single small item and listing is
+    a query over the user's keys, so nothing scales with how many files the
+    user has retrieved."""
+
+    def _userExists(self, dynamodb, username: str, tableName: str) -> bool:
+        response = dynamodb.get_item(
+            TableName=tableName,
+            Key={"username": {"S": username}, "filename": {"S": USER_RECORD}},
+            ProjectionExpression="username",
+        )
+        return "Item" in response
+
+    def _requireUser(self, dynamodb, username: str, tableName: str):
+        if not self._userExists(dynamodb, username, tableName):
+            raise UserNotFound("Username not found - ensure you have registered")
+
+    def register(self, username, tableName) -> str:
+        dynamodb = self.dynamodb
+        try:
+            dynamodb.put_item(
+                TableName=tableName,
+                Item={"username": {"S": username}, "filename": {"S": USER_RECORD}},
+                ConditionExpression="attribute_not_exists(username)",
+            )
+        except ClientError as e:
+            if isConditionFailure(e):
+                raise UserAlreadyExists(
+                    "User already exists, cannot register this username"
+                )
+            sys.stderr.write(
+                f"""(PerFileRetrievalInterface.register) Client (DynamoDB)
+                Error: {e.response["Error"]["Code"]}\n"""
+            )
+            raise
+
+    def hasFile(self, fileName: str, username: str, tableName: str) -> bool:
+        dynamodb = self.dynamodb
+        response = dynamodb.get_item(
+            TableName=tableName,
+            Key={"username": {"S": username}, "filename": {"S": fileName}},
+            ProjectionExpression="filename",
+        )
+        if "Item" in response:
+            return True
+        self._requireUser(dynamodb, username, tableName)
+        return False
+
+    def getFileFromDynamo(self, fileName: str, username: str, tableName: str):
+        """Same contract as RetrievalInterface.getFileFromDynamo. Files are
+        separate items here, so the index of a found file is always 0."""
+        dynamodb = self.dynamodb
+
+        try:
+            response = dynamodb.get_item(
+                TableName=tableName,
+                Key={"username": {"S": username}, "filename": {"S": fileName}},
+                ProjectionExpression="content",
+            )
+
+            item = response.get("Item")
+            if item:
+                return (True, TypeDeserializer().deserialize(item["content"]), 0)
+
+            self._requireUser(dynamodb, username, tableName)
+            return (False, None, -1)
+
+        except ClientError as e:
+            sys.stderr.write(
+                f"""(PerFileRetrievalInterface.getFileFromDynamo) Client (DynamoDB)
+                Error: {e.response["Error"]["Code"]}\n"""
+            )
+            raise
+
+    def _storeFile(self, new_object: dict, username: str, tableName: str):
+        """Writes the file's item in one transaction that also checks the user
+        is registered, so neither check needs its own round trip."""
+        try:
+            self.dynamodb.transact_write_items(
+                TransactItems=[
+                    {
+                        "ConditionCheck": {
+                            "TableName": tableName,
+                            "Key": {
+                                "username": {"S": username},
+                                "filename": {"S": USER_RECORD},
+                            },
+                            "ConditionExpression": "attribute_exists(username)",
+                        }
+                    },
+                    {
+                        "Put": {
+                            "TableName": tableName,
+                            "Item": {"username": {"S": username}, **new_object},
+                            "ConditionExpression": "attribute_not_exists(filename)",
+                        }
+                    },
+                ]
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            # One reason per transaction item: the user check, then the put.
+            reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+            if reasons[:1] == ["ConditionalCheckFailed"]:
+                raise UserNotFound("Username not found - ensure you have registered")
+            if reasons[1:2] == ["ConditionalCheckFailed"]:
+                raise UserHasFile(
+                    "User already have a file with this name; refusing to push it again"
+                )
+            raise
+
+    def deleteFromDynamo(self, fileName: str, username: str, tableName):
+        dynamodb = self.dynamodb
+
+        try:
+            dynamodb.delete_item(
+                TableName=tableName,
+                Key={"username": {"S": username}, "filename": {"S": fileName}},
+                ConditionExpression="attribute_exists(filename)",
+            )
+            return True
+        except ClientError as e:
+            if isConditionFailure(e):
+                self._requireUser(dynamodb, username, tableName)
+                raise FileNotFoundError(
+                    "Attempting to delete a file that you have never retrieved"
+                )
+            sys.stderr.write(
+                f"""(PerFileRetrievalInterface.deleteFromDynamo) Client (DynamoDB)
+                Error: {e.response["Error"]["Code"]}\n"""
+            )
+            raise
+
+    def listUserFiles(self, username: str, tableName: str):
+        dynamodb = self.dynamodb
+        try:
+            paginator = dynamodb.get_paginator("query")
+            fileNames = []
+            registered = False
+            for page in paginator.paginate(
+                TableName=tableName,
+                KeyConditionExpression="username = :username",
+                ExpressionAttributeValues={":username": {"S": username}},
+                ProjectionExpression="filename",
+            ):
+                for item in page.get("Items", []):
+                    fileName = item["filename"]["S"]
+                    if fileName == USER_RECORD:
+                        registered = True
+                    else:
+                        fileNames.append(fileName)
+
+            if not registered:
+                raise UserNotFound(
+                    "User does not seem to exist, ensure you have registered"
+                )
+            return fileNames
+
+        except Exception as e:
+            sys.stderr.write(
+                f"""(PerFileRetrievalInterface.listUserFiles)
+                Error: {e}\n"""
+            )
+            raise
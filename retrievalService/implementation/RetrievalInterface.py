@@ -1,6 +1,6 @@
-import boto3
 from boto3.dynamodb.types import TypeDeserializer
-import csv
+import io
+import json
 
 import sys
 
@@ -12,31 +12,61 @@ from exceptions.UserNotFound import UserNotFound
 from exceptions.UserAlreadyExists import UserAlreadyExists
 from exceptions.UserHasFile import UserHasFile
 
-from RetrievalMicroserviceHelpers import createDynamoDBContentList
+from awsClients import getDynamoDBClient, getS3Client
+from RetrievalMicroserviceHelpers import (
+    createDynamoDBContentList,
+    getS3FileName,
+    getS3ManifestFileName,
+    isParquetKey,
+    iterDynamoDBContent,
+    iterParquetContent,
+)
+
+
+# Conditional list updates retry this many times if the list changed between
+# reading its file names and writing.
+CONDITIONAL_WRITE_ATTEMPTS = 3
+
+
+def isConditionFailure(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] == "ConditionalCheckFailedException"
 
 
 class RetrievalInterface:
+    def __init__(self, dynamodb=None, s3=None, storageFormat="csv"):
+        """Clients may be injected (e.g. for tests); by default the process-wide
+        pooled clients from awsClients are used. storageFormat is the format
+        ("csv" or "parquet") the collection service writes per-user files in."""
+        self._dynamodb = dynamodb
+        self._s3 = s3
+        self.storageFormat = storageFormat
+
+    @property
+    def dynamodb(self):
+        return self._dynamodb or getDynamoDBClient()
+
+    @property
+    def s3(self):
+        return self._s3 or getS3Client()
+
     def register(self, username, tableName) -> str:
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        dynamodb = self.dynamodb
         try:
-            response = dynamodb.get_item(
-                TableName=tableName, Key={"username": {"S": username}}
-            )
-
-            if response.get("Item"):
-                raise UserAlreadyExists(
-                    "User already exists, cannot register this username"
-                )
-
-            response = dynamodb.put_item(
+            dynamodb.put_item(
                 TableName=tableName,
                 Item={
                     "username": {"S": username},
                     "retrievedFiles": {"L": []},
+                    "fileNames": {"L": []},
                 },
+                ConditionExpression="attribute_not_exists(username)",
             )
 
         except ClientError as e:
+            if isConditionFailure(e):
+                raise UserAlreadyExists(
+                    "User already exists, cannot register this username"
+                )
             sys.stderr.write(
                 f"""(Retrieval Interface.register) Client (DynamoDB)
                 Error: {e.response["Error"]["Code"]}\n"""
@@ -48,7 +78,7 @@ class RetrievalInterface:
         Will return the content of that file as a string.
         This method should be called by a IAM user who has access
         to at least read from the s3 bucket."""
-        s3_client = boto3.client(service_name="s3")
+        s3_client = self.s3
 
         try:
             response = s3_client.get_object(Bucket=bucketName, Key=fileNameOnS3)
@@ -62,6 +92,123 @@ class RetrievalInterface:
             )
             raise
 
+    def pullStream(self, bucketName: str, fileNameOnS3: str):
+        """Like pull, but returns a text stream over the object instead of
+        reading it all into a string, for callers that can consume it
+        incrementally (e.g. iterDynamoDBContent). Close it when done."""
+        try:
+            response = self.s3.get_object(Bucket=bucketName, Key=fileNameOnS3)
+            return io.TextIOWrapper(response["Body"], encoding="utf-8", newline="")
+
+        except ClientError as e:
+            sys.stderr.write(
+                f"""(Retrieval Interface.pullStream) Client (S3)
+                Error: {e.response["Error"]["Code"]}\n"""
+            )
+            raise
+
+    def pullContentList(
+        self, bucketName: str, fileNameOnS3: str, dataSrc: str, stockname: str
+    ) -> list:
+        """Pulls a collected dataset from S3 and converts it to the DynamoDB
+        content list stored for it. Parquet objects are read as such, decoding
+        only the columns the events need; anything else is streamed as CSV."""
+        if not isParquetKey(fileNameOnS3):
+            with self.pullStream(bucketName, fileNameOnS3) as csvFile:
+                return list(iterDynamoDBContent(dataSrc, stockname, csvFile))
+
+        try:
+            response = self.s3.get_object(Bucket=bucketName, Key=fileNameOnS3)
+        except ClientError as e:
+            sys.stderr.write(
+                f"""(Retrieval Interface.pullContentList) Client (S3)
+                Error: {e.response["Error"]["Code"]}\n"""
+            )
+            raise
+        # Parquet is read from its footer backwards, so it needs a seekable file
+        parquetFile = io.BytesIO(response["Body"].read())
+        return list(iterParquetContent(dataSrc, stockname, parquetFile))
+
+    def _exists(self, bucketName: str, fileNameOnS3: str) -> bool:
+        try:
+            self.s3.head_object(Bucket=bucketName, Key=fileNameOnS3)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def resolveS3FileName(
+        self, bucketName: str, username: str, dataType: str, stockname: str, date
+    ) -> tuple:
+        """Works out where a user's collected file lives on S3, returning a
+        (bucketName, key) tuple. Finance data is normally a manifest pointing
+        at the shared per-ticker price file; users who collected before the
+        shared store existed still have their own CSV (or Parquet file, which
+        is looked for first when that is the configured storage format)."""
+        if dataType == "finance":
+            try:
+                manifest = json.loads(
+                    self.pull(bucketName, getS3ManifestFileName(username, stockname))
+                )
+                return manifest.get("bucket", bucketName), manifest["key"]
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "NoSuchKey":
+                    raise
+
+        if self.storageFormat == "parquet":
+            parquetName = getS3FileName(username, dataType, stockname, date, "parquet")
+            if self._exists(bucketName, parquetName):
+                return bucketName, parquetName
+
+        return bucketName, getS3FileName(username, dataType, stockname, date)
+
+    def _fileNames(self, dynamodb, username: str, tableName: str) -> list:
+        """Returns the names of the user's retrieved files, in the same order
+        as the retrievedFiles list, reading only the small fileNames attribute.
+        Items written before fileNames existed have it built from their
+        retrievedFiles the first time they are read."""
+        response = dynamodb.get_item(
+            TableName=tableName,
+            Key={"username": {"S": username}},
+            ProjectionExpression="username, fileNames",
+        )
+
+        userInfo = response.get("Item")
+        if not userInfo:
+            raise UserNotFound("Username not found - ensure you have registered")
+
+        if "fileNames" in userInfo:
+            return [name["S"] for name in userInfo["fileNames"]["L"]]
+
+        response = dynamodb.get_item(
+            TableName=tableName,
+            Key={"username": {"S": username}},
+            ProjectionExpression="retrievedFiles",
+        )
+        files = response.get("Item", {}).get("retrievedFiles", {}).get("L", [])
+        fileNames = [f["M"]["filename"]["S"] for f in files]
+        try:
+            dynamodb.update_item(
+                TableName=tableName,
+                Key={"username": {"S": username}},
+                UpdateExpression="SET fileNames = :names",
+                ConditionExpression="attribute_not_exists(fileNames)",
+                ExpressionAttributeValues={
+                    ":names": {"L": [{"S": name} for name in fileNames]}
+                },
+            )
+        except ClientError as e:
+            if not isConditionFailure(e):
+                raise
+        return fileNames
+
+    def hasFile(self, fileName: str, username: str, tableName: str) -> bool:
+        """Whether the user has already retrieved a file with this name,
+        without reading any file content."""
+        dynamodb = self.dynamodb
+        return fileName in self._fileNames(dynamodb, username, tableName)
+
     def getFileFromDynamo(self, fileName: str, username: str, tableName: str):
         """Looks for a user's file in the DynamoDB structure. Returns a tuple of
         size three of the form (bool, str|None, int). If the bool value is true,
@@ -71,27 +218,37 @@ class RetrievalInterface:
         user's retrieved files. If the file is not found, then the boolean value
         will be false, the second value will be None and the integer will be -1."""
 
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        dynamodb = self.dynamodb
 
         try:
+            fileNames = self._fileNames(dynamodb, username, tableName)
+            if fileName not in fileNames:
+                return (False, None, -1)
+
+            # Only the one file is read back rather than the whole list.
+            i = fileNames.index(fileName)
             response = dynamodb.get_item(
-                TableName=tableName, Key={"username": {"S": username}}
+                TableName=tableName,
+                Key={"username": {"S": username}},
+                ProjectionExpression=f"retrievedFiles[{i}]",
             )
+            files = response.get("Item", {}).get("retrievedFiles", {}).get("L", [])
+            if files and files[0]["M"]["filename"]["S"] == fileName:
+                deserializer = TypeDeserializer()
+                return (True, deserializer.deserialize(files[0]["M"]["content"]), i)
 
-            userInfo = response.get("Item")
-            if not userInfo:
-                raise UserNotFound("Username not found - ensure you have registered")
-
+            # The list changed between the two reads; look through all of it.
+            response = dynamodb.get_item(
+                TableName=tableName,
+                Key={"username": {"S": username}},
+                ProjectionExpression="retrievedFiles",
+            )
             deserializer = TypeDeserializer()
-            unmarshalledItem = {
-                k: deserializer.deserialize(v) for k, v in response["Item"].items()
-            }
-
-            files = unmarshalledItem.get("retrievedFiles")
-
+            files = deserializer.deserialize(
+                response.get("Item", {}).get("retrievedFiles", {"L": []})
+            )
             for i, f in enumerate(files):
-                file = f.get("filename")
-                if file == fileName:
+                if f.get("filename") == fileName:
                     return (True, f.get("content"), i)
 
             return (False, None, -1)
@@ -103,43 +260,59 @@ class RetrievalInterface:
             )
             raise
 
+    def _storeFile(self, new_object: dict, username: str, tableName: str):
+        """Appends a new file item (a DynamoDB map with filename, stockName and
+        content) to the user's retrieved files, refusing duplicates. The
+        duplicate check is part of the write, so concurrent pushes of the
+        same file cannot both succeed."""
+        dynamodb = self.dynamodb
+
+        fileName = new_object["filename"]["S"]
+        for attempt in range(CONDITIONAL_WRITE_ATTEMPTS):
+            try:
+                dynamodb.update_item(
+                    TableName=tableName,
+                    Key={"username": {"S": username}},
+                    UpdateExpression="""SET retrievedFiles =
+                        list_append(if_not_exists(retrievedFiles, :empty_list), :new_values),
+                        fileNames = list_append(fileNames, :new_names)""",
+                    ConditionExpression="attribute_exists(fileNames) AND NOT contains(fileNames, :name)",
+                    ExpressionAttributeValues={
+                        ":new_values": {"L": [{"M": new_object}]},
+                        ":new_names": {"L": [{"S": fileName}]},
+                        ":empty_list": {"L": []},
+                        ":name": {"S": fileName},
+                    },
+                )
+                return
+            except ClientError as e:
+                if not isConditionFailure(e):
+                    raise
+
+            # Work out why the write was refused from the file names alone.
+            # Reading them also builds fileNames for users written before it
+            # existed, after which the write can be retried.
+            if fileName in self._fileNames(dynamodb, username, tableName):
+                raise UserHasFile(
+                    "User already have a file with this name; refusing to push it again"
+                )
+
+        raise RuntimeError(f"Could not store {fileName} for {username}")
+
     # Pushes a file and its content to dynamoDB
     def pushToDynamo(
-        self, fileName: str, fileContent: str, username: str, tableName: str
+        self,
+        fileName: str,
+        fileContent: str,
+        username: str,
+        tableName: str,
+        contentList: list = None,
     ):
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
-
-        reader = csv.DictReader(fileContent.split("\n"), delimiter=",")
-
-        contentList = []
-        for line in list(reader):
-            # if we have a blank line (especially at the ned of a file)
-            if line == "":
-                continue
-            date = line.get("Date")
-            closeVal = line.get("Close")
-
-            contentList.append(
-                {
-                    "M": {
-                        "attribute": {
-                            "M": {
-                                "close": {"S": closeVal},
-                                "stock_name": {"S": fileName},
-                            }
-                        },
-                        "event-type": {"S": "stock-ohlc"},
-                        "time_object": {
-                            "M": {
-                                "duration": {"S": "0"},
-                                "duration-unit": {"S": "days"},
-                                "time-stamp": {"S": date},
-                                "time-zone": {"S": "GMT+11"},
-                            }
-                        },
-                    }
-                }
-            )
+        """Pushes a stock file and its content to dynamoDB. Callers that have
+        already converted the content with createDynamoDBContentList can pass
+        the result as contentList to save converting it twice."""
+        if contentList is None:
+            contentList = createDynamoDBContentList("finance", fileName, fileContent)
 
         new_object = {
             "stockName": {
@@ -150,24 +323,7 @@ class RetrievalInterface:
         }
 
         try:
-            found, file, index = self.getFileFromDynamo(fileName, username, tableName)
-            if found:
-                raise UserHasFile(
-                    "User already have a file with this name; refusing to push it again"
-                )
-
-            dynamodb.update_item(
-                TableName=tableName,
-                Key={"username": {"S": username}},
-                UpdateExpression="""SET retrievedFiles =
-                    list_append(if_not_exists(retrievedFiles, :empty_list), :new_values)""",
-                ExpressionAttributeValues={
-                    ":new_values": {"L": [{"M": new_object}]},
-                    ":empty_list": {"L": []},
-                },
-                ReturnValues="UPDATED_NEW",
-            )
-
+            self._storeFile(new_object, username, tableName)
             return True
         except ClientError as e:
             sys.stderr.write(
@@ -182,7 +338,7 @@ class RetrievalInterface:
             raise
 
     def deleteOne(self, bucketName: str, fileNameOnS3: str) -> bool:
-        s3_client = boto3.client("s3")
+        s3_client = self.s3
         try:
             s3_client.delete_object(Bucket=bucketName, Key=fileNameOnS3)
             return True
@@ -190,53 +346,53 @@ class RetrievalInterface:
             raise
 
     def deleteFromDynamo(self, fileName: str, username: str, tableName):
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
-
-        found, file, fileIndex = self.getFileFromDynamo(fileName, username, tableName)
-        if not found:
-            raise FileNotFoundError(
-                "Attempting to delete a file that you have never retrieved"
-            )
+        """Removes a file from the user's retrieved files. This is still a
+        read of the fileNames index followed by a conditional write, not a
+        single round trip: the entry's position has to be looked up first.
+        The write only goes through if both fileNames and retrievedFiles
+        still hold this file at that position, so an index that has drifted
+        from the file list (e.g. an older task changed retrievedFiles alone)
+        never causes another file to be removed."""
+        dynamodb = self.dynamodb
+
+        for attempt in range(CONDITIONAL_WRITE_ATTEMPTS):
+            fileNames = self._fileNames(dynamodb, username, tableName)
+            if fileName not in fileNames:
+                raise FileNotFoundError(
+                    "Attempting to delete a file that you have never retrieved"
+                )
+            fileIndex = fileNames.index(fileName)
+
+            try:
+                # Only remove the entry if it is still the file we looked up,
+                # in case another request changed the list in the meantime.
+                dynamodb.update_item(
+                    TableName=tableName,
+                    Key={"username": {"S": username}},
+                    UpdateExpression=f"REMOVE retrievedFiles [{fileIndex}], fileNames [{fileIndex}]",
+                    ConditionExpression=(
+                        f"fileNames[{fileIndex}] = :name "
+                        f"AND retrievedFiles[{fileIndex}].filename = :name"
+                    ),
+                    ExpressionAttributeValues={":name": {"S": fileName}},
+                )
 
-        try:
-            dynamodb.update_item(
-                TableName=tableName,
-                Key={"username": {"S": username}},
-                UpdateExpression=f"REMOVE retrievedFiles [{fileIndex}]",
-                ReturnValues="UPDATED_NEW",
-            )
+                return True
+            except ClientError as e:
+                if isConditionFailure(e):
+                    continue
+                sys.stderr.write(
+                    f"""(Retrieval Interface.deleteFromDynamo) Client (DynamoDB)
+                    Error: {e.response["Error"]["Code"]}\n"""
+                )
+                raise
 
-            return True
-        except ClientError as e:
-            sys.stderr.write(
-                f"""(Retrieval Interface.deleteFromDynamo) Client (DynamoDB)
-                Error: {e.response["Error"]["Code"]}\n"""
-            )
-            raise
-        except Exception:
-            raise
+        raise RuntimeError(f"Could not delete {fileName} for {username}")
 
     def listUserFiles(self, username: str, tableName: str):
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        dynamodb = self.dynamodb
         try:
-            response = dynamodb.get_item(
-                TableName=tableName, Key={"username": {"S": username}}
-            )
-
-            if response.get("Item", None) is None:
-                raise UserNotFound(
-                    "User does not seem to exist, ensure you have registered"
-                )
-
-            deserializer = TypeDeserializer()
-            unmarshalledItem = {
-                k: deserializer.deserialize(v) for k, v in response["Item"].items()
-            }
-
-            return [
-                stock.get("filename")
-                for stock in unmarshalledItem.get("retrievedFiles")
-            ]
+            return self._fileNames(dynamodb, username, tableName)
 
         except Exception as e:
             sys.stderr.write(
@@ -252,14 +408,15 @@ class RetrievalInterface:
         fileContent: str,
         username: str,
         tableName: str,
+        contentList: list = None,
     ):
         """Redoing the push method to dynamodb to account for having different data types (finance and news at
         the moment). The key difference will be the filename that is associated with a pushed file will include
-        the type of data. The format of the filename will be <data_type>_<stock_name>."""
+        the type of data. The format of the filename will be <data_type>_<stock_name>.
+        As with pushToDynamo, an already converted contentList may be passed in."""
 
-        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
-
-        contentList = createDynamoDBContentList(data_src, stockName, fileContent)
+        if contentList is None:
+            contentList = createDynamoDBContentList(data_src, stockName, fileContent)
 
         fileName = f"{data_src}_{stockName}"
 
@@ -270,24 +427,7 @@ class RetrievalInterface:
         }
 
         try:
-            found, file, index = self.getFileFromDynamo(fileName, username, tableName)
-            if found:
-                raise UserHasFile(
-                    "User already have a file with this name; refusing to push it again"
-                )
-
-            dynamodb.update_item(
-                TableName=tableName,
-                Key={"username": {"S": username}},
-                UpdateExpression="""SET retrievedFiles =
-                    list_append(if_not_exists(retrievedFiles, :empty_list), :new_values)""",
-                ExpressionAttributeValues={
-                    ":new_values": {"L": [{"M": new_object}]},
-                    ":empty_list": {"L": []},
-                },
-                ReturnValues="UPDATED_NEW",
-            )
-
+            self._storeFile(new_object, username, tableName)
             return True
         except ClientError as e:
             sys.stderr.write(
@@ -1,35 +1,101 @@
-from flask import Flask, request
+from flask import Flask, Response, request
 from botocore.exceptions import ClientError
 from RetrievalInterface import RetrievalInterface
+from PerFileRetrievalInterface import PerFileRetrievalInterface
 
 from RetrievalMicroserviceHelpers import (
     getTableNameFromKey,
-    getS3FileName,
     adageFormatter,
+    adageHeader,
+    adageTimestamp,
+    adageColumnarFormatter,
+    adageNdjsonFormatter,
     validateDataSrc,
+    deserializeContentList,
+    parseEventQuery,
+    selectEvents,
 )
+from DatasetCache import CachedDataset, DatasetCache
+from jsonCodec import dumps, spliceEvents
+from responseCompression import compressResponse
 from flask_cors import CORS
 
-# import sys
-from datetime import datetime
-from pytz import timezone
-
 import json
+import os
 
 from exceptions.UserNotFound import UserNotFound
 from exceptions.UserAlreadyExists import UserAlreadyExists
 from exceptions.InvalidDataKey import InvalidDataKey
-
-
-# from exceptions.UserHasFile import UserHasFile
+from exceptions.InvalidQueryParameter import InvalidQueryParameter
+from exceptions.UserHasFile import UserHasFile
 
 app = Flask(__name__)
 
 CORS(app)
 
 
+@app.after_request
+def compress(response):
+    return compressResponse(response, request.accept_encodings)
+
+
 AWS_S3_BUCKET_NAME = "seng3011-omega-25t1-testing-bucket"
-DYNAMO_DB_NAME = "seng3011-test-dynamodb"
+DYNAMO_DB_NAME = os.environ.get("DYNAMO_DB_NAME", "seng3011-test-dynamodb")
+# "legacy" keeps all of a user's files on one item; "per_file" stores one item
+# per (username, filename) in a table created by migrateDynamoLayout.py.
+DYNAMO_LAYOUT = os.environ.get("DYNAMO_LAYOUT", "legacy")
+
+
+# Retrieved datasets never change once stored, so hot ones are served from
+# memory. The TTL bounds how long a delete made through another instance can
+# go unnoticed.
+DATASET_CACHE_BYTES = int(os.environ.get("DATASET_CACHE_BYTES", 64 * 1024 * 1024))
+DATASET_CACHE_TTL = int(os.environ.get("DATASET_CACHE_TTL", 300))
+datasetCache = DatasetCache(DATASET_CACHE_BYTES, ttl=DATASET_CACHE_TTL)
+
+
+# "csv" or "parquet"; should match the collection service's STORAGE_FORMAT so
+# per-user Parquet files are looked for first. Shared price files are found
+# through their manifests whatever the setting.
+STORAGE_FORMAT = os.environ.get("STORAGE_FORMAT", "csv")
+
+
+# The interfaces hold no per-request state, so every request shares them (and
+# through them the pooled AWS clients).
+_retrievalInterfaces = {
+    "legacy": RetrievalInterface(storageFormat=STORAGE_FORMAT),
+    "per_file": PerFileRetrievalInterface(storageFormat=STORAGE_FORMAT),
+}
+
+
+def getRetrievalInterface():
+    return _retrievalInterfaces.get(DYNAMO_LAYOUT, _retrievalInterfaces["legacy"])
+
+
+# /v2/retrieve response formats: name (for ?format=) -> (mimetype, formatter)
+RESPONSE_FORMATS = {
+    "adage": ("application/json", adageFormatter),
+    "columnar": ("application/vnd.adage.columnar+json", adageColumnarFormatter),
+    "ndjson": ("application/x-ndjson", adageNdjsonFormatter),
+}
+
+
+def getResponseFormat():
+    """Picks a response format from the format query parameter or, failing
+    that, the Accept header. Plain ADAGE JSON is the default."""
+    name = request.args.get("format")
+    if name:
+        if name not in RESPONSE_FORMATS:
+            raise InvalidQueryParameter(
+                f"format must be one of {sorted(RESPONSE_FORMATS)}, got {name}"
+            )
+        return name
+
+    mimetypes = {mimetype: name for name, (mimetype, _) in RESPONSE_FORMATS.items()}
+    best = request.accept_mimetypes.best_match(
+        list(mimetypes), default="application/json"
+    )
+    return mimetypes[best]
 
 
 @app.route("/", methods=["GET"])
@@ -40,7 +106,7 @@ def home():
 @app.route("/v1/register/", methods=["POST"])
 def register():
     username = request.get_json()["username"]
-    retrievalInterface = RetrievalInterface()
+    retrievalInterface = getRetrievalInterface()
     username = username.strip().lower()
     try:
         retrievalInterface.register(username, DYNAMO_DB_NAME)
@@ -59,55 +125,48 @@ def register():
 @app.route("/v1/retrieve/<username>/<stockname>/", methods=["GET"])
 def retrieve(username: str, stockname: str):
     username = username.strip().lower()
-    retrievalInterface = RetrievalInterface()
-    filenameS3 = f"{username}#{stockname}_stock_data.csv"  # need to think about Rakshil's file formatting here
+    retrievalInterface = getRetrievalInterface()
     try:
-        found, content, index = retrievalInterface.getFileFromDynamo(
-            stockname, username, DYNAMO_DB_NAME
-        )
-
-        if found:
-            return (
-                json.dumps(
-                    {
-                        "data_source": "yahoo_finance",
-                        "dataset_type": "Daily stock data",
-                        "dataset_id": "https://seng3011-omega-25t1-testing-bucket.s3-ap-southeast-2-amazonaws.com",
-                        "time_object": {
-                            "timestamp": f"{str(datetime.now(timezone('Australia/Sydney'))).split('+')[0]}",
-                            "timezone": "GMT+11",
-                        },
-                        "stock_name": stockname,
-                        "events": content,
-                    }
-                ),
-                200,
-            )
-        else:
-            content = retrievalInterface.pull(AWS_S3_BUCKET_NAME, f"{filenameS3}")
-            # need to format Rakshil's S3 content format into DynamoDB content
-            retrievalInterface.pushToDynamo(
-                stockname, content, username, DYNAMO_DB_NAME
-            )
+        cacheKey = (username, stockname)
+        dataset = datasetCache.get(cacheKey)
+        if dataset is None:
             found, content, index = retrievalInterface.getFileFromDynamo(
                 stockname, username, DYNAMO_DB_NAME
             )
-            return (
-                json.dumps(
-                    {
-                        "data_source": "yahoo_finance",
-                        "dataset_type": "Daily stock data",
-                        "dataset_id": "https://seng3011-omega-25t1-testing-bucket.s3-ap-southeast-2-amazonaws.com",
-                        "time_object": {
-                            "timestamp": f"{str(datetime.now(timezone('Australia/Sydney'))).split('+')[0]}",
-                            "timezone": "GMT+11",
-                        },
-                        "stock_name": stockname,
-                        "events": content,
-                    }
-                ),
-                200,
-            )
+            if not found:
+                bucketS3, filenameS3 = retrievalInterface.resolveS3FileName(
+                    AWS_S3_BUCKET_NAME, username, "finance", stockname, None
+                )
+                # need to format Rakshil's S3 content format into DynamoDB content
+                contentList = retrievalInterface.pullContentList(
+                    bucketS3, filenameS3, "finance", stockname
+                )
+                try:
+                    retrievalInterface.pushToDynamo(
+                        stockname,
+                        None,
+                        username,
+                        DYNAMO_DB_NAME,
+                        contentList=contentList,
+                    )
+                except UserHasFile:
+                    # a concurrent request stored the same file first
+                    pass
+                content = deserializeContentList(contentList)
+            dataset = CachedDataset(content)
+            datasetCache.set(cacheKey, dataset, size=dataset.size)
+
+        header = {
+            "data_source": "yahoo_finance",
+            "dataset_type": "Daily stock data",
+            "dataset_id": "https://seng3011-omega-25t1-testing-bucket.s3-ap-southeast-2-amazonaws.com",
+            "time_object": {
+                "timestamp": adageTimestamp(),
+                "timezone": "GMT+11",
+            },
+            "stock_name": stockname,
+        }
+        return spliceEvents(header, dataset.eventsJson), 200
     except ClientError as e:
         if e.response["Error"]["Code"] == "NoSuchKey":
             return (
@@ -137,11 +196,12 @@ def retrieve(username: str, stockname: str):
 
 @app.route("/v1/delete/<username>/<filename>/", methods=["DELETE"])
 def delete(username: str, filename: str):
-    retrievalInterface = RetrievalInterface()
+    retrievalInterface = getRetrievalInterface()
     try:
         username = username.strip().lower()
         # delete from dynamodb
         retrievalInterface.deleteFromDynamo(filename, username, DYNAMO_DB_NAME)
+        datasetCache.invalidate((username, filename))
         return json.dumps({"Success": f"Deleted {filename}"})
     except FileNotFoundError:
         return json.dumps(
@@ -163,7 +223,7 @@ def delete(username: str, filename: str):
 
 @app.route("/v1/list/<username>/", methods=["GET"])
 def getAll(username: str):
-    retrievalInterface = RetrievalInterface()
+    retrievalInterface = getRetrievalInterface()
     try:
         username = username.strip().lower()
         return json.dumps(
@@ -186,37 +246,63 @@ def retrieveV2(username, data_type, stockname):
     try:
         validateDataSrc(data_type)
         username = username.strip().lower()
-        retrievalInterface = RetrievalInterface()
+        retrievalInterface = getRetrievalInterface()
         s3BucketName = getTableNameFromKey(data_type)
         date = request.args.get("date")
+        query = parseEventQuery(request.args)
+        responseFormat = getResponseFormat()
 
-        filenameS3 = getS3FileName(
-            username, data_type, stockname, date
-        )  # getFileName(username, data_type, stockname)
         filenameDynamo = f"{data_type}_{stockname}"
-        found, content, index = retrievalInterface.getFileFromDynamo(
-            filenameDynamo, username, DYNAMO_DB_NAME
-        )
-
-        if found:
-            return (
-                json.dumps(adageFormatter(s3BucketName, stockname, content, data_type)),
-                200,
-            )
-        else:
-            content = retrievalInterface.pull(s3BucketName, f"{filenameS3}")
-            retrievalInterface.pushToDynamoV2(
-                data_type, stockname, content, username, DYNAMO_DB_NAME
-            )
-
+        cacheKey = (username, filenameDynamo)
+        dataset = datasetCache.get(cacheKey)
+        if dataset is None:
             found, content, index = retrievalInterface.getFileFromDynamo(
                 filenameDynamo, username, DYNAMO_DB_NAME
             )
+            if not found:
+                bucketS3, filenameS3 = retrievalInterface.resolveS3FileName(
+                    s3BucketName, username, data_type, stockname, date
+                )
+                contentList = retrievalInterface.pullContentList(
+                    bucketS3, filenameS3, data_type, stockname
+                )
+                try:
+                    retrievalInterface.pushToDynamoV2(
+                        data_type,
+                        stockname,
+                        None,
+                        username,
+                        DYNAMO_DB_NAME,
+                        contentList=contentList,
+                    )
+                except UserHasFile:
+                    # a concurrent request stored the same file first
+                    pass
+                content = deserializeContentList(contentList)
+            dataset = CachedDataset(content)
+            datasetCache.set(cacheKey, dataset, size=dataset.size)
 
-            return (
-                json.dumps(adageFormatter(s3BucketName, stockname, content, data_type)),
-                200,
-            )
+        events, nextCursor = selectEvents(dataset.events, **query)
+        if responseFormat == "adage" and events is dataset.events:
+            # the whole dataset was asked for, so its cached JSON can be used
+            header = adageHeader(s3BucketName, stockname, data_type)
+            return spliceEvents(header, dataset.eventsJson), 200
+
+        mimetype, formatter = RESPONSE_FORMATS[responseFormat]
+        response = formatter(s3BucketName, stockname, events, data_type)
+
+        headers = {}
+        if nextCursor is not None:
+            if responseFormat == "ndjson":
+                headers["X-Next-Cursor"] = str(nextCursor)
+            else:
+                response["next_cursor"] = nextCursor
+
+        if responseFormat == "adage":
+            return dumps(response), 200
+        if responseFormat != "ndjson":
+            response = dumps(response)
+        return Response(response, status=200, mimetype=mimetype, headers=headers)
     except ClientError as e:
         if e.response["Error"]["Code"] == "NoSuchKey":
             return (
@@ -240,6 +326,8 @@ def retrieveV2(username, data_type, stockname):
         ), 401
     except InvalidDataKey as e:
         return json.dumps({"InvalidDataKey": f"{e}"}), 400
+    except InvalidQueryParameter as e:
+        return json.dumps({"InvalidQueryParameter": f"{e}"}), 400
     except Exception as e:
         return json.dumps(
             {"InternalError": f"Something went wrong; please report - error = {e}"}
@@ -1,7 +1,17 @@
 from exceptions.InvalidDataKey import InvalidDataKey
+from exceptions.InvalidQueryParameter import InvalidQueryParameter
 from datetime import datetime
 from pytz import timezone
 import csv
+import io
+
+from jsonCodec import dumps
+from boto3.dynamodb.types import TypeDeserializer
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only needed for Parquet datasets
+    pq = None
 
 
 def validateDataSrc(dataSrc):
@@ -40,16 +50,32 @@ def getEventType(dataSrc):
     return map[dataSrc]
 
 
-def getS3FileName(username, dataType, stockname, date):
+# Collected datasets are stored as CSV, or as Parquet when the collection
+# service is deployed with STORAGE_FORMAT=parquet.
+STORAGE_FORMAT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet"}
+
+
+def getS3FileName(username, dataType, stockname, date, storageFormat="csv"):
+    extension = STORAGE_FORMAT_EXTENSIONS[storageFormat]
     fileFormat = {
-        "finance": f"{username}#{stockname}_stock_data.csv",
-        "news": f"{username}_{stockname}_{date}_news.csv",
-        "sport": f"{username}#{stockname}_{date}_sport.csv",  # TODO GET THIS CHECKED WITH RAKSHIL
+        "finance": f"{username}#{stockname}_stock_data{extension}",
+        "news": f"{username}_{stockname}_{date}_news{extension}",
+        "sport": f"{username}#{stockname}_{date}_sport{extension}",  # TODO GET THIS CHECKED WITH RAKSHIL
     }
 
     return fileFormat[dataType]
 
 
+def isParquetKey(key: str) -> bool:
+    return key.endswith(STORAGE_FORMAT_EXTENSIONS["parquet"])
+
+
+def getS3ManifestFileName(username, stockname):
+    """Finance data collected into the shared price store is referenced by a
+    small per-user JSON manifest rather than a per-user CSV."""
+    return f"{username}#{stockname}_stock_data.json"
+
+
 def getTableNameFromKey(key: str):
     keyToTableNameMap = getKeyToTableNameMap()
     tableName = keyToTableNameMap.get(key, None)
@@ -57,7 +83,16 @@ def getTableNameFromKey(key: str):
     return tableName
 
 
-def adageFormatter(s3BucketName: str, stockName: str, content: str, data_type: str):
+SYDNEY_TIMEZONE = timezone("Australia/Sydney")
+
+
+def adageTimestamp():
+    """The current Sydney time as ADAGE responses report it."""
+    return str(datetime.now(SYDNEY_TIMEZONE)).split("+")[0]
+
+
+def adageHeader(s3BucketName: str, stockName: str, data_type: str):
+    """Everything in an ADAGE response except its events."""
     dataSrc = getKeyToDataSourceMap().get(data_type, None)
     datasetType = getKeyToDatasetTypeMap().get(data_type, None)
 
@@ -66,29 +101,135 @@ def adageFormatter(s3BucketName: str, stockName: str, content: str, data_type: s
         "dataset_type": f"{datasetType}",
         "dataset_id": f"https://{s3BucketName}.s3-ap-southeast-2-amazonaws.com",
         "time_object": {
-            "timestamp": f"{str(datetime.now(timezone('Australia/Sydney'))).split('+')[0]}",
+            "timestamp": adageTimestamp(),
             "timezone": "GMT+11",
         },
         "stock_name": stockName,
-        "events": content,
     }
 
 
-# private helper
-def createDynamoDBAttributeMap(dataSrc, stockname, line):
-    attributes = {
-        "finance": [("close", "Close")],
-        "news": [("url", "url"), ("sentiment_score", "sentiment_score")],
-        "sport": None,  # TODO: Figure this out using an example csv file from Rakshil
+def adageFormatter(s3BucketName: str, stockName: str, content: str, data_type: str):
+    return {**adageHeader(s3BucketName, stockName, data_type), "events": content}
+
+
+def adageColumnarFormatter(
+    s3BucketName: str, stockName: str, content: list, data_type: str
+):
+    """A compact alternative to adageFormatter: instead of a list of event
+    objects that repeat every key, each event field becomes one array and
+    the i'th entries of all the arrays together make up the i'th event.
+    Attributes missing from an event are null. stock_name (already given at
+    the top level), duration and time zone are the same for every event and
+    so are reported once."""
+    attributeNames = []
+    for event in content:
+        for name in event["attribute"]:
+            if name != "stock_name" and name not in attributeNames:
+                attributeNames.append(name)
+
+    firstTime = content[0]["time_object"] if content else {}
+    return {
+        **adageHeader(s3BucketName, stockName, data_type),
+        "event_type": content[0]["event-type"] if content else None,
+        "duration": firstTime.get("duration"),
+        "duration_unit": firstTime.get("duration-unit"),
+        "time_zone": firstTime.get("time-zone"),
+        "columns": {
+            "time_stamp": [e["time_object"]["time-stamp"] for e in content],
+            **{
+                name: [e["attribute"].get(name) for e in content]
+                for name in attributeNames
+            },
+        },
     }
 
-    attributeMap = {}
 
-    requiredAttributes = attributes[dataSrc]
-    for adageField, colName in requiredAttributes:
-        attributeMap[adageField] = {"S": line.get(colName)}
-    attributeMap["stock_name"] = {"S": stockname}
-    return attributeMap
+def adageNdjsonFormatter(
+    s3BucketName: str, stockName: str, content: list, data_type: str
+):
+    """Newline-delimited JSON: the adageHeader on the first line followed by
+    one event per line, so clients can process events as they arrive."""
+    lines = [dumps(adageHeader(s3BucketName, stockName, data_type))]
+    lines.extend(dumps(event) for event in content)
+    return "\n".join(lines) + "\n"
+
+
+def parseEventQuery(args):
+    """Reads the start, end, fields, limit and cursor query parameters of a
+    retrieve request into keyword arguments for selectEvents. Dates are
+    compared as strings against each event's time-stamp, so any prefix of
+    an ISO date (2025, 2025-03, 2025-03-21, ...) works."""
+    query = {
+        "start": args.get("start") or None,
+        "end": args.get("end") or None,
+        "fields": None,
+        "limit": None,
+        "cursor": 0,
+    }
+
+    if args.get("fields"):
+        query["fields"] = [f.strip() for f in args["fields"].split(",") if f.strip()]
+
+    for name, minimum in (("limit", 1), ("cursor", 0)):
+        value = args.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            query[name] = int(value)
+        except ValueError:
+            raise InvalidQueryParameter(f"{name} must be a whole number, got {value}")
+        if query[name] < minimum:
+            raise InvalidQueryParameter(f"{name} must be at least {minimum}")
+
+    if query["start"] and query["end"] and query["start"] > query["end"]:
+        raise InvalidQueryParameter("start must not be after end")
+
+    return query
+
+
+def selectEvents(events, start=None, end=None, fields=None, limit=None, cursor=0):
+    """Applies a parsed event query to a dataset's events. Returns a tuple of
+    (selected events, cursor for the next page or None if this is the last).
+    The given events are never modified, so cached datasets can be passed."""
+    if start or end:
+        selected = []
+        for event in events:
+            timestamp = event["time_object"]["time-stamp"] or ""
+            if start and timestamp < start:
+                continue
+            if end and timestamp[: len(end)] > end:
+                continue
+            selected.append(event)
+    else:
+        selected = events
+
+    nextCursor = None
+    if cursor or limit is not None:
+        stop = len(selected) if limit is None else cursor + limit
+        if stop < len(selected):
+            nextCursor = stop
+        selected = selected[cursor:stop]
+
+    if fields is not None:
+        selected = [
+            {
+                **event,
+                "attribute": {
+                    k: v for k, v in event["attribute"].items() if k in fields
+                },
+            }
+            for event in selected
+        ]
+
+    return selected, nextCursor
+
+
+# (adage attribute, CSV column) pairs stored for each data source's events
+CSV_ATTRIBUTES = {
+    "finance": [("close", "Close")],
+    "news": [("url", "url"), ("sentiment_score", "sentiment_score")],
+    "sport": None,  # TODO: Figure this out using an example csv file from Rakshil
+}
 
 
 # private helper
@@ -103,33 +244,121 @@ def GettingCSVDateColName(dataSrc):
     return keyToDateColumn[dataSrc]
 
 
+# private helper
+def dynamoDBEvent(eventType, stockname, timestamp, attributes):
+    attributeMap = {field: {"S": value} for field, value in attributes}
+    attributeMap["stock_name"] = {"S": stockname}
+    return {
+        "M": {
+            "attribute": {"M": attributeMap},
+            "event-type": {"S": eventType},
+            "time_object": {
+                "M": {
+                    "duration": {"S": "0"},
+                    "duration-unit": {"S": "days"},
+                    "time-stamp": {"S": timestamp},
+                    "time-zone": {"S": "GMT+11"},
+                }
+            },
+        }
+    }
+
+
+# private helper
+def csvCell(row, i):
+    """The row's value in column i, or None if the column is not in the
+    header (i is None) or the row is short."""
+    return row[i] if i is not None and i < len(row) else None
+
+
 # public helper
-def createDynamoDBContentList(dataSrc, stockname, fileContent):
-    reader = csv.DictReader(fileContent.split("\n"), delimiter=",")
-    contentList = []
-    for line in list(reader):
+def iterDynamoDBContent(dataSrc, stockname, csvFile):
+    """Converts a CSV file one row at a time, yielding each row as a
+    DynamoDB-typed event. csvFile may be anything csv.reader accepts, such
+    as a text stream over an S3 object, so the whole file never has to be
+    held in memory as text. The column layout is worked out once from the
+    header rather than for every row."""
+    reader = csv.reader(csvFile)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    def column(name):
+        return header.index(name) if name in header else None
+
+    dateIndex = column(GettingCSVDateColName(dataSrc))
+    fields = [
+        (adageField, column(colName)) for adageField, colName in CSV_ATTRIBUTES[dataSrc]
+    ]
+    eventType = getEventType(dataSrc)
+
+    for row in reader:
         # if we have a blank line (especially at the end of a file)
-        if line == "":
+        if not row:
             continue
-        date = line.get(GettingCSVDateColName(dataSrc))
-        # closeVal = line.get("Close")
 
-        contentList.append(
-            {
-                "M": {
-                    "attribute": {
-                        "M": createDynamoDBAttributeMap(dataSrc, stockname, line)
-                    },
-                    "event-type": {"S": f"{(getEventType(dataSrc))}"},
-                    "time_object": {
-                        "M": {
-                            "duration": {"S": "0"},
-                            "duration-unit": {"S": "days"},
-                            "time-stamp": {"S": date},
-                            "time-zone": {"S": "GMT+11"},
-                        }
-                    },
-                }
-            }
+        yield dynamoDBEvent(
+            eventType,
+            stockname,
+            csvCell(row, dateIndex),
+            [(field, csvCell(row, i)) for field, i in fields],
         )
-    return contentList
+
+
+# private helper
+def parquetValueAsText(value):
+    """The text a value would have had in the CSV the collection service
+    writes, so events read from Parquet match those read from CSV."""
+    if value is None or value != value:  # missing, or NaN
+        return ""
+    if hasattr(value, "isoformat"):  # typed date and timestamp columns
+        return value.isoformat()
+    return str(value)
+
+
+# private helper
+def parquetCell(data, colName, i):
+    """Row i of a column in a decoded Parquet batch, as CSV text. A column
+    missing from the file reads as None, like one missing from a CSV."""
+    if colName not in data:
+        return None
+    return parquetValueAsText(data[colName][i])
+
+
+# public helper
+def iterParquetContent(dataSrc, stockname, parquetFile):
+    """Like iterDynamoDBContent, for a Parquet dataset. Only the date column
+    and the columns in CSV_ATTRIBUTES are decoded, one row group at a time;
+    the other columns in the file are never read."""
+    if pq is None:
+        raise RuntimeError("pyarrow is required to read Parquet datasets")
+
+    parquet = pq.ParquetFile(parquetFile)
+    available = set(parquet.schema_arrow.names)
+    dateColumn = GettingCSVDateColName(dataSrc)
+    fields = CSV_ATTRIBUTES[dataSrc]
+    wanted = dict.fromkeys([dateColumn] + [colName for _, colName in fields])
+    columns = [colName for colName in wanted if colName in available]
+    eventType = getEventType(dataSrc)
+
+    for batch in parquet.iter_batches(columns=columns):
+        data = batch.to_pydict()
+        for i in range(batch.num_rows):
+            yield dynamoDBEvent(
+                eventType,
+                stockname,
+                parquetCell(data, dateColumn, i),
+                [(field, parquetCell(data, colName, i)) for field, colName in fields],
+            )
+
+
+# public helper
+def createDynamoDBContentList(dataSrc, stockname, fileContent):
+    return list(iterDynamoDBContent(dataSrc, stockname, io.StringIO(fileContent)))
+
+
+# public helper
+def deserializeContentList(contentList):
+    """Turns a list built by createDynamoDBContentList into the plain events
+    that getFileFromDynamo would return for it once stored."""
+    return TypeDeserializer().deserialize({"L": contentList})
@@ -0,0 +1,50 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+
+# boto3 clients are thread-safe, so the whole process shares one per service.
+# Building a client costs tens of milliseconds; this pool also keeps enough
+# keep-alive connections open for Flask's request threads.
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    tcp_keepalive=True,
+)
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _defaultSession():
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    return boto3.DEFAULT_SESSION
+
+
+def getClient(serviceName: str, regionName=None):
+    """Returns the shared client for a service. Clients belong to boto3's
+    default session, so if that is replaced (as moto does for every mocked
+    test) fresh ones are built from the new session."""
+    key = (serviceName, regionName)
+    session = _defaultSession()
+    entry = _clients.get(key)
+    if entry is None or entry[0] is not session:
+        with _lock:
+            entry = _clients.get(key)
+            if entry is None or entry[0] is not session:
+                client = session.client(
+                    serviceName, region_name=regionName, config=CLIENT_CONFIG
+                )
+                entry = (session, client)
+                _clients[key] = entry
+    return entry[1]
+
+
+def getDynamoDBClient():
+    return getClient("dynamodb", "ap-southeast-2")
+
+
+def getS3Client():
+    return getClient("s3")
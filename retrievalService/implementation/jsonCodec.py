@@ -0,0 +1,28 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library is the fallback
+    orjson = None
+
+
+def dumpsBytes(obj) -> bytes:
+    """Serialises obj to UTF-8 JSON, with orjson when it is installed. Values
+    orjson cannot encode fall back to the standard library."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+
+def dumps(obj) -> str:
+    return dumpsBytes(obj).decode("utf-8")
+
+
+def spliceEvents(header: dict, eventsJson: bytes) -> bytes:
+    """JSON for `header` with an "events" key added whose value is the already
+    serialised `eventsJson`, so cached events are copied rather than
+    encoded again for every response."""
+    return dumpsBytes(header)[:-1] + b',"events":' + eventsJson + b"}"
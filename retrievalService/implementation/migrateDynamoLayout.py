@@ -0,0 +1,113 @@
+"""Copies a table in the original layout (one item per user holding every
+retrieved file in its `retrievedFiles` list) into the per-file layout used by
+PerFileRetrievalInterface. The source table is only read, and re-running the
+migration simply overwrites the destination items, so it is safe to repeat.
+
+usage: python migrateDynamoLayout.py <source table> <destination table> [--create]
+"""
+
+import argparse
+import sys
+import time
+
+import boto3
+
+from PerFileRetrievalInterface import USER_RECORD
+
+
+BATCH_SIZE = 25
+
+
+def createPerFileTable(dynamodb, tableName: str):
+    dynamodb.create_table(
+        TableName=tableName,
+        KeySchema=[
+            {"AttributeName": "username", "KeyType": "HASH"},
+            {"AttributeName": "filename", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "username", "AttributeType": "S"},
+            {"AttributeName": "filename", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.get_waiter("table_exists").wait(TableName=tableName)
+
+
+def splitUserItem(item: dict) -> list:
+    """Turns one original-layout user item (in DynamoDB's attribute value
+    format) into the items of the per-file layout: the user's USER_RECORD
+    followed by one item per retrieved file. Should a file name appear more
+    than once only the first is kept, as that is the one lookups returned."""
+    username = item["username"]
+    userRecord = {
+        k: v
+        for k, v in item.items()
+        if k not in ("username", "retrievedFiles", "fileNames")
+    }
+    items = [{"username": username, "filename": {"S": USER_RECORD}, **userRecord}]
+
+    seen = set()
+    for file in item.get("retrievedFiles", {}).get("L", []):
+        fileItem = file["M"]
+        fileName = fileItem["filename"]["S"]
+        if fileName in seen:
+            continue
+        seen.add(fileName)
+        items.append({"username": username, **fileItem})
+    return items
+
+
+def writeItems(dynamodb, tableName: str, items: list):
+    for i in range(0, len(items), BATCH_SIZE):
+        requests = [
+            {"PutRequest": {"Item": item}} for item in items[i : i + BATCH_SIZE]
+        ]
+        delay = 0.05
+        while requests:
+            response = dynamodb.batch_write_item(RequestItems={tableName: requests})
+            requests = response.get("UnprocessedItems", {}).get(tableName, [])
+            if requests:
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+
+
+def migrate(sourceTable: str, destTable: str, dynamodb=None) -> tuple:
+    """Copies every user in `sourceTable` into `destTable`. Returns a tuple of
+    (users migrated, files migrated)."""
+    if dynamodb is None:
+        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+
+    users = files = 0
+    for page in dynamodb.get_paginator("scan").paginate(TableName=sourceTable):
+        for item in page.get("Items", []):
+            items = splitUserItem(item)
+            writeItems(dynamodb, destTable, items)
+            users += 1
+            files += len(items) - 1
+    return users, files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Migrate retrieval users to the per-file DynamoDB layout"
+    )
+    parser.add_argument("source", help="table in the original one-item-per-user layout")
+    parser.add_argument("destination", help="table in the per-file layout")
+    parser.add_argument(
+        "--create",
+        action="store_true",
+        help="create the destination table before migrating",
+    )
+    args = parser.parse_args(argv)
+
+    dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+    if args.create:
+        createPerFileTable(dynamodb, args.destination)
+
+    users, files = migrate(args.source, args.destination, dynamodb)
+    sys.stdout.write(f"Migrated {users} users and {files} files\n")
+
+
+if __name__ == "__main__":
+    main()
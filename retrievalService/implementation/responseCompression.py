@@ -0,0 +1,52 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+# Bodies smaller than this gain too little to be worth compressing.
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+# Brotli's default quality (11) is far too slow to run per request.
+BROTLI_QUALITY = 5
+
+
+def supportedEncodings() -> list:
+    """Encodings this process can produce, most preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compressBody(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compressResponse(response, acceptEncodings):
+    """Compresses a Flask response in place with the best encoding the client
+    accepts (werkzeug's request.accept_encodings). Streamed, already encoded,
+    error and small responses are left as they are."""
+    response.vary.add("Accept-Encoding")
+
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code >= 300
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+
+    encoding = acceptEncodings.best_match(supportedEncodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compressBody(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
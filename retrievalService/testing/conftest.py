@@ -3,11 +3,14 @@ import boto3
 from moto import mock_aws
 import os
 import sys
+import json
 
 sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), "../implementation"))
 )
 from ..implementation.RetrievalMicroservice import app as flask_app  # noqa: E402
+from ..implementation.RetrievalMicroservice import datasetCache  # noqa: E402
+from ..implementation.migrateDynamoLayout import createPerFileTable  # noqa: E402
 
 
 @pytest.fixture
@@ -38,6 +41,42 @@ def s3_mock(rootdir):
         yield s3
 
 
+@pytest.fixture(scope="function")
+def s3_shared_price_mock(rootdir):
+    """A bucket laid out like the shared price store: one canonical CSV per
+    ticker and a per-user manifest pointing at it."""
+    bucket_name = "seng3011-omega-25t1-testing-bucket"
+    fileName = os.path.join(rootdir, "user1#apple_stock_data.csv")
+    with open(fileName) as f:
+        fileContent = f.read()
+
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket=bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": "ap-southeast-2"},
+        )
+        s3.put_object(
+            Bucket=bucket_name,
+            Key="prices/HMC.csv",
+            Body=fileContent.encode("utf-8"),
+        )
+        s3.put_object(
+            Bucket=bucket_name,
+            Key="user1#honda_stock_data.json",
+            Body=json.dumps(
+                {
+                    "company": "honda",
+                    "ticker": "HMC",
+                    "bucket": bucket_name,
+                    "key": "prices/HMC.csv",
+                }
+            ).encode("utf-8"),
+        )
+
+        yield s3
+
+
 @pytest.fixture(scope="function")
 def s3_news_table(rootdir):
     bucket_name = "seng3011-omega-news-data"
@@ -137,6 +176,33 @@ def test_table_two_users(dynamodb_mock):
         dynamodb_mock.delete_table(TableName=tableName)
 
 
+@pytest.fixture(scope="function")
+def per_file_table(dynamodb_mock):
+    """Creates a table in the per-file layout with user1 registered."""
+
+    with mock_aws():
+        tableName = "seng3011-test-dynamodb-files"
+
+        createPerFileTable(dynamodb_mock, tableName)
+        dynamodb_mock.put_item(
+            TableName=tableName,
+            Item={"username": {"S": "user1"}, "filename": {"S": "#user"}},
+        )
+
+        yield dynamodb_mock
+
+        dynamodb_mock.delete_table(TableName=tableName)
+
+
+@pytest.fixture(autouse=True)
+def clear_dataset_cache():
+    """Every test starts with fresh mocked AWS resources, so nothing cached
+    by an earlier test may be served."""
+    datasetCache.clear()
+    yield
+    datasetCache.clear()
+
+
 @pytest.fixture
 def app():
     yield flask_app
@@ -0,0 +1,35 @@
+import pytest
+import boto3
+from moto import mock_aws
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.awsClients import getDynamoDBClient, getS3Client
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestAwsClients:
+    @mock_aws
+    def test_clients_are_shared(self):
+        assert getDynamoDBClient() is getDynamoDBClient()
+        assert getS3Client() is getS3Client()
+
+        config = getDynamoDBClient().meta.config
+        assert config.max_pool_connections == 50
+        assert config.retries["mode"] == "adaptive"
+
+        retrievalInterface = RetrievalInterface()
+        assert retrievalInterface.dynamodb is RetrievalInterface().dynamodb
+        assert retrievalInterface.s3 is RetrievalInterface().s3
+        assert retrievalInterface.dynamodb.meta.config.tcp_keepalive is True
+
+    @mock_aws
+    def test_injected_clients(self, test_table):
+        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        s3 = boto3.client("s3")
+
+        retrievalInterface = RetrievalInterface(dynamodb=dynamodb, s3=s3)
+        assert retrievalInterface.dynamodb is dynamodb
+        assert retrievalInterface.s3 is s3
+        assert retrievalInterface.listUserFiles("user1", "seng3011-test-dynamodb") == []
@@ -0,0 +1,147 @@
+import pytest
+import boto3
+from moto import mock_aws
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.PerFileRetrievalInterface import PerFileRetrievalInterface
+
+
+CSV = "Date,Close\n2025-01-02,1.5\n"
+
+
+class CountingClient:
+    """Wraps a boto3 client, recording the name of every call made through it
+    and running `before[name]` (once) just before that call is made."""
+
+    def __init__(self, client, before=None):
+        self.client = client
+        self.calls = []
+        self.before = before or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            hook = self.before.pop(name, None)
+            if hook:
+                hook()
+            return attr(*args, **kwargs)
+
+        return call
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestConditionalWrites:
+    @mock_aws
+    def test_push_is_one_write(self, test_table):
+        tableName = "seng3011-test-dynamodb"
+        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        retrievalInterface = RetrievalInterface(dynamodb=dynamodb)
+        # build the fileNames index for the fixture's user first
+        retrievalInterface.listUserFiles("user1", tableName)
+
+        counting = CountingClient(dynamodb)
+        retrievalInterface = RetrievalInterface(dynamodb=counting)
+        retrievalInterface.pushToDynamoV2("finance", "apple", CSV, "user1", tableName)
+        assert counting.calls == ["update_item"]
+
+        with pytest.raises(Exception) as errorInfo:
+            retrievalInterface.pushToDynamoV2(
+                "finance", "apple", CSV, "user1", tableName
+            )
+        assert type(errorInfo.value).__name__ == "UserHasFile"
+
+        with pytest.raises(Exception) as errorInfo:
+            retrievalInterface.pushToDynamoV2(
+                "finance", "apple", CSV, "fake-user", tableName
+            )
+        assert type(errorInfo.value).__name__ == "UserNotFound"
+
+    @mock_aws
+    def test_delete_survives_concurrent_change(self, test_table):
+        tableName = "seng3011-test-dynamodb"
+        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        retrievalInterface = RetrievalInterface(dynamodb=dynamodb)
+        for stock in ("apple", "honda", "tesla"):
+            retrievalInterface.pushToDynamoV2("finance", stock, CSV, "user1", tableName)
+
+        def concurrentDelete():
+            # another request removes apple after honda's index has been read
+            RetrievalInterface(dynamodb=dynamodb).deleteFromDynamo(
+                "finance_apple", "user1", tableName
+            )
+
+        counting = CountingClient(dynamodb, before={"update_item": concurrentDelete})
+        RetrievalInterface(dynamodb=counting).deleteFromDynamo(
+            "finance_honda", "user1", tableName
+        )
+
+        assert retrievalInterface.listUserFiles("user1", tableName) == ["finance_tesla"]
+        found, content, index = retrievalInterface.getFileFromDynamo(
+            "finance_tesla", "user1", tableName
+        )
+        assert (found, index) == (True, 0)
+
+    @mock_aws
+    def test_delete_refuses_diverged_lists(self, test_table):
+        tableName = "seng3011-test-dynamodb"
+        dynamodb = boto3.client("dynamodb", region_name="ap-southeast-2")
+        retrievalInterface = RetrievalInterface(dynamodb=dynamodb)
+        for stock in ("apple", "honda", "tesla"):
+            retrievalInterface.pushToDynamoV2("finance", stock, CSV, "user1", tableName)
+        # an older task removes apple from retrievedFiles only
+        dynamodb.update_item(
+            TableName=tableName,
+            Key={"username": {"S": "user1"}},
+            UpdateExpression="REMOVE retrievedFiles[0]",
+        )
+
+        # honda's index now points at tesla's entry, which must survive
+        with pytest.raises(RuntimeError):
+            retrievalInterface.deleteFromDynamo("finance_honda", "user1", tableName)
+        found, content, index = retrievalInterface.getFileFromDynamo(
+            "finance_tesla", "user1", tableName
+        )
+        assert found
+
+    @mock_aws
+    def test_register_is_one_write(self, test_table):
+        tableName = "seng3011-test-dynamodb"
+        counting = CountingClient(
+            boto3.client("dynamodb", region_name="ap-southeast-2")
+        )
+        retrievalInterface = RetrievalInterface(dynamodb=counting)
+
+        retrievalInterface.register("user2", tableName)
+        assert counting.calls == ["put_item"]
+        with pytest.raises(Exception) as errorInfo:
+            retrievalInterface.register("user1", tableName)
+        assert type(errorInfo.value).__name__ == "UserAlreadyExists"
+
+    @mock_aws
+    def test_per_file_push_is_one_transaction(self, per_file_table):
+        tableName = "seng3011-test-dynamodb-files"
+        counting = CountingClient(
+            boto3.client("dynamodb", region_name="ap-southeast-2")
+        )
+        retrievalInterface = PerFileRetrievalInterface(dynamodb=counting)
+
+        retrievalInterface.pushToDynamoV2("finance", "apple", CSV, "user1", tableName)
+        assert counting.calls == ["transact_write_items"]
+
+        with pytest.raises(Exception) as errorInfo:
+            retrievalInterface.pushToDynamoV2(
+                "finance", "apple", CSV, "user1", tableName
+            )
+        assert type(errorInfo.value).__name__ == "UserHasFile"
+
+        with pytest.raises(Exception) as errorInfo:
+            retrievalInterface.pushToDynamoV2(
+                "finance", "apple", CSV, "fake-user", tableName
+            )
+        assert type(errorInfo.value).__name__ == "UserNotFound"
@@ -0,0 +1,103 @@
+import pytest
+import boto3
+import io
+import time
+from datetime import date, timedelta
+from moto import mock_aws
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.RetrievalMicroserviceHelpers import (
+    createDynamoDBContentList,
+    iterDynamoDBContent,
+)
+
+
+def syntheticOHLC(years=10):
+    """A daily OHLC CSV in the collector's layout covering `years` years of
+    trading days."""
+    lines = ["Date,Open,High,Low,Close,Volume,Dividends,Stock Splits"]
+    day = date(2015, 1, 1)
+    price = 100.0
+    while len(lines) <= years * 252:
+        if day.weekday() < 5:
+            price += 0.01 * ((len(lines) % 7) - 3)
+            lines.append(
+                f"{day.isoformat()},{price:.6f},{price + 1:.6f},{price - 1:.6f},"
+                f"{price + 0.5:.6f},{1000 + len(lines)},0.0,0.0"
+            )
+        day += timedelta(days=1)
+    return "\n".join(lines) + "\n"
+
+
+class TestContentConversion:
+    def test_converts_rows(self):
+        content = createDynamoDBContentList(
+            "finance", "apple", "Date,Close\n2025-01-02,1.5\n\n2025-01-03,1.75\n"
+        )
+
+        assert len(content) == 2
+        event = content[1]["M"]
+        assert event["attribute"]["M"] == {
+            "close": {"S": "1.75"},
+            "stock_name": {"S": "apple"},
+        }
+        assert event["event-type"] == {"S": "stock-ohlc"}
+        assert event["time_object"]["M"]["time-stamp"] == {"S": "2025-01-03"}
+
+    def test_empty_file(self):
+        assert createDynamoDBContentList("finance", "apple", "") == []
+
+    def test_streams_lazily(self):
+        events = iterDynamoDBContent("finance", "apple", io.StringIO(syntheticOHLC()))
+        first = next(events)
+        assert first["M"]["time_object"]["M"]["time-stamp"] == {"S": "2015-01-01"}
+
+    def test_ten_years_benchmark(self):
+        csvText = syntheticOHLC(years=10)
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            content = list(
+                iterDynamoDBContent("finance", "apple", io.StringIO(csvText))
+            )
+            timings.append(time.perf_counter() - start)
+
+        assert len(content) == 2520
+        # around 10ms on a laptop; the budget only catches gross regressions
+        assert min(timings) < 0.25
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestPullStream:
+    @mock_aws
+    def test_converts_straight_from_s3(self):
+        bucketName = "seng3011-omega-news-data"
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket=bucketName,
+            CreateBucketConfiguration={"LocationConstraint": "ap-southeast-2"},
+        )
+        s3.put_object(
+            Bucket=bucketName,
+            Key="user1_honda_2025-04-09_news.csv",
+            Body=(
+                "company_name,article_title,url,published_at,sentiment_score\r\n"
+                'honda,"A title\r\nover two lines",https://a.example,2025-04-08,0.5\r\n'
+                "honda,Another,https://b.example,2025-04-09,-0.1\r\n"
+            ).encode("utf-8"),
+        )
+
+        retrievalInterface = RetrievalInterface()
+        with retrievalInterface.pullStream(
+            bucketName, "user1_honda_2025-04-09_news.csv"
+        ) as csvFile:
+            content = list(iterDynamoDBContent("news", "honda", csvFile))
+
+        assert [e["M"]["attribute"]["M"]["url"]["S"] for e in content] == [
+            "https://a.example",
+            "https://b.example",
+        ]
+        assert content[1]["M"]["attribute"]["M"]["sentiment_score"] == {"S": "-0.1"}
@@ -0,0 +1,89 @@
+import pytest
+from moto import mock_aws
+import json
+
+from ..implementation.DatasetCache import DatasetCache
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.RetrievalMicroservice import datasetCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDatasetCache:
+    def test_evicts_least_recently_used_by_size(self):
+        cache = DatasetCache(maxBytes=100)
+        cache.set("a", "x", size=40)
+        cache.set("b", "y", size=40)
+        assert cache.get("a") == "x"
+
+        cache.set("c", "z", size=40)
+        assert cache.get("b") is None
+        assert cache.get("a") == "x"
+        assert cache.get("c") == "z"
+        assert cache.currentBytes == 80
+
+    def test_skips_values_larger_than_the_cache(self):
+        cache = DatasetCache(maxBytes=10)
+        cache.set("a", ["a long string that does not fit"])
+        assert cache.get("a") is None
+        assert cache.currentBytes == 0
+
+    def test_expires_and_invalidates(self):
+        clock = FakeClock()
+        cache = DatasetCache(maxBytes=100, ttl=5, clock=clock)
+        cache.set("a", "x", size=1)
+        cache.set("b", "y", size=1)
+
+        cache.invalidate("a")
+        assert cache.get("a") is None
+
+        clock.now = 5
+        assert cache.get("b") is None
+        assert len(cache) == 0
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestRetrieveCaching:
+    @mock_aws
+    def test_serves_repeat_retrievals_from_memory(
+        self, rootdir, client, s3_mock, test_table
+    ):
+        tableName = "seng3011-test-dynamodb"
+
+        res = client.get("/v2/retrieve/user1/finance/apple/")
+        assert res.status_code == 200
+        events = json.loads(res.data)["events"]
+
+        # what the miss path returned is exactly what was stored
+        found, content, index = RetrievalInterface().getFileFromDynamo(
+            "finance_apple", "user1", tableName
+        )
+        assert found is True
+        assert content == events
+
+        # take the file out of DynamoDB behind the cache's back
+        test_table.update_item(
+            TableName=tableName,
+            Key={"username": {"S": "user1"}},
+            UpdateExpression="REMOVE retrievedFiles [0], fileNames [0]",
+        )
+        res = client.get("/v2/retrieve/user1/finance/apple/")
+        assert res.status_code == 200
+        assert json.loads(res.data)["events"] == events
+
+    @mock_aws
+    def test_delete_invalidates(self, rootdir, client, s3_mock, test_table):
+        client.get("/v1/retrieve/user1/apple/")
+        assert datasetCache.get(("user1", "apple")) is not None
+
+        res = client.delete("/v1/delete/user1/apple/")
+        assert res.status_code == 200
+        assert datasetCache.get(("user1", "apple")) is None
@@ -0,0 +1,89 @@
+import pytest
+import os
+from moto import mock_aws
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.PerFileRetrievalInterface import PerFileRetrievalInterface
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestHasFile:
+    @mock_aws
+    def test_has_file(self, test_table, rootdir):
+        fileName = os.path.join(rootdir, "user1#apple_stock_data.csv")
+        with open(fileName, "r") as f:
+            fileContent = f.read()
+
+        tableName = "seng3011-test-dynamodb"
+        retrievalInterface = RetrievalInterface()
+
+        assert retrievalInterface.hasFile("finance_apple", "user1", tableName) is False
+        retrievalInterface.pushToDynamoV2(
+            "finance", "apple", fileContent, "user1", tableName
+        )
+        assert retrievalInterface.hasFile("finance_apple", "user1", tableName) is True
+
+        with pytest.raises(Exception):
+            retrievalInterface.hasFile("finance_apple", "fake-user", tableName)
+
+    @mock_aws
+    def test_backfills_file_names(self, test_table, rootdir):
+        """Items written before the fileNames index existed get it built from
+        their retrievedFiles the first time they are read."""
+        tableName = "seng3011-test-dynamodb"
+        files = [
+            {
+                "M": {
+                    "filename": {"S": name},
+                    "stockName": {"S": name},
+                    "content": {"L": [{"M": {"event-type": {"S": "stock-ohlc"}}}]},
+                }
+            }
+            for name in ("finance_apple", "finance_honda")
+        ]
+        test_table.put_item(
+            TableName=tableName,
+            Item={"username": {"S": "user1"}, "retrievedFiles": {"L": files}},
+        )
+
+        retrievalInterface = RetrievalInterface()
+        assert retrievalInterface.listUserFiles("user1", tableName) == [
+            "finance_apple",
+            "finance_honda",
+        ]
+
+        item = test_table.get_item(
+            TableName=tableName, Key={"username": {"S": "user1"}}
+        )["Item"]
+        assert item["fileNames"] == {
+            "L": [{"S": "finance_apple"}, {"S": "finance_honda"}]
+        }
+
+        found, content, index = retrievalInterface.getFileFromDynamo(
+            "finance_honda", "user1", tableName
+        )
+        assert (found, index) == (True, 1)
+        assert content == [{"event-type": "stock-ohlc"}]
+
+        retrievalInterface.deleteFromDynamo("finance_apple", "user1", tableName)
+        assert retrievalInterface.listUserFiles("user1", tableName) == ["finance_honda"]
+        found, content, index = retrievalInterface.getFileFromDynamo(
+            "finance_honda", "user1", tableName
+        )
+        assert (found, index) == (True, 0)
+
+    @mock_aws
+    def test_per_file_has_file(self, per_file_table, rootdir):
+        tableName = "seng3011-test-dynamodb-files"
+        retrievalInterface = PerFileRetrievalInterface()
+
+        assert retrievalInterface.hasFile("finance_apple", "user1", tableName) is False
+        retrievalInterface.pushToDynamoV2(
+            "finance", "apple", "Date,Close\n2025-01-02,1.0\n", "user1", tableName
+        )
+        assert retrievalInterface.hasFile("finance_apple", "user1", tableName) is True
+
+        with pytest.raises(Exception):
+            retrievalInterface.hasFile("finance_apple", "fake-user", tableName)
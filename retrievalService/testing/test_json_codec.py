@@ -0,0 +1,62 @@
+import pytest
+from moto import mock_aws
+import json
+
+from ..implementation import jsonCodec
+from ..implementation.DatasetCache import CachedDataset
+
+
+EVENTS = [
+    {
+        "attribute": {"close": "244.47", "stock_name": "apple"},
+        "event-type": "stock-ohlc",
+        "time_object": {"time-stamp": "2025-02-18", "time-zone": "GMT+11"},
+    }
+]
+
+
+class TestJsonCodec:
+    def test_round_trips(self):
+        assert json.loads(jsonCodec.dumpsBytes(EVENTS)) == EVENTS
+        assert json.loads(jsonCodec.dumps({"name": "société"})) == {"name": "société"}
+
+    def test_standard_library_fallback(self, monkeypatch):
+        monkeypatch.setattr(jsonCodec, "orjson", None)
+        assert json.loads(jsonCodec.dumpsBytes(EVENTS)) == EVENTS
+
+    def test_values_orjson_cannot_encode(self):
+        # orjson rejects integers wider than 64 bits; the stdlib does not
+        assert json.loads(jsonCodec.dumpsBytes({"volume": 2**70})) == {"volume": 2**70}
+
+    def test_splice_events(self):
+        header = {"stock_name": "apple", "time_object": {"timezone": "GMT+11"}}
+        dataset = CachedDataset(EVENTS)
+
+        body = json.loads(jsonCodec.spliceEvents(header, dataset.eventsJson))
+        assert body == {**header, "events": EVENTS}
+        assert dataset.size > len(dataset.eventsJson)
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestCachedResponses:
+    @mock_aws
+    def test_cached_and_uncached_responses_match(
+        self, rootdir, client, s3_mock, test_table
+    ):
+        first = json.loads(client.get("/v2/retrieve/user1/finance/apple/").data)
+        second = json.loads(client.get("/v2/retrieve/user1/finance/apple/").data)
+        assert first["events"] == second["events"]
+        assert list(second) == [
+            "data_source",
+            "dataset_type",
+            "dataset_id",
+            "time_object",
+            "stock_name",
+            "events",
+        ]
+
+        v1 = json.loads(client.get("/v1/retrieve/user1/apple/").data)
+        assert v1["data_source"] == "yahoo_finance"
+        assert len(v1["events"]) == len(first["events"])
@@ -0,0 +1,50 @@
+import pytest
+import os
+from moto import mock_aws
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.PerFileRetrievalInterface import PerFileRetrievalInterface
+from ..implementation.migrateDynamoLayout import createPerFileTable, migrate
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestMigrateDynamoLayout:
+    @mock_aws
+    def test_migrate(self, test_table_two_users, rootdir):
+        fileName = os.path.join(rootdir, "user1#apple_stock_data.csv")
+        with open(fileName, "r") as f:
+            fileContent = f.read()
+
+        source = "seng3011-test-dynamodb"
+        destination = "seng3011-test-dynamodb-files"
+
+        legacy = RetrievalInterface()
+        legacy.pushToDynamoV2("finance", "apple", fileContent, "user1", source)
+        legacy.pushToDynamoV2("finance", "honda", fileContent, "user1", source)
+
+        createPerFileTable(test_table_two_users, destination)
+        assert migrate(source, destination, test_table_two_users) == (2, 2)
+        # running it again changes nothing
+        assert migrate(source, destination, test_table_two_users) == (2, 2)
+
+        perFile = PerFileRetrievalInterface()
+        assert sorted(perFile.listUserFiles("user1", destination)) == [
+            "finance_apple",
+            "finance_honda",
+        ]
+        assert perFile.listUserFiles("user2", destination) == []
+
+        _, legacyContent, _ = legacy.getFileFromDynamo("finance_apple", "user1", source)
+        found, content, index = perFile.getFileFromDynamo(
+            "finance_apple", "user1", destination
+        )
+        assert found is True
+        assert content == legacyContent
+
+        userRecord = test_table_two_users.get_item(
+            TableName=destination,
+            Key={"username": {"S": "user1"}, "filename": {"S": "#user"}},
+        )["Item"]
+        assert userRecord["analysis"] == {"L": []}
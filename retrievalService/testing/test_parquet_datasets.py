@@ -0,0 +1,112 @@
+import pytest
+import boto3
+from moto import mock_aws
+import io
+import json
+import os
+
+from ..implementation.RetrievalInterface import RetrievalInterface
+from ..implementation.RetrievalMicroserviceHelpers import (
+    createDynamoDBContentList,
+    iterParquetContent,
+)
+
+pa_csv = pytest.importorskip("pyarrow.csv")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def toParquet(csvPath, **writeOptions) -> bytes:
+    """The fixture CSV written as Parquet with typed columns, as the
+    collection service does with STORAGE_FORMAT=parquet."""
+    table = pa_csv.read_csv(csvPath)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd", **writeOptions)
+    return buffer.getvalue()
+
+
+class TestParquetContent:
+    @pytest.mark.parametrize(
+        "dataSrc, fileName",
+        [
+            ("finance", "user1#apple_stock_data.csv"),
+            ("news", "user1_honda_2025-04-09_news.csv"),
+        ],
+    )
+    def test_matches_csv(self, rootdir, dataSrc, fileName):
+        path = os.path.join(rootdir, fileName)
+        with open(path) as f:
+            fromCsv = createDynamoDBContentList(dataSrc, "apple", f.read())
+
+        # small row groups so more than one batch is read
+        parquetFile = io.BytesIO(toParquet(path, row_group_size=4))
+        fromParquet = list(iterParquetContent(dataSrc, "apple", parquetFile))
+        assert fromParquet == fromCsv
+
+    def test_missing_columns(self):
+        buffer = io.BytesIO()
+        pq.write_table(
+            pa_csv.read_csv(io.BytesIO(b"Date,Open\n2025-01-02,1.5\n")), buffer
+        )
+
+        (event,) = iterParquetContent("finance", "apple", io.BytesIO(buffer.getvalue()))
+        assert event["M"]["attribute"]["M"]["close"] == {"S": None}
+        assert event["M"]["time_object"]["M"]["time-stamp"] == {"S": "2025-01-02"}
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestParquetRetrieval:
+    @mock_aws
+    def test_retrieve_through_parquet_manifest(
+        self, rootdir, client, s3_shared_price_mock, test_table
+    ):
+        bucket = "seng3011-omega-25t1-testing-bucket"
+        csvEvents = json.loads(client.get("/v2/retrieve/user1/finance/honda/").data)[
+            "events"
+        ]
+        assert client.delete("/v1/delete/user1/finance_honda/").status_code == 200
+
+        s3_shared_price_mock.put_object(
+            Bucket=bucket,
+            Key="prices/HMC.parquet",
+            Body=toParquet(os.path.join(rootdir, "user1#apple_stock_data.csv")),
+        )
+        s3_shared_price_mock.put_object(
+            Bucket=bucket,
+            Key="user1#honda_stock_data.json",
+            Body=json.dumps({"bucket": bucket, "key": "prices/HMC.parquet"}),
+        )
+
+        res = client.get("/v2/retrieve/user1/finance/honda/")
+        assert res.status_code == 200
+        assert json.loads(res.data)["events"] == csvEvents
+
+    @mock_aws
+    def test_per_user_parquet_preferred(self, rootdir, s3_mock):
+        bucket = "seng3011-omega-25t1-testing-bucket"
+        s3 = boto3.client("s3", region_name="ap-southeast-2")
+        retrievalInterface = RetrievalInterface(s3=s3, storageFormat="parquet")
+
+        # only the CSV has been collected so far
+        assert retrievalInterface.resolveS3FileName(
+            bucket, "user1", "finance", "apple", None
+        ) == (bucket, "user1#apple_stock_data.csv")
+
+        s3.put_object(
+            Bucket=bucket,
+            Key="user1#apple_stock_data.parquet",
+            Body=toParquet(os.path.join(rootdir, "user1#apple_stock_data.csv")),
+        )
+        bucketS3, key = retrievalInterface.resolveS3FileName(
+            bucket, "user1", "finance", "apple", None
+        )
+        assert key == "user1#apple_stock_data.parquet"
+
+        contentList = retrievalInterface.pullContentList(
+            bucketS3, key, "finance", "apple"
+        )
+        with open(os.path.join(rootdir, "user1#apple_stock_data.csv")) as f:
+            assert contentList == createDynamoDBContentList(
+                "finance", "apple", f.read()
+            )
@@ -0,0 +1,105 @@
+import pytest
+import os
+import json
+from moto import mock_aws
+
+from ..implementation.PerFileRetrievalInterface import PerFileRetrievalInterface
+from ..implementation import RetrievalMicroservice
+
+
+TABLE_NAME = "seng3011-test-dynamodb-files"
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestPerFileLayout:
+    @mock_aws
+    def test_push_get_list_delete(self, per_file_table, rootdir):
+        fileName = os.path.join(rootdir, "user1#apple_stock_data.csv")
+        with open(fileName, "r") as f:
+            fileContent = f.read()
+
+        retrievalInterface = PerFileRetrievalInterface()
+        assert retrievalInterface.listUserFiles("user1", TABLE_NAME) == []
+
+        retrievalInterface.pushToDynamoV2(
+            "finance", "apple", fileContent, "user1", TABLE_NAME
+        )
+
+        item = per_file_table.get_item(
+            TableName=TABLE_NAME,
+            Key={"username": {"S": "user1"}, "filename": {"S": "finance_apple"}},
+        )["Item"]
+        assert item["stockName"]["S"] == "apple"
+
+        found, content, index = retrievalInterface.getFileFromDynamo(
+            "finance_apple", "user1", TABLE_NAME
+        )
+        assert found is True
+        assert index == 0
+        assert content[0]["event-type"] == "stock-ohlc"
+
+        assert retrievalInterface.listUserFiles("user1", TABLE_NAME) == [
+            "finance_apple"
+        ]
+
+        assert retrievalInterface.deleteFromDynamo("finance_apple", "user1", TABLE_NAME)
+        assert retrievalInterface.getFileFromDynamo(
+            "finance_apple", "user1", TABLE_NAME
+        ) == (False, None, -1)
+        with pytest.raises(FileNotFoundError):
+            retrievalInterface.deleteFromDynamo("finance_apple", "user1", TABLE_NAME)
+
+    @mock_aws
+    def test_double_push(self, per_file_table, rootdir):
+        fileName = os.path.join(rootdir, "user1#apple_stock_data.csv")
+        with open(fileName, "r") as f:
+            fileContent = f.read()
+
+        retrievalInterface = PerFileRetrievalInterface()
+        assert retrievalInterface.pushToDynamo(
+            "apple", fileContent, "user1", TABLE_NAME
+        )
+        with pytest.raises(Exception):
+            retrievalInterface.pushToDynamo("apple", fileContent, "user1", TABLE_NAME)
+
+    @mock_aws
+    def test_unknown_user(self, per_file_table, rootdir):
+        retrievalInterface = PerFileRetrievalInterface()
+
+        with pytest.raises(Exception):
+            retrievalInterface.getFileFromDynamo("apple", "fake-user", TABLE_NAME)
+        with pytest.raises(Exception):
+            retrievalInterface.listUserFiles("fake-user", TABLE_NAME)
+        with pytest.raises(Exception):
+            retrievalInterface.pushToDynamo(
+                "apple", "Date,Close\n", "fake-user", TABLE_NAME
+            )
+
+    @mock_aws
+    def test_register(self, per_file_table):
+        retrievalInterface = PerFileRetrievalInterface()
+
+        retrievalInterface.register("user2", TABLE_NAME)
+        assert retrievalInterface.listUserFiles("user2", TABLE_NAME) == []
+        with pytest.raises(Exception):
+            retrievalInterface.register("user2", TABLE_NAME)
+
+    @mock_aws
+    def test_routes(self, per_file_table, s3_mock, client, monkeypatch):
+        monkeypatch.setattr(RetrievalMicroservice, "DYNAMO_LAYOUT", "per_file")
+        monkeypatch.setattr(RetrievalMicroservice, "DYNAMO_DB_NAME", TABLE_NAME)
+
+        res = client.get("/v2/retrieve/user1/finance/apple/")
+        assert res.status_code == 200
+        assert len(json.loads(res.data)["events"]) > 0
+
+        res = client.get("/v1/list/user1/")
+        assert json.loads(res.data)["Success"] == ["finance_apple"]
+
+        res = client.delete("/v1/delete/user1/finance_apple/")
+        assert res.status_code == 200
+
+        res = client.get("/v1/list/wrong-user/")
+        assert res.status_code == 401
@@ -0,0 +1,102 @@
+import pytest
+from moto import mock_aws
+import gzip
+import json
+
+from ..implementation import responseCompression
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestResponseEncoding:
+    @mock_aws
+    def test_gzip(self, rootdir, client, s3_mock, test_table):
+        plain = client.get("/v2/retrieve/user1/finance/apple/")
+        assert "Content-Encoding" not in plain.headers
+
+        res = client.get(
+            "/v2/retrieve/user1/finance/apple/", headers={"Accept-Encoding": "gzip"}
+        )
+        assert res.status_code == 200
+        assert res.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in res.headers["Vary"]
+        assert len(res.data) < len(plain.data)
+        assert (
+            json.loads(gzip.decompress(res.data))["events"]
+            == json.loads(plain.data)["events"]
+        )
+
+    @mock_aws
+    def test_brotli(self, rootdir, client, s3_mock, test_table):
+        brotli = pytest.importorskip("brotli")
+
+        res = client.get(
+            "/v2/retrieve/user1/finance/apple/",
+            headers={"Accept-Encoding": "gzip, br"},
+        )
+        assert res.headers["Content-Encoding"] == "br"
+        assert json.loads(brotli.decompress(res.data))["stock_name"] == "apple"
+
+    @mock_aws
+    def test_small_and_error_responses_are_not_compressed(
+        self, rootdir, client, s3_mock, test_table
+    ):
+        res = client.get("/v1/list/user1/", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in res.headers
+
+        res = client.get(
+            "/v2/retrieve/user1/finance/fakestock/",
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert res.status_code == 400
+        assert "Content-Encoding" not in res.headers
+
+    def test_supported_encodings(self, monkeypatch):
+        monkeypatch.setattr(responseCompression, "brotli", None)
+        assert responseCompression.supportedEncodings() == ["gzip"]
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestResponseFormats:
+    @mock_aws
+    def test_columnar(self, rootdir, client, s3_mock, test_table):
+        events = json.loads(client.get("/v2/retrieve/user1/finance/apple/").data)[
+            "events"
+        ]
+
+        res = client.get(
+            "/v2/retrieve/user1/finance/apple/",
+            headers={"Accept": "application/vnd.adage.columnar+json"},
+        )
+        assert res.status_code == 200
+        assert res.mimetype == "application/vnd.adage.columnar+json"
+
+        body = json.loads(res.data)
+        assert body["stock_name"] == "apple"
+        assert body["event_type"] == "stock-ohlc"
+        assert body["columns"]["time_stamp"] == [
+            e["time_object"]["time-stamp"] for e in events
+        ]
+        assert body["columns"]["close"] == [e["attribute"]["close"] for e in events]
+        assert len(res.data) < len(json.dumps({"events": events}))
+
+    @mock_aws
+    def test_ndjson(self, rootdir, client, s3_mock, test_table):
+        res = client.get("/v2/retrieve/user1/finance/apple/?format=ndjson&limit=5")
+        assert res.status_code == 200
+        assert res.mimetype == "application/x-ndjson"
+        assert res.headers["X-Next-Cursor"] == "5"
+
+        lines = res.data.decode("utf-8").splitlines()
+        assert json.loads(lines[0])["data_source"] == "yahoo_finance"
+        assert len(lines) == 6
+        assert json.loads(lines[1])["event-type"] == "stock-ohlc"
+
+    @mock_aws
+    def test_unknown_format(self, rootdir, client, s3_mock, test_table):
+        res = client.get("/v2/retrieve/user1/finance/apple/?format=xml")
+        assert res.status_code == 400
+        assert json.loads(res.data)["InvalidQueryParameter"] is not None
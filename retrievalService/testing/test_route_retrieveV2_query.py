@@ -0,0 +1,71 @@
+import pytest
+from moto import mock_aws
+import json
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestRetrieveV2Query:
+    @mock_aws
+    def test_date_range(self, rootdir, client, s3_mock, test_table):
+        res = client.get(
+            "/v2/retrieve/user1/finance/apple/?start=2025-03-10&end=2025-03-14"
+        )
+        assert res.status_code == 200
+
+        stamps = [
+            e["time_object"]["time-stamp"] for e in json.loads(res.data)["events"]
+        ]
+        assert stamps == [
+            "2025-03-10",
+            "2025-03-11",
+            "2025-03-12",
+            "2025-03-13",
+            "2025-03-14",
+        ]
+
+        # a month prefix covers the whole month
+        res = client.get("/v2/retrieve/user1/finance/apple/?start=2025-03&end=2025-03")
+        stamps = [
+            e["time_object"]["time-stamp"] for e in json.loads(res.data)["events"]
+        ]
+        assert stamps[0] == "2025-03-03"
+        assert stamps[-1] == "2025-03-18"
+
+    @mock_aws
+    def test_fields(self, rootdir, client, s3_mock, test_table):
+        res = client.get("/v2/retrieve/user1/finance/apple/?fields=close")
+        assert res.status_code == 200
+
+        events = json.loads(res.data)["events"]
+        assert all(list(e["attribute"]) == ["close"] for e in events)
+
+        # the stored dataset is unaffected
+        res = client.get("/v2/retrieve/user1/finance/apple/")
+        assert "stock_name" in json.loads(res.data)["events"][0]["attribute"]
+
+    @mock_aws
+    def test_pages(self, rootdir, client, s3_mock, test_table):
+        res = client.get("/v2/retrieve/user1/finance/apple/")
+        allEvents = json.loads(res.data)["events"]
+        assert "next_cursor" not in json.loads(res.data)
+
+        pages = []
+        url = "/v2/retrieve/user1/finance/apple/?limit=10"
+        while True:
+            body = json.loads(client.get(url).data)
+            pages.append(body["events"])
+            if "next_cursor" not in body:
+                break
+            url = f"/v2/retrieve/user1/finance/apple/?limit=10&cursor={body['next_cursor']}"
+
+        assert [len(p) for p in pages] == [10, 10, 1]
+        assert [e for p in pages for e in p] == allEvents
+
+    @mock_aws
+    def test_invalid_parameters(self, rootdir, client, s3_mock, test_table):
+        for query in ("limit=0", "limit=ten", "cursor=-1", "start=2025-03&end=2025-02"):
+            res = client.get(f"/v2/retrieve/user1/finance/apple/?{query}")
+            assert res.status_code == 400
+            assert json.loads(res.data)["InvalidQueryParameter"] is not None
@@ -0,0 +1,37 @@
+import pytest
+from moto import mock_aws
+import json
+
+
+@pytest.mark.filterwarnings(
+    r"ignore:datetime.datetime.utcnow\(\) is deprecated:DeprecationWarning"
+)
+class TestRetrieveSharedPrices:
+    @mock_aws
+    def test_retrieve_v2_follows_manifest(
+        self, rootdir, client, s3_shared_price_mock, test_table
+    ):
+        res = client.get("/v2/retrieve/user1/finance/honda/")
+
+        assert res.status_code == 200
+        data = json.loads(res.data)
+        assert data["stock_name"] == "honda"
+        assert len(data["events"]) > 0
+
+    @mock_aws
+    def test_retrieve_v1_follows_manifest(
+        self, rootdir, client, s3_shared_price_mock, test_table
+    ):
+        res = client.get("/v1/retrieve/user1/honda/")
+
+        assert res.status_code == 200
+        assert len(json.loads(res.data)["events"]) > 0
+
+    @mock_aws
+    def test_missing_manifest_and_csv(
+        self, rootdir, client, s3_shared_price_mock, test_table
+    ):
+        res = client.get("/v2/retrieve/user1/finance/toyota/")
+
+        assert res.status_code == 400
+        assert json.loads(res.data)["StockNotFound"] is not None